@@ -0,0 +1,123 @@
+# benchmarks/bench_database.py
+"""
+比較資料庫存取層改版前後的每秒操作數。
+'per-call connect' 重現舊版的寫法：每次呼叫都 sqlite3.connect、執行一條語句、commit 後關閉 (預設的 rollback journal)；
+'pooled (WAL)' 直接呼叫 modules.database 的函式 (執行緒專屬連線、WAL、synchronous=NORMAL、語句快取)。
+兩者各自使用暫存目錄中的新資料庫。
+
+用法 (於專案根目錄執行):
+    python -m benchmarks.bench_database --rows 2000
+"""
+
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+
+from tabulate import tabulate
+
+import modules.database as database
+
+def make_video(i: int) -> dict:
+    return {
+        'post_id': f"31{i:08d}",
+        'video_index': 1,
+        'post_url': f"https://www.threads.net/t/C{i:08d}",
+        'author': f"author{i % 97}",
+        'caption': f"benchmark caption {i}",
+        'video_url': f"https://scontent.cdninstagram.com/v/{i}.mp4",
+        'like_count': i % 5000,
+        'comment_count': i % 300,
+        'timestamp': 1700000000 + i,
+        'local_path': f"downloads/{i}.mp4",
+        'content_hash': f"{i:064x}",
+    }
+
+# --- 舊版寫法 (每次呼叫建立並關閉連線) ---
+
+def _legacy_connect():
+    conn = sqlite3.connect(database.DB_FILE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def legacy_add_video_entry(video_data):
+    conn = _legacy_connect()
+    conn.execute('''
+    INSERT INTO videos (
+        video_id, post_id, post_url, author, caption, video_url, like_count,
+        comment_count, timestamp, local_path, content_hash
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        f"{video_data['post_id']}-{video_data.get('video_index', 1)}", video_data['post_id'], video_data['post_url'],
+        video_data['author'], video_data['caption'], video_data['video_url'], video_data['like_count'],
+        video_data['comment_count'], datetime.fromtimestamp(video_data['timestamp']), video_data['local_path'],
+        video_data['content_hash']
+    ))
+    conn.commit()
+    conn.close()
+
+def legacy_add_liked_post(post_id):
+    conn = _legacy_connect()
+    conn.execute("INSERT OR IGNORE INTO liked_posts (post_id, like_timestamp) VALUES (?, ?)", (post_id, datetime.now()))
+    conn.commit()
+    conn.close()
+
+def legacy_get_uploaded_duplicate(content_hash):
+    conn = _legacy_connect()
+    row = conn.execute("SELECT video_id, youtube_title FROM videos WHERE content_hash = ? AND uploaded_to_youtube = 1 LIMIT 1", (content_hash,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+IMPLEMENTATIONS = {
+    'per-call connect': (legacy_add_video_entry, legacy_add_liked_post, legacy_get_uploaded_duplicate),
+    'pooled (WAL)': (database.add_video_entry, database.add_liked_post, database.get_uploaded_duplicate),
+}
+
+def run(name: str, rows: int, lookups: int) -> list:
+    add_video_entry, add_liked_post, get_uploaded_duplicate = IMPLEMENTATIONS[name]
+    database.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="bench_db_"), "threads_dlp.db")
+    database.init_db()
+    if name == 'per-call connect':
+        # 讓舊版寫法回到預設的 rollback journal
+        database.close_db_connection()
+        with sqlite3.connect(database.DB_FILE) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+
+    videos = [make_video(i) for i in range(rows)]
+    hashes = [random.choice(videos)['content_hash'] for _ in range(lookups)]
+
+    timings = []
+    started = time.perf_counter()
+    for video in videos:
+        add_video_entry(video)
+    timings.append(('add_video_entry', rows, time.perf_counter() - started))
+
+    started = time.perf_counter()
+    for video in videos:
+        add_liked_post(video['post_id'])
+    timings.append(('add_liked_post', rows, time.perf_counter() - started))
+
+    started = time.perf_counter()
+    for content_hash in hashes:
+        get_uploaded_duplicate(content_hash)
+    timings.append(('lookup by content_hash', lookups, time.perf_counter() - started))
+
+    database.close_db_connection()
+    return [[name, op, count, f"{elapsed:.3f}", f"{count / elapsed:,.0f}"] for op, count, elapsed in timings]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call SQLite connections against the pooled WAL access layer.")
+    parser.add_argument("--rows", type=int, default=2000, help="Number of inserts per operation.")
+    parser.add_argument("--lookups", type=int, default=20000, help="Number of indexed lookups.")
+    args = parser.parse_args()
+
+    rows = []
+    for name in IMPLEMENTATIONS:
+        rows.extend(run(name, args.rows, args.lookups))
+    print(tabulate(rows, headers=["implementation", "operation", "count", "seconds", "ops/sec"], tablefmt="psql"))
+
+if __name__ == "__main__":
+    main()
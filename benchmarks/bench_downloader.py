@@ -0,0 +1,145 @@
+# benchmarks/bench_downloader.py
+"""
+比較進程內串流下載與 yt-dlp 子進程的每支影片額外開銷。
+本機 HTTP 伺服器提供隨機內容的 mp4 檔 (支援 Range)，分別以兩種方式下載並比對內容；
+'native (resume)' 會讓伺服器在第一次傳輸到一半時中斷連線，驗證 .part 續傳。
+
+用法 (於專案根目錄執行):
+    python -m benchmarks.bench_downloader --videos 10 --size-mb 2
+    python -m benchmarks.bench_downloader --ytdlp-cmd "python -m yt_dlp"
+"""
+
+import os
+import re
+import time
+import shlex
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tabulate import tabulate
+
+from modules.downloader import YTDLP_COMMAND, stream_to_file, _download_with_ytdlp
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # 中斷測試會讓 keep-alive 連線被重設，不需要印出 traceback
+        pass
+
+def make_handler(files: dict[str, bytes], interrupted: set):
+    class MediaHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            data = files.get(path)
+            if data is None:
+                self.send_error(404)
+                return
+            start = 0
+            match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header('Content-Range', f"bytes */{len(data)}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', f"bytes {start}-{len(data) - 1}/{len(data)}")
+            else:
+                self.send_response(200)
+            body = data[start:]
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+
+            if path in interrupted:
+                # 只送出一半就斷線，模擬傳輸中斷
+                interrupted.discard(path)
+                self.wfile.write(body[:len(body) // 2])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+    return MediaHandler
+
+def run_native(urls, output_dir, resume: bool = False) -> int:
+    done = 0
+    for i, url in enumerate(urls):
+        path = os.path.join(output_dir, f"{i}.mp4")
+        try:
+            stream_to_file(url, path)
+        except Exception:
+            if not resume:
+                raise
+            # 第一次嘗試中斷後，第二次呼叫從 .part 續傳
+            stream_to_file(url, path)
+        done += 1
+    return done
+
+def run_ytdlp(urls, output_dir, command) -> int:
+    for i, url in enumerate(urls):
+        _download_with_ytdlp(url, os.path.join(output_dir, f"{i}.mp4"), command)
+    return len(urls)
+
+def verify(output_dir, files: dict[str, bytes]) -> bool:
+    expected = sorted(hashlib.sha256(data).hexdigest() for data in files.values())
+    actual = []
+    for name in os.listdir(output_dir):
+        with open(os.path.join(output_dir, name), 'rb') as f:
+            actual.append(hashlib.sha256(f.read()).hexdigest())
+    return sorted(actual) == expected
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the native streaming downloader against yt-dlp subprocesses.")
+    parser.add_argument("--videos", type=int, default=10, help="Number of videos to download per engine.")
+    parser.add_argument("--size-mb", type=float, default=2.0, help="Size of each video in MB.")
+    parser.add_argument("--ytdlp-cmd", type=str, default=' '.join(YTDLP_COMMAND), help="Command used for the subprocess path.")
+    args = parser.parse_args()
+
+    files = {f"/v/{i}.mp4": os.urandom(int(args.size_mb * 1024 * 1024)) for i in range(args.videos)}
+    interrupted = set()
+    server = QuietServer(('127.0.0.1', 0), make_handler(files, interrupted))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_address[1]}{path}" for path in files]
+
+    command = shlex.split(args.ytdlp_cmd)
+    engines = [
+        ('native', lambda out: run_native(urls, out)),
+        ('native (resume)', lambda out: (interrupted.update(files), run_native(urls, out, resume=True))[1]),
+    ]
+    if shutil.which(command[0]):
+        engines.append((f"subprocess ({args.ytdlp_cmd})", lambda out: run_ytdlp(urls, out, command)))
+    else:
+        print(f"'{command[0]}' not found, skipping the subprocess path (use --ytdlp-cmd to override).")
+
+    rows = []
+    try:
+        for name, run in engines:
+            output_dir = tempfile.mkdtemp(prefix="bench_dl_")
+            try:
+                started = time.perf_counter()
+                count = run(output_dir)
+                elapsed = time.perf_counter() - started
+                total_mb = args.size_mb * count
+                rows.append([name, count, f"{elapsed:.2f}", f"{elapsed / count * 1000:.0f}", f"{total_mb / elapsed:.1f}", verify(output_dir, files)])
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+    finally:
+        server.shutdown()
+
+    print(tabulate(rows, headers=["engine", "videos", "seconds", "ms/video", "MB/s", "verified"], tablefmt="psql"))
+
+if __name__ == "__main__":
+    main()
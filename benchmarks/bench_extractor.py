@@ -0,0 +1,100 @@
+# benchmarks/bench_extractor.py
+"""
+比較 GraphQL 回應解析路徑的峰值記憶體與吞吐量。
+
+用法 (於專案根目錄執行):
+    python -m benchmarks.bench_extractor --input captures.jsonl
+    python -m benchmarks.bench_extractor --pages 20 --posts 2000
+"""
+
+import json
+import time
+import argparse
+import tracemalloc
+
+import zstandard
+from tabulate import tabulate
+
+from modules.graphql import safe_get, iter_post_records
+from modules.replay import iter_captured_responses
+from modules.extractor import iter_records_from_body
+
+def legacy_path(body: bytes, content_encoding: str):
+    """scrape_videos 原本的作法：每個請求新建解壓器、整包解壓、decode 再 json.loads。"""
+    dctx = zstandard.ZstdDecompressor()
+    data = json.loads(dctx.decompress(body).decode('utf-8'))
+    edges = safe_get(data, ('data', 'feedData', 'edges')) or safe_get(data, ('data', 'search_results', 'edges'))
+    return iter_post_records(edges or [])
+
+PATHS = {
+    'legacy (json.loads)': legacy_path,
+    'buffered': lambda body, enc: iter_records_from_body(body, enc, mode='buffered'),
+    'stream': lambda body, enc: iter_records_from_body(body, enc, mode='stream'),
+}
+
+def synthetic_payloads(pages: int, posts_per_page: int):
+    """產生結構與 Threads feed 回應相同的 zstd 壓縮 payload。"""
+    cctx = zstandard.ZstdCompressor()
+    payloads = []
+    for page in range(pages):
+        edges = []
+        for i in range(posts_per_page):
+            pk = page * posts_per_page + i
+            post = {
+                'pk': str(pk),
+                'code': f"C{pk:08d}",
+                'user': {'username': f"user{pk % 97}", 'profile_pic_url': 'https://example.invalid/p.jpg', 'is_verified': False},
+                'caption': {'text': "benchmark caption 測試內文 " * 8},
+                'like_count': (pk * 37) % 20000,
+                'taken_at': 1700000000 + pk,
+                'text_post_app_info': {'direct_reply_count': pk % 300, 'share_info': {'quote_count': 0}},
+                'image_versions2': {'candidates': [{'url': f"https://example.invalid/{pk}_{w}.jpg", 'width': w, 'height': w} for w in (1080, 720, 480, 320, 240)]},
+            }
+            if pk % 3 == 0:
+                post['video_versions'] = [{'url': f"https://example.invalid/{pk}_{q}.mp4", 'type': q} for q in (101, 102, 103)]
+            edges.append({'node': {'text_post_app_thread': {'thread_items': [{'post': post}]}}})
+        body = json.dumps({'data': {'feedData': {'edges': edges}}}).encode('utf-8')
+        payloads.append(('synthetic', 'zstd', cctx.compress(body)))
+    return payloads
+
+def run_path(func, payloads) -> int:
+    count = 0
+    for _, content_encoding, body in payloads:
+        for _ in func(body, content_encoding):
+            count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GraphQL payload extraction paths.")
+    parser.add_argument("--input", type=str, default=None, help="Captured responses (directory, .har or .jsonl) to benchmark.")
+    parser.add_argument("--pages", type=int, default=10, help="Number of synthetic pages when --input is not given.")
+    parser.add_argument("--posts", type=int, default=2000, help="Posts per synthetic page.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per path (best run is reported).")
+    args = parser.parse_args()
+
+    if args.input:
+        payloads = [(url, enc, body) for url, enc, body in iter_captured_responses(args.input)]
+    else:
+        payloads = synthetic_payloads(args.pages, args.posts)
+    compressed = sum(len(body) for _, _, body in payloads)
+    print(f"{len(payloads)} payloads, {compressed / 1024**2:.1f} MB compressed")
+
+    rows = []
+    for name, func in PATHS.items():
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            posts = run_path(func, payloads)
+            best = min(best, time.perf_counter() - started)
+
+        tracemalloc.start()
+        run_path(func, payloads)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows.append([name, posts, f"{best:.3f}", f"{posts / best:,.0f}", f"{peak / 1024**2:.1f}"])
+
+    print(tabulate(rows, headers=["path", "posts", "seconds", "posts/sec", "peak MB"], tablefmt="psql"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/bench_feed_client.py
+"""
+在本機 stub 伺服器上端到端執行 HTTP 分頁引擎 (modules.feed_client)。
+stub 會依序回放已錄製的 GraphQL 回應 (zstd 原樣送出)，並改寫 page_info 讓客戶端依 cursor 翻頁，
+用來驗證權杖取得、cursor 分頁、zstd 解析與篩選結果，並量測每頁的耗時。
+
+用法 (於專案根目錄執行):
+    python -m benchmarks.bench_feed_client --input captures.jsonl
+    python -m benchmarks.bench_feed_client --pages 20 --posts 50 --latency 0.05
+"""
+
+import json
+import time
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import zstandard
+from tabulate import tabulate
+
+from modules.graphql import PostFilter, ZSTD_MAGIC
+from modules.extractor import load_body
+from modules.replay import iter_captured_responses
+from modules.feed_client import ThreadsFeedClient
+from benchmarks.bench_extractor import synthetic_payloads
+
+HOME_HTML = '<html><head><title>Threads</title></head><body><script>{"csrf_token":"stubcsrf"} ["LSD",[],{"token":"stublsd"}]</script></body></html>'
+PROFILE_HTML = '<html><head><title>@stub</title></head><body><script>{"user_id":"1234567890"}</script></body></html>'
+
+def paginated_payloads(payloads):
+    """將錄製的回應改寫為一條 cursor 鏈：第 i 頁的 end_cursor 為 str(i + 1)，最後一頁 has_next_page 為 false。"""
+    cctx = zstandard.ZstdCompressor()
+    pages = []
+    for i, (_, content_encoding, body) in enumerate(payloads):
+        data = load_body(body, content_encoding)
+        for root in data.get('data', {}).values():
+            if isinstance(root, dict) and 'edges' in root:
+                root['page_info'] = {'end_cursor': str(i + 1), 'has_next_page': i + 1 < len(payloads)}
+        pages.append(cctx.compress(json.dumps(data).encode('utf-8')))
+    return pages
+
+def make_handler(pages: list[bytes], latency: float, stats: dict):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str, content_encoding: str | None = None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            if content_encoding:
+                self.send_header('Content-Encoding', content_encoding)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            html = PROFILE_HTML if self.path.startswith('/@') else HOME_HTML
+            self._send(200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = parse_qs(self.rfile.read(length).decode('utf-8'))
+            stats['connections'].add(self.client_address)
+            if self.path.startswith('/api/graphql'):
+                self._send(200, b'{"data":{}}', 'application/json')
+                return
+            if form.get('lsd', [''])[0] != 'stublsd' or self.headers.get('x-fb-lsd') != 'stublsd':
+                self._send(403, b'{"errors":["bad lsd"]}', 'application/json')
+                return
+            variables = json.loads(form.get('variables', ['{}'])[0])
+            index = int(variables.get('after') or 0)
+            if latency:
+                time.sleep(latency)
+            stats['queries'] += 1
+            stats['requests'].append((form.get('doc_id', [''])[0], variables.get('after')))
+            body = pages[index]
+            # 非 zstd 的頁面 (例如模擬登入頁的 HTML) 不標示 Content-Encoding
+            self._send(200, body, 'application/json', 'zstd' if body[:4] == ZSTD_MAGIC else None)
+
+    return StubHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the HTTP feed client against a local stub server.")
+    parser.add_argument("--input", type=str, default=None, help="Captured responses (directory, .har or .jsonl) to serve.")
+    parser.add_argument("--pages", type=int, default=10, help="Number of synthetic pages when --input is not given.")
+    parser.add_argument("--posts", type=int, default=50, help="Posts per synthetic page.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated server latency per GraphQL query (seconds).")
+    parser.add_argument("--download-above", type=int, default=1000, help="Download threshold for the filter.")
+    args = parser.parse_args()
+
+    if args.input:
+        payloads = list(iter_captured_responses(args.input))
+    else:
+        payloads = synthetic_payloads(args.pages, args.posts)
+    pages = paginated_payloads(payloads)
+
+    stats = {'queries': 0, 'connections': set(), 'requests': []}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(pages, args.latency, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    doc_ids = {'feed': 'stub-feed', 'profile': 'stub-profile', 'search': 'stub-search'}
+    rows = []
+    try:
+        for label, target, query in (('feed', None, None), ('profile', 'stub', None), ('search', None, 'stub')):
+            post_filter = PostFilter(like_threshold=-1, download_threshold=args.download_above, liked_post_ids=set())
+            stats['queries'] = 0
+            stats['connections'] = set()
+            started = time.perf_counter()
+            with ThreadsFeedClient('stub-session', doc_ids=doc_ids, base_url=base_url) as client:
+                for records in client.iter_target_pages(target, query):
+                    post_filter.process_records(records)
+                compressed = client.bytes
+            elapsed = time.perf_counter() - started
+            rows.append([label, stats['queries'], len(stats['connections']), post_filter.posts_seen,
+                         len(post_filter.scraped_videos), f"{compressed / 1024:.0f}", f"{elapsed:.3f}",
+                         f"{elapsed / max(stats['queries'], 1) * 1000:.1f}"])
+    finally:
+        server.shutdown()
+
+    print(f"{len(pages)} recorded pages served from {base_url}")
+    print(tabulate(rows, headers=["query", "pages", "connections", "posts", "videos", "KB", "seconds", "ms/page"], tablefmt="psql"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_membership.py
+"""
+比較兩種「是否已下載 / 已按讚」的判斷方式在歷史資料成長時的啟動成本與查詢速度：
+'load sets' 為舊版做法 (get_all_existing_video_ids / get_all_liked_post_ids 把整張表載入 set)；
+'membership' 為 modules.membership.DBMembership (主鍵查詢 + 批次 IN / 暫存表 + LRU 快取)。
+以 tracemalloc 量測 Python 端的記憶體峰值。
+
+用法 (於專案根目錄執行):
+    python -m benchmarks.bench_membership --rows 100000 1000000 --candidates 5000
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+from tabulate import tabulate
+
+import modules.database as database
+from modules.membership import existing_video_ids, liked_post_ids
+
+def populate(rows: int):
+    database.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="bench_membership_"), "threads_dlp.db")
+    database.init_db()
+    now = datetime.now()
+    with database.transaction() as conn:
+        conn.executemany("INSERT INTO videos (video_id, post_id, timestamp) VALUES (?, ?, ?)",
+                         ((f"{i}-1", str(i), now) for i in range(rows)))
+        conn.executemany("INSERT INTO liked_posts (post_id, like_timestamp) VALUES (?, ?)",
+                         ((str(i), now) for i in range(0, rows, 3)))
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def run(rows: int, candidates: int) -> list:
+    populate(rows)
+    # 候選約一半是已存在的舊影片，一半是新影片
+    video_keys = [f"{random.randrange(rows * 2)}-1" for _ in range(candidates)]
+    post_keys = [str(random.randrange(rows * 2)) for _ in range(candidates)]
+
+    results = []
+    (videos, likes), startup, peak = measure(lambda: (database.get_all_existing_video_ids(), database.get_all_liked_post_ids()))
+    _, check, _ = measure(lambda: (sum(key in videos for key in video_keys), sum(key in likes for key in post_keys)))
+    results.append(['load sets', rows, f"{startup * 1000:.1f}", f"{peak / 1024**2:.1f}", f"{check * 1000:.1f}"])
+    del videos, likes
+
+    (videos, likes), startup, peak = measure(lambda: (existing_video_ids(), liked_post_ids()))
+    def check_batches():
+        videos.prefetch(video_keys)
+        likes.prefetch(post_keys)
+        return sum(key in videos for key in video_keys), sum(key in likes for key in post_keys)
+    _, check, check_peak = measure(check_batches)
+    results.append(['membership', rows, f"{startup * 1000:.1f}", f"{max(peak, check_peak) / 1024**2:.1f}", f"{check * 1000:.1f}"])
+
+    database.close_db_connection()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading ID sets at startup against DB-backed membership checks.")
+    parser.add_argument("--rows", type=int, nargs='+', default=[10000, 100000, 1000000], help="History sizes (rows in videos) to test.")
+    parser.add_argument("--candidates", type=int, default=5000, help="Candidate IDs checked per table.")
+    args = parser.parse_args()
+
+    rows = []
+    for count in args.rows:
+        rows.extend(run(count, args.candidates))
+    print(tabulate(rows, headers=["implementation", "history rows", "startup ms", "peak MB", f"check {args.candidates}x2 ms"], tablefmt="psql"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_upload_pipeline.py
+"""
+離線比較上傳任務的依序處理與元數據預先生成管線。
+以假的 Gemini client (固定延遲後返回元數據 JSON) 與假的 youtubeuploader 執行檔 (固定時間後成功結束)
+執行 uploader.run_upload_task：'sequential' 關閉預先生成 (GEMINI_METADATA_LOOKAHEAD=0)，等同舊版的
+生成 → 上傳 → 下一部；'pipelined' 以執行緒池領先上傳通道生成元數據。
+overlap 為元數據生成時間中與上傳同時進行的比例。
+
+用法 (於專案根目錄執行):
+    python -m benchmarks.bench_upload_pipeline --videos 8 --gemini-latency 0.6 --upload-seconds 0.8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+from tabulate import tabulate
+
+import uploader
+import modules.database as database
+
+FAKE_UPLOADER = """#!{python}
+import os, sys, time
+started = time.time()
+time.sleep(float(os.environ["FAKE_UPLOAD_SECONDS"]))
+with open(os.environ["FAKE_UPLOAD_LOG"], "a") as f:
+    f.write(f"{{started}} {{time.time()}}\\n")
+"""
+
+class FakeModel:
+    """模擬 GenerativeModel.generate_content：固定延遲後返回元數據，並記錄每次呼叫的時間區間。"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.intervals = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, safety_settings=None):
+        started = time.time()
+        time.sleep(self.latency)
+        with self._lock:
+            self.intervals.append((started, time.time()))
+        text = json.dumps({'title': 'Benchmark title', 'description': 'Benchmark description #bench', 'tags': ['bench']})
+        return type('FakeResponse', (), {'text': text})()
+
+def overlap_ratio(generate_intervals: list, upload_intervals: list) -> float:
+    total = sum(end - start for start, end in generate_intervals)
+    overlapped = sum(max(0.0, min(g_end, u_end) - max(g_start, u_start))
+                     for g_start, g_end in generate_intervals for u_start, u_end in upload_intervals)
+    return overlapped / total if total else 0.0
+
+def setup_workspace(videos: int, upload_seconds: float) -> str:
+    workspace = tempfile.mkdtemp(prefix="bench_upload_")
+    os.makedirs(os.path.join(workspace, "downloads"))
+    for name in ("client_secrets.json", "request.token"):
+        with open(os.path.join(workspace, name), "w") as f:
+            f.write("{}")
+    fake_uploader = os.path.join(workspace, "fake_uploader")
+    with open(fake_uploader, "w") as f:
+        f.write(FAKE_UPLOADER.format(python=sys.executable))
+    os.chmod(fake_uploader, 0o755)
+
+    database.DB_FILE = os.path.join(workspace, "threads_dlp.db")
+    database.init_db()
+    entries = []
+    for i in range(videos):
+        local_path = os.path.join(workspace, "downloads", f"bench_{i}.mp4")
+        with open(local_path, "wb") as f:
+            f.write(os.urandom(1024))
+        entries.append({'post_id': str(i), 'post_url': '', 'author': 'bench', 'caption': f"benchmark caption {i}",
+                        'video_url': '', 'like_count': 0, 'comment_count': 0, 'timestamp': datetime.now().timestamp(),
+                        'local_path': local_path})
+    database.add_video_entries(entries)
+
+    os.environ.update({
+        'YOUTUBE_UPLOADER_PATH': fake_uploader,
+        'GEMINI_API_KEY': 'offline-benchmark',
+        'UPLOAD_INTERVAL_SECONDS': '0',
+        'FAKE_UPLOAD_SECONDS': str(upload_seconds),
+        'FAKE_UPLOAD_LOG': os.path.join(workspace, "uploads.log"),
+    })
+    return workspace
+
+def run(name: str, args) -> list:
+    workspace = setup_workspace(args.videos, args.upload_seconds)
+    os.environ['GEMINI_METADATA_WORKERS'] = str(args.workers)
+    os.environ['GEMINI_METADATA_LOOKAHEAD'] = '0' if name == 'sequential' else ''
+
+    model = FakeModel(args.gemini_latency)
+    uploader.create_metadata_model = lambda config: model
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        started = time.perf_counter()
+        uploader.run_upload_task(cleanup_threshold_gb=1000)
+        elapsed = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+
+    with open(os.environ['FAKE_UPLOAD_LOG']) as f:
+        uploads = [tuple(map(float, line.split())) for line in f if line.strip()]
+    uploaded = database.get_db_connection().execute("SELECT COUNT(*) FROM videos WHERE uploaded_to_youtube = 1").fetchone()[0]
+    database.close_db_connection()
+    return [name, args.workers if name != 'sequential' else 1, uploaded, f"{elapsed:.2f}",
+            f"{uploaded / elapsed * 60:.1f}", f"{overlap_ratio(model.intervals, uploads) * 100:.0f}%"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential metadata generation against the prefetching upload pipeline, offline.")
+    parser.add_argument("--videos", type=int, default=8, help="Number of videos to upload.")
+    parser.add_argument("--gemini-latency", type=float, default=0.6, help="Seconds the fake Gemini client takes per video.")
+    parser.add_argument("--upload-seconds", type=float, default=0.8, help="Seconds the fake uploader binary takes per video.")
+    parser.add_argument("--workers", type=int, default=3, help="Metadata threads for the pipelined run.")
+    args = parser.parse_args()
+
+    rows = [run(name, args) for name in ('sequential', 'pipelined')]
+    print(tabulate(rows, headers=["implementation", "metadata threads", "uploaded", "seconds", "videos/min", "overlap"], tablefmt="psql"))
+
+if __name__ == "__main__":
+    main()
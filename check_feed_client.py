@@ -0,0 +1,109 @@
+# check_feed_client.py
+"""
+以本機 stub 伺服器檢查 HTTP 分頁引擎 (modules.feed_client.fetch_videos)，任何一項不符就以非零狀態結束:
+首頁動態、使用者個人頁與搜尋三種查詢都必須以設定的 doc_id 送出，並依 page_info 的 cursor 依序翻完全部頁面；
+篩選出的影片必須與 replay 對同一批回應離線重跑的結果相同。
+某一頁是登入頁的 HTML 或被截斷的 zstd 時，必須停止翻頁並返回之前各頁的影片，而不是拋出例外。
+
+stub 伺服器與 cursor 鏈沿用 benchmarks.bench_feed_client；資料庫與稽核紀錄寫在暫存目錄中。
+
+用法 (於專案根目錄執行):
+    python check_feed_client.py
+    python check_feed_client.py --input captures.jsonl
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+
+from tabulate import tabulate
+
+import modules.database as database
+from modules.feed_client import fetch_videos
+from modules.replay import append_capture, iter_captured_responses, replay_videos
+from benchmarks.bench_extractor import synthetic_payloads
+from benchmarks.bench_feed_client import paginated_payloads, make_handler
+
+DOC_IDS = {'feed': 'check-feed', 'profile': 'check-profile', 'search': 'check-search'}
+# 各查詢類型對應的 (target_username, search_query)
+TARGETS = {'feed': (None, None), 'profile': ('stub', None), 'search': (None, 'stub')}
+DOWNLOAD_THRESHOLD = 1000
+LOGIN_WALL = b'<html><head><title>Log in | Threads</title></head><body></body></html>'
+
+def replay_pages(pages: list[bytes], directory: str, name: str) -> list[dict]:
+    """把要送出的頁面寫成捕獲檔，以 replay 離線重跑同一個篩選管線。"""
+    path = os.path.join(directory, f"{name}.jsonl")
+    for page in pages:
+        append_capture(path, 'stub', 'zstd', page)
+    videos, _ = replay_videos(path, like_threshold=-1, download_threshold=DOWNLOAD_THRESHOLD, liked_post_ids=set())
+    return videos
+
+def check_case(name: str, kind: str, pages: list[bytes], expected_videos: list[dict], expected_queries: int) -> list:
+    stats = {'queries': 0, 'connections': set(), 'requests': []}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(pages, 0.0, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    target_username, search_query = TARGETS[kind]
+    try:
+        videos = fetch_videos(target_username, search_query, page_count=len(pages) + 1, like_threshold=-1,
+                              download_threshold=DOWNLOAD_THRESHOLD, liked_post_ids=set(), doc_ids=DOC_IDS,
+                              base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    except Exception as e:
+        return [name, stats['queries'], '-', "FAIL", f"fetch_videos 拋出例外: {e!r}"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    problems = []
+    doc_ids = sorted({doc_id for doc_id, _ in stats['requests']})
+    if doc_ids != [DOC_IDS[kind]]:
+        problems.append(f"doc_id 為 {doc_ids}，應為 {DOC_IDS[kind]}")
+    cursors = [after for _, after in stats['requests']]
+    expected_cursors = [None] + [str(i) for i in range(1, expected_queries)]
+    if cursors != expected_cursors:
+        problems.append(f"cursor 順序為 {cursors}，應為 {expected_cursors}")
+    if videos != expected_videos:
+        problems.append(f"影片與 replay 的結果不同: {len(videos)} 部 / replay {len(expected_videos)} 部")
+    return [name, stats['queries'], len(videos), "ok" if not problems else "FAIL", "\n".join(problems)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the HTTP feed client against a local stub server.")
+    parser.add_argument("--input", type=str, default=None, help="Captured responses (directory, .har or .jsonl) to serve.")
+    parser.add_argument("--pages", type=int, default=5, help="Number of synthetic pages when --input is not given.")
+    parser.add_argument("--posts", type=int, default=30, help="Posts per synthetic page.")
+    args = parser.parse_args()
+
+    payloads = list(iter_captured_responses(args.input)) if args.input else synthetic_payloads(args.pages, args.posts)
+    pages = paginated_payloads(payloads)
+    if len(pages) < 2:
+        sys.exit("至少需要 2 頁回應才能檢查 cursor 分頁。")
+
+    directory = tempfile.mkdtemp(prefix="check_feed_client_")
+    os.environ["THREADS_SESSION_COOKIE"] = "stub-session"
+    os.environ["AUDIT_LOG_PATH"] = os.path.join(directory, "audit.jsonl")
+    database.DB_FILE = os.path.join(directory, "threads_dlp.db")
+    database.init_db()
+
+    all_videos = replay_pages(pages, directory, "all")
+    # 中途壞掉的一頁：之前各頁的影片必須保留
+    broken_at = len(pages) // 2
+    partial_videos = replay_pages(pages[:broken_at], directory, "partial")
+    truncated = pages[:broken_at] + [pages[broken_at][:len(pages[broken_at]) // 2]] + pages[broken_at + 1:]
+    login_wall = pages[:broken_at] + [LOGIN_WALL] + pages[broken_at + 1:]
+
+    rows = [check_case(kind, kind, pages, all_videos, len(pages)) for kind in TARGETS]
+    rows.append(check_case(f"zstd 截斷 (第 {broken_at + 1} 頁)", 'feed', truncated, partial_videos, broken_at + 1))
+    rows.append(check_case(f"登入頁 HTML (第 {broken_at + 1} 頁)", 'feed', login_wall, partial_videos, broken_at + 1))
+    database.close_db_connection()
+
+    print(tabulate(rows, headers=["case", "queries", "videos", "status", "problems"], tablefmt="psql"))
+    failures = sum(row[3] != "ok" for row in rows)
+    if failures:
+        print(f"\n{failures} 項檢查失敗。")
+        sys.exit(1)
+    print(f"\n全部 {len(rows)} 項檢查通過 ({len(pages)} 頁、replay 篩選出 {len(all_videos)} 部影片)。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# check_migrations.py
+"""
+以固定的舊版資料庫作為測試夾具，檢查 database.init_db 的遷移：
+每個夾具執行 init_db 後，PRAGMA user_version 必須等於 SCHEMA_VERSION、
+資料表 / 索引 / 觸發器的結構必須與全新建立的資料庫相同，原有的資料列必須完整保留，
+再次執行 init_db 不得改變任何東西。任何一項不符就以非零狀態結束。
+
+夾具:
+    v1            `downloaded_at` 欄位的最早期結構
+    unversioned   user_version 為 0、但已是遷移機制之前最新結構的資料庫 (缺少 content_hash 等後來的表格)
+    v<N-1>        已套用到倒數第二項遷移的資料庫，檢查只套用最新的一項
+
+用法 (於專案根目錄執行):
+    python check_migrations.py
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+
+from tabulate import tabulate
+
+import modules.database as database
+
+V1_LAYOUT = '''
+CREATE TABLE videos (
+    video_id TEXT PRIMARY KEY,
+    post_id TEXT,
+    author TEXT,
+    caption TEXT,
+    video_url TEXT,
+    like_count INTEGER,
+    comment_count INTEGER,
+    downloaded_at DATETIME,
+    local_path TEXT
+);
+'''
+
+UNVERSIONED_LAYOUT = '''
+CREATE TABLE videos (
+    video_id TEXT PRIMARY KEY,
+    post_id TEXT,
+    post_url TEXT NOT NULL DEFAULT '',
+    author TEXT,
+    caption TEXT,
+    video_url TEXT,
+    like_count INTEGER,
+    comment_count INTEGER,
+    timestamp DATETIME,
+    local_path TEXT,
+    uploaded_to_youtube BOOLEAN DEFAULT FALSE,
+    upload_timestamp DATETIME,
+    youtube_title TEXT
+);
+CREATE TABLE liked_posts (
+    post_id TEXT PRIMARY KEY,
+    like_timestamp DATETIME
+);
+'''
+
+V1_ROWS = [
+    ('100-1', '100', 'alice', '台北夜市 street food', 'https://cdn/100.mp4', 1200, 30, '2023-05-01 10:00:00', 'downloads/alice_100.mp4'),
+    ('101-1', '101', 'bob', None, 'https://cdn/101.mp4', 0, None, '2023-05-02 11:30:00', None),
+]
+UNVERSIONED_ROWS = [
+    ('200-1', '200', 'https://www.threads.net/@carol/post/200', 'carol', 'ねこ cats', 'https://cdn/200.mp4', 5000, 12,
+     '2024-01-03 09:00:00', 'downloads/carol_200.mp4', 1, '2024-01-04 08:00:00', 'Cats!'),
+    ('200-2', '200', 'https://www.threads.net/@carol/post/200', 'carol', 'ねこ cats', 'https://cdn/200-2.mp4', 5000, 12,
+     '2024-01-03 09:00:00', 'downloads/carol_200-part2.mp4', 0, None, None),
+]
+LIKED_ROWS = [('200', '2024-01-03 09:05:00')]
+
+def use_database(path: str):
+    database.close_db_connection()
+    database.DB_FILE = path
+    return database.get_db_connection()
+
+def schema_signature(conn) -> dict:
+    """資料表以 PRAGMA table_info 比較 (ALTER TABLE 新增的欄位與 CREATE TABLE 的原文不同)，索引與觸發器以 SQL 比較。"""
+    signature = {}
+    for row in conn.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY type, name"):
+        if row['type'] == 'table':
+            signature[('table', row['name'])] = [tuple(info) for info in conn.execute(f"PRAGMA table_info('{row['name']}')")]
+        else:
+            signature[(row['type'], row['name'])] = " ".join((row['sql'] or '').split())
+    return signature
+
+def build_v1(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    conn.executescript(V1_LAYOUT)
+    conn.executemany("INSERT INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", V1_ROWS)
+    conn.commit()
+    conn.close()
+    columns = "video_id, post_id, author, caption, video_url, like_count, comment_count, timestamp, local_path"
+    return {f"SELECT {columns} FROM videos ORDER BY video_id": V1_ROWS}
+
+def build_unversioned(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    conn.executescript(UNVERSIONED_LAYOUT)
+    conn.executemany(f"INSERT INTO videos VALUES ({', '.join('?' * 13)})", UNVERSIONED_ROWS)
+    conn.executemany("INSERT INTO liked_posts VALUES (?, ?)", LIKED_ROWS)
+    conn.commit()
+    conn.close()
+    columns = ("video_id, post_id, post_url, author, caption, video_url, like_count, comment_count, timestamp, "
+               "local_path, uploaded_to_youtube, upload_timestamp, youtube_title")
+    return {
+        f"SELECT {columns} FROM videos ORDER BY video_id": UNVERSIONED_ROWS,
+        "SELECT post_id, like_timestamp FROM liked_posts ORDER BY post_id": LIKED_ROWS,
+    }
+
+def build_previous_version(path: str) -> dict:
+    """以 MIGRATIONS 的前 N-1 項建立資料庫並寫入資料 (模擬上一個發佈版本建立的資料庫)。"""
+    conn = use_database(path)
+    for version, _, migrate in database.MIGRATIONS[:-1]:
+        with conn:
+            migrate(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+    with conn:
+        conn.executemany(f"INSERT INTO videos (video_id, post_id, post_url, author, caption, video_url, like_count, comment_count, "
+                         f"timestamp, local_path, uploaded_to_youtube, upload_timestamp, youtube_title) VALUES ({', '.join('?' * 13)})",
+                         UNVERSIONED_ROWS)
+    database.close_db_connection()
+    return {"SELECT video_id, caption, uploaded_to_youtube FROM videos ORDER BY video_id": [(row[0], row[4], row[10]) for row in UNVERSIONED_ROWS]}
+
+def check_fixture(name: str, build, directory: str, reference: dict) -> list:
+    path = os.path.join(directory, f"{name}.db")
+    expected_rows = build(path)
+    problems = []
+
+    use_database(path)
+    database.init_db()
+    conn = database.get_db_connection()
+    version = database.get_schema_version()
+    if version != database.SCHEMA_VERSION:
+        problems.append(f"user_version = {version}，應為 {database.SCHEMA_VERSION}")
+
+    signature = schema_signature(conn)
+    for key in sorted(set(reference) | set(signature)):
+        if reference.get(key) != signature.get(key):
+            problems.append(f"結構不同: {key[0]} {key[1]}")
+
+    for sql, rows in expected_rows.items():
+        actual = [tuple(row) for row in conn.execute(sql)]
+        if actual != [tuple(row) for row in rows]:
+            problems.append(f"資料列不同: {sql}\n  預期 {rows}\n  實際 {actual}")
+
+    # 版本已是最新時 init_db 不得再改動任何東西
+    database.init_db()
+    if schema_signature(conn) != signature:
+        problems.append("再次執行 init_db 改變了資料庫結構")
+
+    return [name, version, "ok" if not problems else "FAIL", "\n".join(problems)]
+
+def main():
+    directory = tempfile.mkdtemp(prefix="check_migrations_")
+    use_database(os.path.join(directory, "fresh.db"))
+    database.init_db()
+    reference = schema_signature(database.get_db_connection())
+
+    previous = f"v{database.MIGRATIONS[-2][0]}" if len(database.MIGRATIONS) > 1 else None
+    fixtures = [("v1", build_v1), ("unversioned", build_unversioned)]
+    if previous:
+        fixtures.append((previous, build_previous_version))
+    rows = [check_fixture(name, build, directory, reference) for name, build in fixtures]
+    database.close_db_connection()
+
+    print(tabulate(rows, headers=["fixture", "user_version", "status", "problems"], tablefmt="psql"))
+    failures = sum(row[2] != "ok" for row in rows)
+    if failures:
+        print(f"\n{failures} 個夾具的遷移結果不正確。")
+        sys.exit(1)
+    print(f"\n全部 {len(rows)} 個夾具都已遷移到版本 {database.SCHEMA_VERSION}。")
+
+if __name__ == "__main__":
+    main()
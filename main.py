@@ -10,9 +10,14 @@ from collections import defaultdict
 from urllib.parse import quote
 import sys
 
-from modules.downloader import download_video
 from modules.scraper import scrape_videos
-from modules.database import init_db, get_all_existing_video_ids, add_video_entry, get_all_liked_post_ids
+from modules.replay import replay_videos
+from modules.pacing import PACING_MODES
+from modules.feed_client import ENGINES, fetch_videos
+from modules.multi_target import parse_targets, run_targets, merge_candidates
+from modules.download_pipeline import DownloadPipeline, DEFAULT_DOWNLOAD_WORKERS, DEFAULT_PER_HOST_LIMIT
+from modules.database import DB_FILE, init_db, get_download_backlog
+from modules.membership import existing_video_ids as existing_video_membership, liked_post_ids as liked_post_membership
 
 __version__ = "1.0.3"
 
@@ -35,6 +40,23 @@ def sanitize_filename(filename: str) -> str:
     sanitized = re.sub(r'\s+', ' ', sanitized).strip()
     return sanitized[:180] # 限制檔名長度以避免系統問題
 
+def build_video_path(output_dir: str, video_data: dict, total_in_post: int = 1) -> str:
+    """
+    依作者、內容與讚數組出影片檔名，並附上貼文 ID：轉發等作者、內容與讚數都相同的不同貼文不會共用同一個檔案
+    (否則並行的下載會續傳到彼此的 .part，或把對方的檔案當成已下載)。同一則貼文有多部影片時加上 -partN。
+    """
+    author = video_data.get('author', 'unknown')[:20]
+    caption_part = video_data.get('caption', '')[:10]
+    likes = video_data.get('like_count', 0)
+    base_filename = f"{author} - {caption_part} - [{likes}]likes [{video_data.get('post_id', '')}]"
+    safe_base_filename = sanitize_filename(base_filename)
+
+    if total_in_post > 1:
+        final_filename = f"{safe_base_filename}-part{video_data.get('video_index', 1)}.mp4"
+    else:
+        final_filename = f"{safe_base_filename}.mp4"
+    return os.path.join(output_dir, final_filename)
+
 def load_config() -> dict:
     """載入設定檔，並為新功能提供預設值。"""
     try:
@@ -59,11 +81,28 @@ def run_download_task(
     do_upload: bool = False,
     cleanup_threshold: float = 0.8,
     num_videos_to_upload: int = None,
-    language: str = 'zh-TW'
+    language: str = 'zh-TW',
+    capture_path: str = None,
+    pacing: str = 'fixed',
+    browser_pool=None,
+    engine: str = 'browser',
+    targets: list = None,
+    max_workers: int = None,
+    lean: bool = False,
+    download_workers: int = None,
+    budget_mb: float = None,
+    budget_seconds: float = None
 ):
     """
     核心下載任務邏輯。
     此函式被設計為可由外部腳本匯入和呼叫。
+    傳入 browser_pool (modules.browser.BrowserPool) 時，從池中借用已登入的瀏覽器，而不是每次重新啟動 Chrome 並登入。
+    engine 為 'browser' (Selenium 滾動頁面) 或 'http' (直接以 cursor 分頁呼叫 GraphQL，不啟動瀏覽器)。
+    targets 為多目標清單 (例如 ["nasa", "search:cute cats"])；未指定單一目標時依序取用
+    targets 參數、環境變數 THREADS_TARGETS 與 config.json 的 targets，並以 max_workers 個工作進程平行爬取。
+    lean 為 True 時瀏覽器以精簡模式運行 (封鎖圖片、影片片段、字型與分析請求)。
+    影片在爬取期間即由 download_workers 個下載執行緒平行下載，每個檔案完成後立即寫入資料庫。
+    budget_mb / budget_seconds 為本次運行的下載預算，影片依讚數、留言數與新舊排序，預算用盡後剩餘的影片留待下次運行。
     """
     lang_strings = load_language_strings(language)
 
@@ -77,10 +116,26 @@ def run_download_task(
     like_threshold = like_threshold_override if like_threshold_override is not None else config['like_threshold']
     download_threshold = download_threshold_override if download_threshold_override is not None else config['download_threshold']
 
+    if not (target_username or search_query):
+        targets = parse_targets(targets or os.getenv("THREADS_TARGETS") or config.get('targets'))
+    else:
+        targets = []
+    if max_workers is None:
+        max_workers = int(os.getenv("THREADS_MAX_WORKERS") or config.get('max_workers', 2))
+    if download_workers is None:
+        download_workers = int(os.getenv("THREADS_DOWNLOAD_WORKERS") or config.get('download_workers', DEFAULT_DOWNLOAD_WORKERS))
+    if budget_mb is None and (os.getenv("THREADS_DOWNLOAD_BUDGET_MB") or config.get('download_budget_mb')):
+        budget_mb = float(os.getenv("THREADS_DOWNLOAD_BUDGET_MB") or config.get('download_budget_mb'))
+    if budget_seconds is None and (os.getenv("THREADS_DOWNLOAD_BUDGET_SECONDS") or config.get('download_budget_seconds')):
+        budget_seconds = float(os.getenv("THREADS_DOWNLOAD_BUDGET_SECONDS") or config.get('download_budget_seconds'))
+
     # --- 啟動時顯示所有重要參數 ---
     logging.info(lang_strings.get('task_start', "==================== 任務啟動 ===================="))
     logging.info( f"→→→ Version: {__version__} ←←←")
-    if search_query:
+    if targets:
+        logging.info(lang_strings.get('mode_multi', " [模式] 多目標: {targets} (工作進程: {workers})").format(targets=', '.join(t['label'] for t in targets), workers=max_workers))
+        target_url = None
+    elif search_query:
         logging.info(lang_strings.get('mode_search', " [模式] 搜尋關鍵字: \"{query}\"").format(query=search_query))
         target_url = f"https://www.threads.net/search?q={quote(search_query)}"
     elif target_username:
@@ -93,7 +148,16 @@ def run_download_task(
     logging.info(lang_strings.get('like_threshold', " [設定] 按讚門檻: {threshold}").format(threshold=like_threshold if like_threshold != -1 else lang_strings.get('like_disabled', '停用')))
     logging.info(lang_strings.get('download_threshold', " [設定] 下載門檻: {threshold}").format(threshold=download_threshold))
     logging.info(lang_strings.get('scroll_depth', " [設定] 爬取深度 (滾動次數): {count}").format(count=scroll_count))
+    logging.info(lang_strings.get('engine_mode', " [設定] 爬取引擎: {engine}").format(engine=engine))
+    if engine == 'browser':
+        logging.info(lang_strings.get('pacing_mode', " [設定] 滾動節奏: {mode}").format(mode=pacing))
+        logging.info(lang_strings.get('lean_mode', " [設定] 精簡瀏覽模式: {status}").format(status=lang_strings.get('yes', '是') if lean else lang_strings.get('no', '否')))
     logging.info(lang_strings.get('output_dir', " [設定] 影片輸出目錄: {dir}").format(dir=output_dir))
+    logging.info(lang_strings.get('download_workers', " [設定] 下載執行緒: {workers}").format(workers=download_workers))
+    if budget_mb is not None or budget_seconds is not None:
+        logging.info(lang_strings.get('download_budget', " [設定] 下載預算: {mb} MB / {seconds} 秒").format(
+            mb=budget_mb if budget_mb is not None else lang_strings.get('unlimited', '無限制'),
+            seconds=budget_seconds if budget_seconds is not None else lang_strings.get('unlimited', '無限制')))
     logging.info(lang_strings.get('auto_upload', " [設定] 下載後自動上傳: {status}").format(status=lang_strings.get('yes', '是') if do_upload else lang_strings.get('no', '否')))
     if do_upload:
         logging.info(lang_strings.get('cleanup_threshold', "   [上傳設定] 清理閾值: {threshold} GB").format(threshold=cleanup_threshold))
@@ -101,82 +165,171 @@ def run_download_task(
     logging.info(lang_strings.get('task_end', "=================================================="))
 
 
-    existing_video_ids = get_all_existing_video_ids()
-    liked_post_ids = get_all_liked_post_ids()
+    # 以主鍵查詢判斷是否已存在，不在啟動時把整張表載入記憶體
+    existing_video_ids = existing_video_membership()
+    liked_post_ids = liked_post_membership()
     logging.info(lang_strings.get('db_info', "[DB] 資料庫中已存在 {videos} 筆影片紀錄，{likes} 筆按讚紀錄。").format(videos=len(existing_video_ids), likes=len(liked_post_ids)))
     
     os.makedirs(output_dir, exist_ok=True)
     
-    try:
-        scraped_videos = scrape_videos(
-            url=target_url, 
+    # 多目標的工作進程在下載管線的執行緒啟動前完成，候選影片合併後才交給下載管線
+    results = None
+    if targets:
+        results = run_targets(targets, max_workers, dict(
             scroll_count=scroll_count,
             like_threshold=like_threshold,
             download_threshold=download_threshold,
             liked_post_ids=liked_post_ids,
             continuous=continuous_mode,
-            language=language
-        )
-    except ValueError as e:
-        logging.error(lang_strings.get('operation_aborted', "操作中止：{error}").format(error=e))
-        return
+            language=language,
+            capture_path=capture_path,
+            pacing=pacing,
+            lean=lean,
+            engine=engine,
+            doc_ids=config.get('doc_ids'),
+            log_level=log_level
+        ))
 
-    if not scraped_videos:
-        logging.info(lang_strings.get('no_new_videos', "未抓取到任何符合下載條件的新影片。"))
-        return
+    # 下載管線：爬蟲每接受一則貼文就立即排入下載佇列，下載與滾動同時進行
+    pipeline = DownloadPipeline(
+        path_for=lambda video_data, total_in_post: build_video_path(output_dir, video_data, total_in_post),
+        existing_video_ids=existing_video_ids,
+        workers=download_workers,
+        per_host=int(os.getenv("THREADS_DOWNLOAD_PER_HOST") or config.get('download_per_host', DEFAULT_PER_HOST_LIMIT)),
+        lang_strings=lang_strings,
+        max_bytes=int(budget_mb * 1024**2) if budget_mb is not None else None,
+        max_seconds=budget_seconds
+    )
+    # 上次因預算不足而延後的影片與本次的新影片一起依優先度排序
+    backlog = get_download_backlog()
+    if backlog:
+        logging.info(lang_strings.get('backlog_loaded', "[Budget] 接續上次延後的 {count} 個影片。").format(count=len(backlog)))
+        pipeline.submit_backlog(backlog)
 
-    logging.info(lang_strings.get('scraping_complete', "篩選完成，共 {count} 個影片待下載").format(count=len(scraped_videos)))
-    videos_by_post = defaultdict(list)
-    for video in scraped_videos:
-        video_id = f"{video.get('post_id')}-{video.get('video_index', 1)}"
-        if video_id in existing_video_ids:
-            continue
-        videos_by_post[video['post_id']].append(video)
-
-    new_videos_downloaded = 0
-    for post_id, videos in videos_by_post.items():
-        total_videos_in_post = len(videos)
-        
-        for video_data in videos:
-            video_index = video_data.get('video_index', 1)
-            video_id = f"{post_id}-{video_index}"
-
-            safe_caption = str(video_data['caption']).encode('utf-8', 'ignore').decode('utf-8')
-            logging.info(lang_strings.get('processing_video', "正在處理影片 ID: {video_id}, 作者: {author}, 內容: {caption}...").format(video_id=video_id, author=video_data['author'], caption=safe_caption[:50]))
-            
-            author = video_data.get('author', 'unknown')[:20]
-            caption_part = video_data.get('caption', '')[:10]
-            likes = video_data.get('like_count', 0)
-            base_filename = f"{author} - {caption_part} - [{likes}]likes"
-            safe_base_filename = sanitize_filename(base_filename)
-
-            if total_videos_in_post > 1:
-                final_filename = f"{safe_base_filename}-part{video_index}.mp4"
-            else:
-                final_filename = f"{safe_base_filename}.mp4"
-            
-            full_path = os.path.join(output_dir, final_filename)
-
-            success = download_video(video_data['video_url'], full_path)
-            
-            if success:
-                video_data['local_path'] = full_path
-                try:
-                    add_video_entry(video_data)
-                    new_videos_downloaded += 1
-                except Exception as e:
-                    logging.critical(lang_strings.get('db_write_failed', "寫入資料庫失敗: {error}，中止執行。").format(error=e))
-                    # 事務性操作：如果資料庫寫入失敗，則刪除已下載的檔案
-                    logging.warning(f"由於資料庫寫入失敗，正在刪除已下載的檔案: {full_path}")
-                    try:
-                        os.remove(full_path)
-                    except OSError as remove_error:
-                        logging.error(f"刪除檔案 {full_path} 失敗: {remove_error}")
-                    return # 中止執行以避免進一步錯誤
+    scrape_kwargs = dict(
+        url=target_url, 
+        scroll_count=scroll_count,
+        like_threshold=like_threshold,
+        download_threshold=download_threshold,
+        liked_post_ids=liked_post_ids,
+        continuous=continuous_mode,
+        language=language,
+        capture_path=capture_path,
+        pacing=pacing,
+        lean=lean,
+        on_videos=pipeline.submit
+    )
+    with pipeline:
+        try:
+            if results is not None:
+                # 集中合併並對資料庫去除重複，同一則貼文出現在多個目標時只下載一次
+                scraped_videos = merge_candidates(results, existing_video_ids)
+                # 工作進程的候選影片在合併後才交給下載管線，仍依貼文分組以保留 -partN 檔名
+                videos_by_post = defaultdict(list)
+                for video in scraped_videos:
+                    videos_by_post[video['post_id']].append(video)
+                for videos in videos_by_post.values():
+                    pipeline.submit(videos)
+            elif engine == 'http':
+                scraped_videos = fetch_videos(
+                    target_username=target_username,
+                    search_query=search_query,
+                    page_count=scroll_count,
+                    like_threshold=like_threshold,
+                    download_threshold=download_threshold,
+                    liked_post_ids=liked_post_ids,
+                    continuous=continuous_mode,
+                    language=language,
+                    capture_path=capture_path,
+                    doc_ids=config.get('doc_ids'),
+                    on_videos=pipeline.submit
+                )
+            elif browser_pool is not None:
+                with browser_pool.session() as session:
+                    scraped_videos = scrape_videos(driver=session.driver, like_tokens=session.tokens, **scrape_kwargs)
             else:
-                logging.error(lang_strings.get('download_failed', "影片 {video_id} 下載失敗，跳過紀錄。").format(video_id=video_id))
+                scraped_videos = scrape_videos(**scrape_kwargs)
+        except ValueError as e:
+            logging.error(lang_strings.get('operation_aborted', "操作中止：{error}").format(error=e))
+            return
 
-    logging.info(lang_strings.get('total_downloaded', "本次共下載了 {count} 個新影片").format(count=new_videos_downloaded))
+        if results is not None:
+            report_targets(results, lang_strings)
+
+        if not scraped_videos:
+            logging.info(lang_strings.get('no_new_videos', "未抓取到任何符合下載條件的新影片。"))
+        else:
+            logging.info(lang_strings.get('scraping_complete', "篩選完成，共 {count} 個影片待下載").format(count=len(scraped_videos)))
+
+    stats = pipeline.stats()
+    if stats['submitted']:
+        logging.info(lang_strings.get('download_pipeline_summary', "[Download] 爬取結束後再等待 {drain:.1f} 秒完成剩餘下載 ({workers} 個下載執行緒)，失敗 {failed} 個。").format(**stats))
+    if stats['deferred'] or budget_mb is not None or budget_seconds is not None:
+        logging.info(lang_strings.get('budget_summary', "[Budget] 本次下載 {mb:.1f} MB，{deferred} 個影片因預算用盡延後至下次運行。").format(mb=stats['bytes_downloaded'] / 1024**2, **stats))
+    if stats['deduplicated']:
+        logging.info(lang_strings.get('dedup_summary', "[Store] {deduplicated} 個影片與既有內容重複，以硬連結或引用取代，節省 {mb:.1f} MB。").format(mb=stats['bytes_saved'] / 1024**2, **stats))
+    if stats['aborted'] is not None:
+        return # 資料庫寫入失敗，中止執行以避免進一步錯誤
+    logging.info(lang_strings.get('total_downloaded', "本次共下載了 {count} 個新影片").format(count=stats['downloaded']))
+
+def report_targets(results: list[dict], lang_strings: dict):
+    """多目標模式結束時，逐一列出每個目標的耗時與產出。"""
+    logging.info(lang_strings.get('multi_report_header', "--- 多目標爬取結果 ---"))
+    for result in results:
+        if result['error']:
+            logging.warning(lang_strings.get('multi_report_failed', " {target}: 失敗 ({elapsed:.1f} 秒) - {error}").format(target=result['label'], elapsed=result['elapsed'], error=result['error']))
+            continue
+        logging.info(lang_strings.get('multi_report_row', " {target}: {elapsed:.1f} 秒，{candidates} 個候選影片，{new} 個為新影片，{duplicates} 個重複").format(
+            target=result['label'],
+            elapsed=result['elapsed'],
+            candidates=result['candidates'],
+            new=result['new'],
+            duplicates=result['duplicates']
+        ))
+
+def run_replay_task(
+    replay_path: str,
+    like_threshold_override: int = None,
+    download_threshold_override: int = None,
+    log_level: int = logging.WARNING,
+    language: str = 'zh-TW'
+):
+    """
+    離線重播模式：對已捕獲的 GraphQL 回應重新執行篩選管線並回報耗時。
+    不啟動瀏覽器、不存取網路、也不下載或寫入資料庫。
+    """
+    lang_strings = load_language_strings(language)
+
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    config = load_config()
+
+    like_threshold = like_threshold_override if like_threshold_override is not None else config['like_threshold']
+    download_threshold = download_threshold_override if download_threshold_override is not None else config['download_threshold']
+
+    logging.info(lang_strings.get('replay_start', " [模式] 離線重播: {path}").format(path=replay_path))
+    if not os.path.exists(replay_path):
+        logging.error(lang_strings.get('replay_not_found', "找不到重播來源: {path}").format(path=replay_path))
+        return []
+
+    videos, stats = replay_videos(
+        replay_path,
+        like_threshold=like_threshold,
+        download_threshold=download_threshold,
+        liked_post_ids=liked_post_membership() if os.path.exists(DB_FILE) else set()
+    )
+
+    elapsed = stats['elapsed']
+    logging.info(lang_strings.get('replay_summary', "[Replay] {responses} 個回應 ({mb:.1f} MB)、{posts} 則貼文、{videos} 個影片符合條件，耗時 {elapsed:.3f} 秒 ({rate:.0f} 則貼文/秒)。").format(
+        responses=stats['responses'],
+        mb=stats['bytes'] / (1024**2),
+        posts=stats['posts'],
+        videos=stats['videos'],
+        elapsed=elapsed,
+        rate=stats['posts'] / elapsed if elapsed > 0 else 0
+    ))
+    if stats['errors']:
+        logging.warning(lang_strings.get('replay_errors', "[Replay] 有 {count} 個回應無法解析。").format(count=stats['errors']))
+    return videos
 
 def main():
     """主函式，負責處理命令列參數並呼叫核心下載任務。"""
@@ -185,6 +338,8 @@ def main():
     parser.add_argument("-l", "--language", type=str, default="zh-TW", choices=['zh-TW', 'en'], help="Set the language for log output.")
     parser.add_argument("-t", "--target", nargs='?', default=None, help="Target username (without @).")
     parser.add_argument("-s", "--search", type=str, help="Keyword to search for.")
+    parser.add_argument("--targets", nargs='+', default=None, help="Scrape several targets in parallel: usernames and/or 'search:<keyword>' entries.")
+    parser.add_argument("--workers", type=int, default=None, help="(Used with --targets) Maximum number of parallel worker processes, each with its own browser.")
     parser.add_argument("-r", "--scroll", type=int, default=3, help="Number of times to scroll down the page.")
     parser.add_argument("-o", "--output", type=str, default="downloads", help="Folder to save downloaded videos.")
     parser.add_argument("-u", "--upload", action='store_true', help="Automatically run uploader after download tasks.")
@@ -204,6 +359,14 @@ def main():
     parser.add_argument("-l^", "--like-above", type=int, default=None, help="Override config: like posts with >= N likes.")
     parser.add_argument("-d^", "--download-above", type=int, default=None, help="Override config: download posts with >= N likes.")
     parser.add_argument("-c", "--continuous", action='store_true', help="Continuous scrolling mode until at least 5 matching videos are found.")
+    parser.add_argument("--pacing", type=str, default="fixed", choices=PACING_MODES, help="Scroll pacing: 'fixed' sleeps a constant delay, 'adaptive' waits for network activity and stops early when scrolling stops yielding new posts.")
+    parser.add_argument("--engine", type=str, default="browser", choices=ENGINES, help="Scraping engine: 'browser' scrolls a headless Chrome, 'http' paginates the GraphQL API directly without a browser (requires doc_ids in config.json or THREADS_DOC_ID_* env vars).")
+    parser.add_argument("--download-workers", type=int, default=None, help="Number of download threads that fetch videos while scraping is still running (default 4, or THREADS_DOWNLOAD_WORKERS).")
+    parser.add_argument("--budget-mb", type=float, default=None, help="Download budget in MB for this run; the highest-value videos (likes, comments, recency) go first and the rest are deferred to the next run.")
+    parser.add_argument("--budget-seconds", type=float, default=None, help="Wall-clock download budget in seconds for this run; remaining videos are deferred to the next run.")
+    parser.add_argument("--lean", action='store_true', help="Lean browsing: block images, video segments, fonts and analytics inside the scraping browser and log bytes transferred.")
+    parser.add_argument("--capture", type=str, default=None, help="Append every captured GraphQL response to this JSONL archive for later --replay.")
+    parser.add_argument("--replay", type=str, default=None, help="Re-run filtering offline over captured responses (directory, .har or .jsonl) without launching a browser.")
 
     parser.add_argument("-d", "--debug", action='store_true', help="Enable detailed log output (INFO level).")
     parser.add_argument("-v", "--version", action='version', version=f'%(prog)s {__version__}', help="Show program version number.")
@@ -219,6 +382,16 @@ def main():
         logging.critical(lang_strings.get('upload_param_warning', "錯誤：參數 '-n' 或 '-du' 必須與 '-u' (自動上傳) 參數一起使用。請修正您的指令。"))
         sys.exit(1) # 直接退出程式
 
+    if args.replay:
+        run_replay_task(
+            replay_path=args.replay,
+            like_threshold_override=args.like_above,
+            download_threshold_override=args.download_above,
+            log_level=log_level,
+            language=args.language
+        )
+        return
+
     # 在執行任何任務前，先初始化資料庫
     init_db()
 
@@ -235,7 +408,16 @@ def main():
         do_upload=args.upload,
         cleanup_threshold=args.deleteupload,
         num_videos_to_upload=args.num_videos,
-        language=args.language
+        language=args.language,
+        capture_path=args.capture,
+        pacing=args.pacing,
+        engine=args.engine,
+        targets=args.targets,
+        max_workers=args.workers,
+        lean=args.lean,
+        download_workers=args.download_workers,
+        budget_mb=args.budget_mb,
+        budget_seconds=args.budget_seconds
     )
 
     if args.upload:
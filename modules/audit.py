@@ -0,0 +1,211 @@
+# modules/audit.py
+
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+import zstandard
+
+class AuditSink:
+    """
+    結構化的稽核紀錄器 (黑盒子紀錄器 V2)。
+    呼叫端只把事件放進佇列，由背景執行緒批次寫入 JSONL 檔案，
+    支援 zstd 壓縮 (每批一個獨立幀，可直接串接解壓) 與依大小/時間輪替，
+    並在程式結束時保證把佇列中剩餘的事件寫完。
+    """
+
+    def __init__(self, path: str = "scraped_posts_audit.jsonl", compress: bool = False,
+                 max_bytes: int = 50 * 1024 * 1024, rotate_seconds: float | None = None,
+                 backup_count: int = 5, batch_size: int = 256, flush_interval: float = 1.0,
+                 maxsize: int = 10000):
+        if compress and not path.endswith('.zst'):
+            path += '.zst'
+        self.path = path
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.pid = os.getpid()
+        self.dropped = 0
+        self.written = 0
+
+        self._cctx = zstandard.ZstdCompressor() if compress else None
+        # 目前檔案的建立時間 (時間輪替的起點)，第一次寫入時從既有檔案讀取
+        self._opened_at = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def emit(self, event: str, **fields):
+        """記錄一筆事件；佇列已滿時直接捨棄，不阻塞呼叫端的熱路徑。"""
+        if self._closed:
+            return
+        record = {'ts': round(time.time(), 3), 'event': event}
+        record.update(fields)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float | None = None):
+        """阻塞直到目前佇列中的事件全部寫入磁碟。"""
+        if not self._thread.is_alive():
+            return
+        if timeout is None:
+            self.queue.join()
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        """停止背景執行緒並寫完所有剩餘事件，可重複呼叫。"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.pid != os.getpid():
+            return
+        self.queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            logging.warning(f"[Audit] 稽核佇列曾滿載，共捨棄 {self.dropped} 筆事件。")
+
+    def _run(self):
+        batch = []
+        stop = False
+        while not stop:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+                # 盡量把已在佇列中的事件一起帶走，湊成一批
+                while len(batch) < self.batch_size:
+                    item = self.queue.get_nowait()
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logging.error(f"[Audit] 寫入稽核紀錄失敗: {e}")
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+            batch = []
+
+    def _write(self, batch: list[dict]):
+        self._maybe_rotate()
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch).encode('utf-8')
+        if self._cctx:
+            data = self._cctx.compress(data)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+        self.written += len(batch)
+
+    def _maybe_rotate(self):
+        if not os.path.exists(self.path):
+            self._opened_at = time.time()
+            return
+        if self._opened_at is None:
+            self._opened_at = self._file_started_at()
+        too_big = self.max_bytes and os.path.getsize(self.path) >= self.max_bytes
+        too_old = self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds
+        if not (too_big or too_old):
+            return
+
+        base, ext = self.path, ''
+        for suffix in ('.jsonl.zst', '.jsonl', '.zst'):
+            if self.path.endswith(suffix):
+                base, ext = self.path[:-len(suffix)], suffix
+                break
+        rotated = f"{base}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.path, rotated)
+        self._opened_at = time.time()
+
+        # 只保留最新的 backup_count 個輪替檔
+        directory = os.path.dirname(self.path) or '.'
+        prefix = os.path.basename(base) + '.'
+        backups = sorted(
+            name for name in os.listdir(directory)
+            if name.startswith(prefix) and name.endswith(ext) and os.path.join(directory, name) != self.path
+        )
+        for name in backups[:-self.backup_count] if self.backup_count else []:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                logging.warning(f"[Audit] 刪除舊的稽核檔 {name} 失敗: {e}")
+
+    def _file_started_at(self) -> float:
+        """
+        既有檔案第一筆事件的時間：重新啟動的進程 (例如排程器的每次運行) 接續寫入同一個檔案時，
+        時間輪替仍從檔案建立時算起，而不是從這次啟動算起。讀不到時退回檔案的修改時間。
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                stream = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True) if self.compress else f
+                first_line = stream.read(64 * 1024).split(b'\n', 1)[0]
+            return float(json.loads(first_line)['ts'])
+        except (OSError, ValueError, KeyError, TypeError, zstandard.ZstdError):
+            return os.path.getmtime(self.path)
+
+class NullAuditSink:
+    """停用稽核時使用的空實作。"""
+
+    def emit(self, event: str, **fields):
+        pass
+
+    def flush(self, timeout: float | None = None):
+        pass
+
+    def close(self):
+        pass
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_audit_sink() -> AuditSink:
+    """
+    返回全域共用的稽核紀錄器，首次呼叫時依環境變數建立:
+    AUDIT_LOG_PATH、AUDIT_LOG_COMPRESS、AUDIT_LOG_MAX_MB、AUDIT_LOG_ROTATE_HOURS。
+    fork 出的子進程沒有父進程的寫入執行緒，會建立自己的紀錄器。
+    """
+    global _sink
+    with _sink_lock:
+        if _sink is None or getattr(_sink, 'pid', os.getpid()) != os.getpid():
+            rotate_hours = float(os.getenv("AUDIT_LOG_ROTATE_HOURS", 0))
+            _sink = AuditSink(
+                path=os.getenv("AUDIT_LOG_PATH", "scraped_posts_audit.jsonl"),
+                compress=os.getenv("AUDIT_LOG_COMPRESS", "false").lower() in ['true', '1', 't'],
+                max_bytes=int(float(os.getenv("AUDIT_LOG_MAX_MB", 50)) * 1024 * 1024),
+                rotate_seconds=rotate_hours * 3600 if rotate_hours > 0 else None,
+            )
+        return _sink
+
+def set_audit_sink(sink):
+    """替換全域稽核紀錄器 (任何具備 emit/flush/close 方法的物件)；傳入 None 則停用稽核。"""
+    global _sink
+    with _sink_lock:
+        _sink = sink if sink is not None else NullAuditSink()
+
+def audit_event(event: str, **fields):
+    """透過全域稽核紀錄器記錄一筆事件。"""
+    get_audit_sink().emit(event, **fields)
@@ -0,0 +1,423 @@
+# modules/browser.py
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from seleniumwire import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.chrome.options import Options
+from webdriver_manager.chrome import ChromeDriverManager
+
+from modules.capture import SELENIUMWIRE_OPTIONS
+from modules.threads_client import get_like_tokens
+from modules.session_cache import SessionCache, get_session_cache
+
+THREADS_HOME = "https://www.threads.net/"
+USER_AGENT = "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# 精簡瀏覽模式下在瀏覽器內直接中止的請求 (CDP Network.setBlockedURLs 的萬用字元格式)。
+# 爬蟲只讀取 graphql/query 回應，影片之後會由 modules/downloader.py 另外下載
+LEAN_BLOCKED_URL_PATTERNS = [
+    # 媒體 CDN (圖片、影片片段)
+    "*scontent*.cdninstagram.com/*",
+    "*scontent*.fbcdn.net/*",
+    "*video*.fbcdn.net/*",
+    "*.mp4*",
+    "*.m4s*",
+    "*.m4v*",
+    "*.jpg*",
+    "*.jpeg*",
+    "*.png*",
+    "*.webp*",
+    "*.gif*",
+    "*.heic*",
+    # 網頁字型
+    "*.woff*",
+    "*.ttf*",
+    "*.otf*",
+    # 分析與紀錄端點
+    "*/ajax/bz*",
+    "*/ajax/logging*",
+    "*/logging_client_events*",
+    "*facebook.com/tr*",
+    "*google-analytics.com/*",
+    "*googletagmanager.com/*",
+]
+
+# 精簡瀏覽模式下不經過 selenium-wire 代理的主機 (靜態資源不需要被中間人解密)
+LEAN_EXCLUDE_HOSTS = ['*.cdninstagram.com', '*.fbcdn.net']
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+def _chromedriver_path() -> str:
+    """ChromeDriverManager().install() 每次都會檢查版本，同一個進程內只需執行一次。"""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+        return _driver_path
+
+def build_chrome_options(headless: bool = True, lean: bool = False, profile_dir: str | None = None) -> Options:
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument(USER_AGENT)
+    if profile_dir:
+        # 持久化的 Chrome 設定檔：Cookie 與登入狀態在下次啟動時仍然存在
+        chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+    # 開啟 performance log 以便 TrafficMeter 統計實際傳輸量
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    if lean:
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_argument("--autoplay-policy=user-gesture-required")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+        })
+    return chrome_options
+
+def apply_lean_mode(driver):
+    """透過 CDP 在瀏覽器內中止媒體、圖片、字型與分析請求；設定在之後的每次導航都持續有效。"""
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_URL_PATTERNS})
+
+def create_driver(headless: bool = True, lean: bool = False, profile_dir: str | None = None):
+    """啟動一個掛載 selenium-wire 代理的 Chrome；lean 為 True 時啟用精簡瀏覽模式，profile_dir 為持久化的 user-data 目錄。"""
+    service = ChromeService(_chromedriver_path())
+    seleniumwire_options = dict(SELENIUMWIRE_OPTIONS)
+    if lean:
+        seleniumwire_options['exclude_hosts'] = LEAN_EXCLUDE_HOSTS
+    driver = webdriver.Chrome(service=service, options=build_chrome_options(headless, lean, profile_dir), seleniumwire_options=seleniumwire_options)
+    if lean:
+        try:
+            apply_lean_mode(driver)
+        except Exception:
+            driver.quit()
+            raise
+    return driver
+
+class TrafficMeter:
+    """
+    以 Chrome performance log 中的 CDP Network 事件統計瀏覽器實際傳輸的位元組數 (含標頭，壓縮後大小)，
+    依資源類型分類，並計算被精簡模式封鎖的請求數，用來比較開啟精簡模式前後的流量。
+    """
+
+    def __init__(self):
+        self.bytes_by_type = defaultdict(int)
+        self.requests_by_type = defaultdict(int)
+        self.blocked = 0
+        self._types = {}
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.bytes_by_type.values())
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests_by_type.values())
+
+    def collect(self, driver):
+        """取出 (並清空) 目前累積的 performance log；應定期呼叫以免 chromedriver 端的緩衝無限增長。"""
+        try:
+            entries = driver.get_log('performance')
+        except Exception:
+            return
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            method = message.get('method')
+            params = message.get('params', {})
+            request_id = params.get('requestId')
+            if method == 'Network.requestWillBeSent':
+                self._types[request_id] = params.get('type') or 'Other'
+            elif method == 'Network.loadingFinished':
+                resource_type = self._types.pop(request_id, 'Other')
+                self.bytes_by_type[resource_type] += int(params.get('encodedDataLength') or 0)
+                self.requests_by_type[resource_type] += 1
+            elif method == 'Network.loadingFailed':
+                self._types.pop(request_id, None)
+                if params.get('blockedReason'):
+                    self.blocked += 1
+
+    def summary(self) -> dict:
+        breakdown = sorted(self.bytes_by_type.items(), key=lambda item: item[1], reverse=True)
+        return {
+            'mb': self.total_bytes / (1024**2),
+            'requests': self.total_requests,
+            'blocked': self.blocked,
+            'breakdown': ', '.join(f"{name} {size / 1024:.0f} KB" for name, size in breakdown),
+        }
+
+def is_logged_in(driver) -> bool:
+    """以頁面標題判斷目前是否為登入狀態。"""
+    page_title = driver.title.lower()
+    return not ('log in' in page_title or '登入' in page_title)
+
+def login(driver, session_cookie: str, lang_strings: dict | None = None):
+    """注入 sessionid Cookie 並驗證登入狀態；Cookie 無效時拋出 ValueError。"""
+    lang_strings = lang_strings or {}
+    logging.info(lang_strings.get('injecting_cookie', "正在注入 Cookie..."))
+    driver.get(THREADS_HOME)
+    driver.add_cookie({'name': 'sessionid', 'value': session_cookie})
+    driver.refresh()
+    time.sleep(5)
+
+    logging.info(lang_strings.get('validating_cookie', "正在驗證 Cookie 有效性..."))
+    if not is_logged_in(driver):
+        error_message = lang_strings.get('cookie_invalid', "Cookie 已失效或無效，請更新您的 .env 檔案中的 THREADS_SESSION_COOKIE。")
+        logging.critical(error_message)
+        raise ValueError(error_message)
+    logging.info(lang_strings.get('cookie_valid', "Cookie 驗證成功，帳號已登入。"))
+
+def bootstrap_session(driver, session_cookie: str, cache: SessionCache | None = None,
+                      lang_strings: dict | None = None) -> tuple[str | None, str | None]:
+    """
+    讓 driver 進入已登入狀態並返回 (csrf_token, lsd_token)。
+    有快取時先走快速路徑：持久化設定檔中的 Cookie 仍是目前的 Cookie 且頁面為登入狀態，
+    便直接沿用未過期的權杖 (只需比對 csrftoken Cookie)，省去注入 Cookie、重新整理與固定等待；
+    驗證失敗才退回完整的 login 流程，並把新權杖寫回快取。Cookie 無效時拋出 ValueError。
+    """
+    lang_strings = lang_strings or {}
+    started = time.monotonic()
+    if cache is not None:
+        try:
+            driver.get(THREADS_HOME)
+            stored_cookie = driver.get_cookie('sessionid')
+            if stored_cookie and stored_cookie.get('value') == session_cookie and is_logged_in(driver):
+                tokens = cache.load_tokens(session_cookie)
+                csrf_cookie = driver.get_cookie('csrftoken')
+                if tokens and (not csrf_cookie or csrf_cookie.get('value') == tokens[0]):
+                    logging.info(lang_strings.get('session_cache_hit', "[Session] 沿用快取的登入狀態與權杖 (耗時 {elapsed:.1f} 秒)。").format(elapsed=time.monotonic() - started))
+                    return tokens
+                # 登入狀態仍有效，只需從目前頁面重新提取權杖
+                csrf_token, lsd_token = get_like_tokens(driver.page_source)
+                if csrf_token and lsd_token:
+                    cache.save_tokens(session_cookie, csrf_token, lsd_token)
+                    logging.info(lang_strings.get('session_cache_refreshed', "[Session] 沿用快取的登入狀態，已更新權杖 (耗時 {elapsed:.1f} 秒)。").format(elapsed=time.monotonic() - started))
+                    return csrf_token, lsd_token
+        except Exception as e:
+            logging.warning(lang_strings.get('session_cache_failed', "[Session] 快取的登入狀態驗證失敗，改為完整登入: {error}").format(error=e))
+        cache.invalidate()
+
+    login(driver, session_cookie, lang_strings)
+    csrf_token, lsd_token = get_like_tokens(driver.page_source)
+    if cache is not None and csrf_token and lsd_token:
+        cache.save_tokens(session_cookie, csrf_token, lsd_token)
+    logging.info(lang_strings.get('session_bootstrapped', "[Session] 完整登入流程完成 (耗時 {elapsed:.1f} 秒)。").format(elapsed=time.monotonic() - started))
+    return csrf_token, lsd_token
+
+def _process_tree_rss_mb(pid: int) -> float:
+    """計算 chromedriver 及其所有子進程 (Chrome 各個 renderer) 的常駐記憶體總和 (MB)。"""
+    try:
+        import psutil
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+        return sum(p.memory_info().rss for p in processes if p.is_running()) / (1024**2)
+    except ImportError:
+        pass
+    except Exception:
+        return 0.0
+
+    # 沒有 psutil 時退回讀取 /proc (僅限 Linux)
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024
+
+class BrowserSession:
+    """池中的一個已登入瀏覽器，連同其按讚權杖與使用統計。"""
+
+    def __init__(self, driver, csrf_token: str | None, lsd_token: str | None, slot: int | None = None,
+                 cache: SessionCache | None = None):
+        self.driver = driver
+        self.slot = slot
+        # 持有設定檔鎖的快取，瀏覽器關閉時釋放
+        self.cache = cache
+        self.csrf_token = csrf_token
+        self.lsd_token = lsd_token
+        self.jobs = 0
+        self.created_at = time.time()
+
+    @property
+    def tokens(self) -> tuple[str | None, str | None]:
+        return self.csrf_token, self.lsd_token
+
+    def rss_mb(self) -> float:
+        try:
+            return _process_tree_rss_mb(self.driver.service.process.pid)
+        except Exception:
+            return 0.0
+
+    def reset(self):
+        """清空上一個任務留下的攔截器與捕獲紀錄，讓下一個目標從乾淨的狀態開始。"""
+        driver = self.driver
+        del driver.response_interceptor
+        del driver.request_interceptor
+        del driver.scopes
+        del driver.requests
+        driver.get("about:blank")
+        # 丟棄上一個任務未讀取的 performance log
+        driver.get_log('performance')
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.warning(f"[BrowserPool] 關閉瀏覽器時發生錯誤: {e}")
+        if self.cache is not None:
+            self.cache.release_profile()
+
+class BrowserPool:
+    """
+    跨任務保持溫熱的已登入瀏覽器池，供長時間運行的 scheduler worker 使用。
+    取出時做健康檢查 (頁面可回應且仍為登入狀態)，歸還時重置狀態；
+    瀏覽器在執行 max_jobs 個任務或記憶體超過 max_rss_mb 後會被回收並在下次需要時重建。
+    """
+
+    def __init__(self, size: int = 1, max_jobs: int = 20, max_rss_mb: float = 1500, headless: bool = True, lean: bool = False):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.headless = headless
+        self.lean = lean
+
+        self._idle = []
+        self._active = 0
+        # 每個同時存在的瀏覽器佔用一個 slot，對應各自的持久化設定檔
+        self._free_slots = list(range(size))
+        self._closed = False
+        self._condition = threading.Condition()
+        atexit.register(self.close)
+
+    def _create_session(self) -> BrowserSession:
+        load_dotenv()
+        session_cookie = os.getenv("THREADS_SESSION_COOKIE")
+        if not session_cookie:
+            raise ValueError("錯誤：請在 .env 檔案中設定 THREADS_SESSION_COOKIE。")
+
+        with self._condition:
+            slot = self._free_slots.pop(0)
+        logging.info("[BrowserPool] 正在啟動新的瀏覽器並登入...")
+        try:
+            cache = get_session_cache(slot=f"pool-{slot}")
+            profile_dir = cache.claim_profile() if cache else None
+            if profile_dir is None:
+                cache = None
+            try:
+                driver = create_driver(self.headless, self.lean, profile_dir)
+                try:
+                    csrf_token, lsd_token = bootstrap_session(driver, session_cookie, cache)
+                except Exception:
+                    driver.quit()
+                    raise
+            except Exception:
+                if cache is not None:
+                    cache.release_profile()
+                raise
+        except Exception:
+            self._release_slot(slot)
+            raise
+        return BrowserSession(driver, csrf_token, lsd_token, slot, cache)
+
+    def _release_slot(self, slot: int | None):
+        if slot is None:
+            return
+        with self._condition:
+            self._free_slots.append(slot)
+
+    def _is_healthy(self, session: BrowserSession) -> bool:
+        try:
+            session.driver.get(THREADS_HOME)
+            return is_logged_in(session.driver)
+        except Exception as e:
+            logging.warning(f"[BrowserPool] 瀏覽器健康檢查失敗: {e}")
+            return False
+
+    def acquire(self) -> BrowserSession:
+        """取出一個健康的已登入瀏覽器；池已滿載時阻塞等待。"""
+        with self._condition:
+            while not self._idle and self._active >= self.size:
+                self._condition.wait()
+            session = self._idle.pop() if self._idle else None
+            self._active += 1
+
+        try:
+            if session is not None and not self._is_healthy(session):
+                logging.info("[BrowserPool] 瀏覽器已失效，將重新建立。")
+                session.quit()
+                self._release_slot(session.slot)
+                session = None
+            if session is None:
+                session = self._create_session()
+            return session
+        except Exception:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, session: BrowserSession):
+        """歸還瀏覽器；達到回收條件時直接關閉，否則重置後放回池中。"""
+        session.jobs += 1
+        recycle = self._closed or session.jobs >= self.max_jobs
+        if not recycle and self.max_rss_mb:
+            rss = session.rss_mb()
+            if rss > self.max_rss_mb:
+                logging.info(f"[BrowserPool] 瀏覽器記憶體 {rss:.0f} MB 超過上限 {self.max_rss_mb} MB，進行回收。")
+                recycle = True
+        if not recycle:
+            try:
+                session.reset()
+            except Exception as e:
+                logging.warning(f"[BrowserPool] 重置瀏覽器失敗，進行回收: {e}")
+                recycle = True
+        if recycle:
+            session.quit()
+            self._release_slot(session.slot)
+
+        with self._condition:
+            self._active -= 1
+            if not recycle:
+                self._idle.append(session)
+            self._condition.notify()
+
+    @contextmanager
+    def session(self):
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def close(self):
+        """關閉池中所有閒置的瀏覽器。"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.quit()
@@ -0,0 +1,79 @@
+# modules/capture.py
+
+import time
+import queue
+import logging
+import threading
+
+from modules.extractor import iter_records_from_body
+from modules.replay import append_capture
+
+# selenium-wire 只會攔截並儲存符合此範圍的請求，其餘流量 (圖片、JS、影片) 直接放行且不保留
+GRAPHQL_SCOPE = r'.*graphql/query.*'
+
+# selenium-wire 的請求儲存設定：改用記憶體並限制上限，已解析的回應不需要長期保留
+SELENIUMWIRE_OPTIONS = {
+    'request_storage': 'memory',
+    'request_storage_max_size': 100,
+}
+
+class GraphQLResponseStream:
+    """
+    基於 selenium-wire response interceptor 的串流捕獲器。
+    GraphQL 回應一抵達就在代理執行緒中串流解碼與解析，精簡貼文紀錄被推入有界佇列，
+    由篩選階段在每次滾動後取用，避免在滾動批次結束時集中解壓所有數據包。
+    """
+
+    def __init__(self, maxsize: int = 256, put_timeout: float = 5.0, capture_path: str | None = None):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.put_timeout = put_timeout
+        self.capture_path = capture_path
+
+        self.responses = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_response_at = None
+
+        self._lock = threading.Lock()
+
+    def attach(self, driver):
+        """將攔截器掛到 driver 上，並把捕獲範圍縮小到 GraphQL 端點。"""
+        driver.scopes = [GRAPHQL_SCOPE]
+        driver.response_interceptor = self.intercept
+
+    def intercept(self, request, response):
+        """selenium-wire 的 response interceptor，在代理執行緒中執行。"""
+        if 'graphql/query' not in request.url or not response.body:
+            return
+
+        content_encoding = response.headers.get('Content-Encoding', '')
+        with self._lock:
+            self.responses += 1
+            self.last_response_at = time.monotonic()
+            if self.capture_path:
+                append_capture(self.capture_path, request.url, content_encoding, response.body)
+
+        try:
+            records = list(iter_records_from_body(response.body, content_encoding))
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logging.error(f"[Capture] 處理數據包時發生錯誤: {e}")
+            return
+
+        if not records:
+            return
+        try:
+            self.queue.put(records, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(records)
+            logging.warning(f"[Capture] 篩選佇列已滿，捨棄 {len(records)} 筆貼文。")
+
+    def drain(self):
+        """以非阻塞方式取出目前佇列中所有已解析的貼文紀錄批次。"""
+        while True:
+            try:
+                yield self.queue.get_nowait()
+            except queue.Empty:
+                return
@@ -0,0 +1,48 @@
+# modules/content_store.py
+
+import os
+import logging
+
+from modules.database import claim_content_hash, update_content_path
+
+def _link_to(canonical_path: str, full_path: str) -> bool:
+    """以指向 canonical_path 的硬連結原子地取代 full_path；檔案系統不支援時返回 False。"""
+    tmp_path = full_path + '.link'
+    try:
+        os.link(canonical_path, tmp_path)
+        os.replace(tmp_path, full_path)
+        return True
+    except OSError as e:
+        logging.debug(f"[Store] 無法建立硬連結 {full_path} -> {canonical_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+def store_file(full_path: str, content_hash: str, video_id: str) -> tuple[str, int]:
+    """
+    將剛下載完成的檔案登記到內容定址索引。
+    內容首次出現時 full_path 成為標準檔案；已有相同內容時以硬連結取代新檔，
+    無法建立硬連結 (例如跨裝置) 時刪除新檔並直接引用標準檔案。
+    返回 (該影片應記錄的 local_path, 節省的位元組數)。
+    """
+    size = os.path.getsize(full_path)
+    canonical_path = claim_content_hash(content_hash, full_path, size, video_id)
+    if canonical_path == full_path:
+        return full_path, 0
+
+    if not os.path.exists(canonical_path):
+        # 標準檔案已被清理，改由這次下載的檔案承接
+        update_content_path(content_hash, full_path)
+        return full_path, 0
+    if os.path.samefile(canonical_path, full_path):
+        return full_path, 0
+
+    if _link_to(canonical_path, full_path):
+        logging.info(f"[Store] {video_id} 與 {canonical_path} 內容相同，已改為硬連結 (節省 {size / 1024**2:.1f} MB)。")
+        return full_path, size
+
+    os.remove(full_path)
+    logging.info(f"[Store] {video_id} 與 {canonical_path} 內容相同，改為引用既有檔案 (節省 {size / 1024**2:.1f} MB)。")
+    return canonical_path, size
@@ -1,143 +1,400 @@
 # -*- coding: utf-8 -*-
+import os
+import json
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 DB_FILE = "db/threads_dlp.db"
 
-def get_db_connection():
-    """建立並返回一個資料庫連接，並設定為 row_factory 以便將結果作為字典存取。"""
-    conn = sqlite3.connect(DB_FILE)
+# WAL 讓 datasette、排程器與下載執行緒可以同時讀寫同一個檔案；在 WAL 下 synchronous=NORMAL 仍能保證資料庫一致
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+# fork 出的子進程 (例如多目標的工作進程) 不可使用或關閉從父進程繼承的連線，只保留參照
+_inherited_connections = []
+
+def _open_connection(db_file):
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
     return conn
 
-import logging
+def get_db_connection():
+    """
+    返回目前執行緒專用的資料庫連接 (首次使用時建立)，並設定為 row_factory 以便將結果作為字典存取。
+    連接在同一執行緒內重複使用，sqlite3 會快取已準備好的語句；呼叫端不應關閉它，
+    寫入時以 `with transaction():` 包住，發生例外時自動回滾，不會把未完成的交易留給下一次呼叫。
+    """
+    key = (os.getpid(), os.path.abspath(DB_FILE))
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.key != key:
+        if _local.key[0] != key[0]:
+            _inherited_connections.append(conn)
+        else:
+            conn.close()
+        conn = None
+    if conn is None:
+        conn = _open_connection(DB_FILE)
+        _local.conn, _local.key = conn, key
+    return conn
 
-def init_db():
+@contextmanager
+def transaction():
     """
-    初始化資料庫，建立或遷移 `videos` 和 `liked_posts` 資料表。
-    此函式包含一個健壯的遷移邏輯，可處理欄位重命名和新增。
+    工作單元：區塊內透過本模組函式 (或 yield 出的連接) 所做的寫入在結束時一起提交，發生例外時全部回滾。
+    巢狀使用時併入最外層的交易，因此可以把多個批次 API 組合成單一交易。
     """
     conn = get_db_connection()
-    cursor = conn.cursor()
-
+    depth = getattr(_local, 'tx_depth', 0)
+    _local.tx_depth = depth + 1
     try:
-        # 檢查 `videos` 資料表是否存在
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='videos'")
-        table_exists = cursor.fetchone()
-
-        if table_exists:
-            # 如果資料表存在，檢查是否為需要遷移的舊結構
-            cursor.execute("PRAGMA table_info(videos)")
-            columns = [row['name'] for row in cursor.fetchall()]
-
-            if 'downloaded_at' in columns:
-                # --- 執行一次性的黃金標準遷移 ---
-                logging.info("偵測到舊版資料庫結構 (v1)，正在執行一次性升級遷移...")
-                try:
-                    cursor.execute("BEGIN TRANSACTION")
-                    # 1. 重命名舊表
-                    cursor.execute("ALTER TABLE videos RENAME TO videos_old")
-                    
-                    # 2. 建立新表 (使用最終的正確結構)
-                    cursor.execute('''
-                    CREATE TABLE videos (
-                        video_id TEXT PRIMARY KEY,
-                        post_id TEXT,
-                        post_url TEXT NOT NULL DEFAULT '',
-                        author TEXT,
-                        caption TEXT,
-                        video_url TEXT,
-                        like_count INTEGER,
-                        comment_count INTEGER,
-                        timestamp DATETIME,
-                        local_path TEXT,
-                        uploaded_to_youtube BOOLEAN DEFAULT FALSE,
-                        upload_timestamp DATETIME,
-                        youtube_title TEXT
-                    )
-                    ''')
-
-                    # 3. 從舊表複製數據到新表，並正確映射欄位
-                    #    注意：我們只選擇新表中存在的欄位進行複製
-                    cursor.execute('''
-                    INSERT INTO videos (
-                        video_id, post_id, author, caption, video_url, like_count, 
-                        comment_count, timestamp, local_path
-                    )
-                    SELECT 
-                        video_id, post_id, author, caption, video_url, like_count, 
-                        comment_count, downloaded_at, local_path
-                    FROM videos_old
-                    ''')
-
-                    # 4. 刪除舊表
-                    cursor.execute("DROP TABLE videos_old")
-                    cursor.execute("COMMIT")
-                    logging.info("資料庫結構遷移成功！")
-                except Exception as e:
-                    cursor.execute("ROLLBACK")
-                    logging.critical(f"資料庫遷移失敗: {e}。請刪除 db/threads_dlp.db 檔案後重試。")
-                    raise e
-            else:
-                # 對於沒有 `downloaded_at` 但可能缺少其他欄位的較新版本，進行補充
-                all_columns = {
-                    'post_url': 'TEXT NOT NULL DEFAULT ""',
-                    'comment_count': 'INTEGER',
-                    'youtube_title': 'TEXT'
-                    # 其他欄位...
-                }
-                for col, col_type in all_columns.items():
-                    if col not in columns:
-                        logging.info(f"正在更新資料庫結構：新增 '{col}' 欄位...")
-                        try:
-                            cursor.execute(f"ALTER TABLE videos ADD COLUMN {col} {col_type}")
-                        except sqlite3.OperationalError as e:
-                            logging.error(f"新增欄位 '{col}' 失敗: {e}")
+        if depth:
+            yield conn
+        else:
+            with conn:
+                yield conn
+    finally:
+        _local.tx_depth = depth
 
+def close_db_connection():
+    """關閉目前執行緒的資料庫連接 (例如長時間運行的執行緒結束前)。"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        if _local.key[0] == os.getpid():
+            conn.close()
+        _local.conn = None
+
+import logging
+
+def _migrate_videos_layout(cursor):
+    """
+    建立或升級 `videos` 和 `liked_posts` 資料表。
+    未記錄版本的資料庫可能是 v1 (`downloaded_at`) 或任何較新的中間結構，因此這一步仍以
+    `PRAGMA table_info` 檢查欄位；之後的遷移只需執行固定的 DDL。
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='videos'")
+    table_exists = cursor.fetchone()
+
+    if table_exists:
+        # 如果資料表存在，檢查是否為需要遷移的舊結構
+        cursor.execute("PRAGMA table_info(videos)")
+        columns = [row['name'] for row in cursor.fetchall()]
+
+        if 'downloaded_at' in columns:
+            # --- 執行一次性的黃金標準遷移 (在 init_db 開啟的交易中進行) ---
+            logging.info("偵測到舊版資料庫結構 (v1)，正在執行一次性升級遷移...")
+            try:
+                # 1. 重命名舊表
+                cursor.execute("ALTER TABLE videos RENAME TO videos_old")
+
+                # 2. 建立新表 (使用最終的正確結構)
+                cursor.execute('''
+                CREATE TABLE videos (
+                    video_id TEXT PRIMARY KEY,
+                    post_id TEXT,
+                    post_url TEXT NOT NULL DEFAULT '',
+                    author TEXT,
+                    caption TEXT,
+                    video_url TEXT,
+                    like_count INTEGER,
+                    comment_count INTEGER,
+                    timestamp DATETIME,
+                    local_path TEXT,
+                    uploaded_to_youtube BOOLEAN DEFAULT FALSE,
+                    upload_timestamp DATETIME,
+                    youtube_title TEXT,
+                    content_hash TEXT
+                )
+                ''')
+
+                # 3. 從舊表複製數據到新表，並正確映射欄位
+                #    注意：我們只選擇新表中存在的欄位進行複製
+                cursor.execute('''
+                INSERT INTO videos (
+                    video_id, post_id, author, caption, video_url, like_count, 
+                    comment_count, timestamp, local_path
+                )
+                SELECT 
+                    video_id, post_id, author, caption, video_url, like_count, 
+                    comment_count, downloaded_at, local_path
+                FROM videos_old
+                ''')
+
+                # 4. 刪除舊表
+                cursor.execute("DROP TABLE videos_old")
+                logging.info("資料庫結構遷移成功！")
+            except Exception as e:
+                logging.critical(f"資料庫遷移失敗: {e}。請刪除 db/threads_dlp.db 檔案後重試。")
+                raise e
         else:
-            # 如果資料表不存在，直接建立最新的
-            cursor.execute('''
-            CREATE TABLE videos (
-                video_id TEXT PRIMARY KEY,
-                post_id TEXT,
-                post_url TEXT NOT NULL DEFAULT '',
-                author TEXT,
-                caption TEXT,
-                video_url TEXT,
-                like_count INTEGER,
-                comment_count INTEGER,
-                timestamp DATETIME,
-                local_path TEXT,
-                uploaded_to_youtube BOOLEAN DEFAULT FALSE,
-                upload_timestamp DATETIME,
-                youtube_title TEXT
-            )
-            ''')
-
-        # 確保 `liked_posts` 資料表存在
+            # 對於沒有 `downloaded_at` 但可能缺少其他欄位的較新版本，進行補充
+            all_columns = {
+                'post_url': 'TEXT NOT NULL DEFAULT ""',
+                'comment_count': 'INTEGER',
+                'youtube_title': 'TEXT',
+                'content_hash': 'TEXT'
+            }
+            for col, col_type in all_columns.items():
+                if col not in columns:
+                    logging.info(f"正在更新資料庫結構：新增 '{col}' 欄位...")
+                    try:
+                        cursor.execute(f"ALTER TABLE videos ADD COLUMN {col} {col_type}")
+                    except sqlite3.OperationalError as e:
+                        logging.error(f"新增欄位 '{col}' 失敗: {e}")
+
+    else:
+        # 如果資料表不存在，直接建立最新的
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS liked_posts (
-            post_id TEXT PRIMARY KEY,
-            like_timestamp DATETIME
+        CREATE TABLE videos (
+            video_id TEXT PRIMARY KEY,
+            post_id TEXT,
+            post_url TEXT NOT NULL DEFAULT '',
+            author TEXT,
+            caption TEXT,
+            video_url TEXT,
+            like_count INTEGER,
+            comment_count INTEGER,
+            timestamp DATETIME,
+            local_path TEXT,
+            uploaded_to_youtube BOOLEAN DEFAULT FALSE,
+            upload_timestamp DATETIME,
+            youtube_title TEXT,
+            content_hash TEXT
         )
         ''')
-        
-        conn.commit()
-    finally:
-        conn.close()
 
+    # 確保 `liked_posts` 資料表存在
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS liked_posts (
+        post_id TEXT PRIMARY KEY,
+        like_timestamp DATETIME
+    )
+    ''')
 
-def add_video_entry(video_data):
-    """新增一筆新的影片紀錄到資料庫中。"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _create_content_hashes(cursor):
+    # 內容定址索引：檔案內容的 SHA-256 → 保存該內容的標準檔案路徑
     cursor.execute('''
-    INSERT INTO videos (
-        video_id, post_id, post_url, author, caption, video_url, like_count, 
-        comment_count, timestamp, local_path
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    CREATE TABLE IF NOT EXISTS content_hashes (
+        content_hash TEXT PRIMARY KEY,
+        canonical_path TEXT NOT NULL,
+        size_bytes INTEGER,
+        first_video_id TEXT,
+        created_at DATETIME
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_content_hash ON videos (content_hash)")
+
+def _create_download_backlog(cursor):
+    # 因下載預算用盡而延後的影片，由下次運行依優先度接續下載
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS download_backlog (
+        video_id TEXT PRIMARY KEY,
+        post_id TEXT,
+        score REAL,
+        total_in_post INTEGER,
+        video_data TEXT NOT NULL,
+        reason TEXT,
+        deferred_at DATETIME
+    )
+    ''')
+
+def _create_access_path_indexes(cursor):
+    # 主要存取路徑的索引 (可用 query_plan_audit.py 檢查每條查詢都不會退回全表掃描)
+    # 部分索引只收錄待上傳 / 已上傳且有檔案的列，隨歷史成長仍只與這些列的數量有關
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_pending_upload ON videos (timestamp) WHERE uploaded_to_youtube = FALSE OR uploaded_to_youtube IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_uploaded_with_file ON videos (local_path) WHERE uploaded_to_youtube = 1 AND local_path IS NOT NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_author ON videos (author, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_timestamp ON videos (timestamp)")
+    # 涵蓋 view_db 摘要查詢 (總數、已上傳數、最後上傳時間)，不必讀取整張表
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_upload_timestamp ON videos (upload_timestamp, uploaded_to_youtube)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_download_backlog_score ON download_backlog (score)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_download_backlog_deferred_at ON download_backlog (deferred_at)")
+
+def _create_caption_search(cursor, content_rowid='rowid'):
+    """
+    建立 caption / author 的 FTS5 全文索引 `videos_fts` (外部內容表，不重複保存文字)，由觸發器與 `videos` 同步。
+    trigram 分詞器以三字元片段建索引，不需斷詞即可搜尋中日韓文字幕；少於三個字元的詞無法使用索引。
+    索引的 rowid 對應 videos 的 content_rowid 欄位；遷移 #9 之後為 VACUUM 不會重新編號的 id。
+    """
+    try:
+        cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+            caption, author, content='videos', content_rowid='{content_rowid}', tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # 舊版 SQLite (< 3.34) 沒有 trigram 分詞器；搜尋會退回 LIKE 掃描
+        logging.warning(f"[DB] 無法建立全文索引 ({e})，view_db --search 將改用 LIKE 搜尋。")
+        return
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS videos_fts_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO videos_fts (rowid, caption, author) VALUES (new.{content_rowid}, new.caption, new.author);
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS videos_fts_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO videos_fts (videos_fts, rowid, caption, author) VALUES ('delete', old.{content_rowid}, old.caption, old.author);
+    END
+    ''')
+    # 只在 caption / author 變更時更新索引，上傳狀態的更新不會觸發
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS videos_fts_update AFTER UPDATE OF caption, author ON videos BEGIN
+        INSERT INTO videos_fts (videos_fts, rowid, caption, author) VALUES ('delete', old.{content_rowid}, old.caption, old.author);
+        INSERT INTO videos_fts (rowid, caption, author) VALUES (new.{content_rowid}, new.caption, new.author);
+    END
+    ''')
+    # 為既有的影片建立索引
+    cursor.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")
+
+def _create_like_count_index(cursor):
+    # view_db --min-likes：涵蓋篩選後的摘要查詢 (已上傳數、最後上傳時間)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_like_count ON videos (like_count, uploaded_to_youtube, upload_timestamp)")
+
+def _create_metadata_cache(cursor):
+    # Gemini 生成的上傳元數據；cache_key 由 prompt 版本、caption 與檔名計算，publishAt 於每次上傳時覆寫
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS metadata_cache (
+        cache_key TEXT PRIMARY KEY,
+        prompt_version INTEGER NOT NULL,
+        metadata TEXT NOT NULL,
+        created_at DATETIME
+    )
+    ''')
+
+def _create_upload_state_index(cursor):
+    # view_db --uploaded / --pending：以 COALESCE(uploaded_to_youtube, 0) 的等值條件搜尋並依 timestamp 排序，
+    # 摘要查詢只讀索引 (部分索引與 idx_videos_timestamp 成本相同時，規劃器可能整個走完時間索引再逐列過濾)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_videos_upload_state
+    ON videos (COALESCE(uploaded_to_youtube, 0), timestamp, upload_timestamp, uploaded_to_youtube)
+    """)
+
+def _add_video_row_id(cursor):
+    """
+    為 videos 加上 INTEGER PRIMARY KEY 的 id 欄位 (video_id 改為 NOT NULL UNIQUE)。
+    以 TEXT 為主鍵的資料表在 VACUUM 時 rowid 可能被重新編號，以 rowid 對應的全文索引就會指向錯誤的影片；
+    id 是 rowid 的別名，VACUUM 不會改變它。SQLite 無法以 ALTER TABLE 新增主鍵，因此重建資料表：
+    沿用原本的 rowid 作為 id，再重新建立 videos 上的索引與全文索引。
+    """
+    columns = ("video_id, post_id, post_url, author, caption, video_url, like_count, comment_count, timestamp, "
+               "local_path, uploaded_to_youtube, upload_timestamp, youtube_title, content_hash")
+    indexes = [row[0] for row in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'videos' AND sql IS NOT NULL")]
+    # 全文索引的觸發器隨 videos 一起刪除，由 _create_caption_search 以 id 重建
+    has_caption_search = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'videos_fts'").fetchone() is not None
+    cursor.execute("DROP TABLE IF EXISTS videos_fts")
+
+    cursor.execute('''
+    CREATE TABLE videos_new (
+        video_id TEXT NOT NULL UNIQUE,
+        post_id TEXT,
+        post_url TEXT NOT NULL DEFAULT '',
+        author TEXT,
+        caption TEXT,
+        video_url TEXT,
+        like_count INTEGER,
+        comment_count INTEGER,
+        timestamp DATETIME,
+        local_path TEXT,
+        uploaded_to_youtube BOOLEAN DEFAULT FALSE,
+        upload_timestamp DATETIME,
+        youtube_title TEXT,
+        content_hash TEXT,
+        id INTEGER PRIMARY KEY
+    )
+    ''')
+    cursor.execute(f"INSERT INTO videos_new ({columns}, id) SELECT {columns}, rowid FROM videos")
+    cursor.execute("DROP TABLE videos")
+    cursor.execute("ALTER TABLE videos_new RENAME TO videos")
+    for sql in indexes:
+        cursor.execute(sql)
+    if has_caption_search:
+        _create_caption_search(cursor, content_rowid='id')
+
+# 依序套用的結構遷移，已套用的版本記錄在 PRAGMA user_version。
+# 只能在最後附加新的遷移，不可修改或重新編號已發佈的項目。
+# 第 1~4 項以 IF NOT EXISTS 撰寫，以便接手尚未記錄版本、但已經有部分表格或索引的舊資料庫。
+MIGRATIONS = [
+    (1, "videos / liked_posts 資料表", _migrate_videos_layout),
+    (2, "內容定址表 content_hashes", _create_content_hashes),
+    (3, "延後下載表 download_backlog", _create_download_backlog),
+    (4, "常用存取路徑索引", _create_access_path_indexes),
+    (5, "caption / author 全文索引 videos_fts", _create_caption_search),
+    (6, "讚數篩選索引", _create_like_count_index),
+    (7, "上傳元數據快取 metadata_cache", _create_metadata_cache),
+    (8, "上傳狀態篩選索引", _create_upload_state_index),
+    (9, "videos 的穩定整數主鍵 id (全文索引改以 id 對應)", _add_video_row_id),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version():
+    return get_db_connection().execute("PRAGMA user_version").fetchone()[0]
+
+def init_db():
+    """
+    初始化資料庫：依序套用 MIGRATIONS 中尚未套用的遷移。
+    版本已是最新時只讀取 PRAGMA user_version 並確認全文索引存在，不再檢查資料表結構。
+    每項遷移在各自的 BEGIN IMMEDIATE 交易中執行並一起更新 user_version，
+    失敗時回滾該項，資料庫停留在上一個完整的版本。
+    """
+    conn = get_db_connection()
+    if get_schema_version() < SCHEMA_VERSION:
+        _apply_migrations(conn)
+    _ensure_caption_search(conn)
+
+def _apply_migrations(conn):
+    for version, description, migrate in MIGRATIONS:
+        # IMMEDIATE 先取得寫入鎖，同時啟動的排程器 / 主程式不會重複套用同一項遷移
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version() < version:
+                logging.info(f"[DB] 正在套用資料庫遷移 #{version}: {description}")
+                migrate(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _caption_search_exists(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'videos_fts'").fetchone() is not None
+
+def _trigram_supported():
+    probe = sqlite3.connect(":memory:")
+    try:
+        probe.execute("CREATE VIRTUAL TABLE probe USING fts5(text, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        probe.close()
+
+def _ensure_caption_search(conn):
+    """
+    遷移 #5 在不支援 trigram 的 SQLite 上只記錄警告 (版本號照樣前進，其他功能不受影響)；
+    之後換成支援的 SQLite 時在這裡補建全文索引，不必等新的遷移。
+    """
+    if _caption_search_exists(conn) or not _trigram_supported():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not _caption_search_exists(conn):
+            logging.info("[DB] 目前的 SQLite 已支援 trigram 分詞器，正在補建全文索引 videos_fts...")
+            _create_caption_search(conn.cursor(), content_rowid='id')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _video_row(video_data):
+    return (
         f"{video_data['post_id']}-{video_data.get('video_index', 1)}",
         video_data['post_id'],
         video_data.get('post_url', ''),
@@ -147,77 +404,189 @@ def add_video_entry(video_data):
         video_data.get('like_count', 0),
         video_data.get('comment_count', 0),
         datetime.fromtimestamp(video_data['timestamp']),
-        video_data['local_path']
-    ))
-    conn.commit()
-    conn.close()
+        video_data['local_path'],
+        video_data.get('content_hash')
+    )
+
+def add_video_entry(video_data):
+    """新增一筆新的影片紀錄到資料庫中。"""
+    add_video_entries([video_data])
+
+def add_video_entries(videos):
+    """在單一交易中新增多筆影片紀錄；任何一筆失敗時整批回滾。"""
+    rows = [_video_row(video_data) for video_data in videos]
+    if not rows:
+        return
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT INTO videos (
+            video_id, post_id, post_url, author, caption, video_url, like_count, 
+            comment_count, timestamp, local_path, content_hash
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
 
 def get_all_existing_video_ids():
     """從資料庫中獲取所有已存在的影片 ID。"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT video_id FROM videos")
-    ids = {row['video_id'] for row in cursor.fetchall()}
-    conn.close()
-    return ids
+    return {row['video_id'] for row in conn.execute("SELECT video_id FROM videos")}
 
 def get_all_videos_to_upload():
     """獲取所有尚未上傳到 YouTube 的影片紀錄。"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM videos WHERE uploaded_to_youtube = FALSE OR uploaded_to_youtube IS NULL")
-    videos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return videos
+    return [dict(row) for row in conn.execute("SELECT * FROM videos WHERE uploaded_to_youtube = FALSE OR uploaded_to_youtube IS NULL")]
 
 def update_upload_status(video_id, status, title=""):
     """更新指定影片的 YouTube 上傳狀態和標題。"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE videos 
-    SET uploaded_to_youtube = ?, upload_timestamp = ?, youtube_title = ?
-    WHERE video_id = ?
-    ''', (status, datetime.now() if status else None, title, video_id))
-    conn.commit()
-    conn.close()
+    update_upload_statuses([(video_id, status, title)])
+
+def update_upload_statuses(updates):
+    """在單一交易中更新多部影片的上傳狀態；updates 為 (video_id, status, title) 的序列。"""
+    now = datetime.now()
+    rows = [(status, now if status else None, title, video_id) for video_id, status, title in updates]
+    if not rows:
+        return
+    with transaction() as conn:
+        conn.executemany('''
+        UPDATE videos 
+        SET uploaded_to_youtube = ?, upload_timestamp = ?, youtube_title = ?
+        WHERE video_id = ?
+        ''', rows)
 
 def delete_video_record(video_id):
     """根據 video_id 從資料庫中刪除指定的影片紀錄。"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
         logging.info(f"正在從資料庫中刪除影片紀錄: {video_id}")
-        cursor.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
         logging.info(f"成功刪除紀錄: {video_id}")
     except sqlite3.Error as e:
         logging.error(f"刪除影片紀錄 {video_id} 時發生資料庫錯誤: {e}")
-    finally:
-        conn.close()
 
 def add_liked_post(post_id):
     """新增一筆按讚貼文的紀錄。"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO liked_posts (post_id, like_timestamp) VALUES (?, ?)", (post_id, datetime.now()))
-    conn.commit()
-    conn.close()
+    add_liked_posts([post_id])
+
+def add_liked_posts(post_ids):
+    """在單一交易中新增多筆按讚貼文的紀錄。"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    now = datetime.now()
+    with transaction() as conn:
+        conn.executemany("INSERT OR IGNORE INTO liked_posts (post_id, like_timestamp) VALUES (?, ?)", [(post_id, now) for post_id in post_ids])
 
 def get_all_liked_post_ids():
     """獲取所有已按讚的貼文 ID。"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT post_id FROM liked_posts")
-    ids = {row['post_id'] for row in cursor.fetchall()}
-    conn.close()
-    return ids
+    return {row['post_id'] for row in conn.execute("SELECT post_id FROM liked_posts")}
 
 def get_all_uploaded_videos():
     """獲取所有已上傳到 YouTube 的影片紀錄的本地路徑。"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT local_path FROM videos WHERE uploaded_to_youtube = 1 AND local_path IS NOT NULL")
-    paths = [row['local_path'] for row in cursor.fetchall()]
-    conn.close()
-    return paths
+    return [row['local_path'] for row in conn.execute("SELECT local_path FROM videos WHERE uploaded_to_youtube = 1 AND local_path IS NOT NULL")]
+
+def claim_content_hash(content_hash, local_path, size_bytes, video_id):
+    """
+    登記一份內容的標準檔案路徑並返回該內容目前的標準路徑。
+    若此雜湊已被登記 (例如其他帳號轉貼的同一支影片)，返回既有的路徑而不覆寫。
+    """
+    with transaction() as conn:
+        conn.execute('''
+        INSERT OR IGNORE INTO content_hashes (content_hash, canonical_path, size_bytes, first_video_id, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (content_hash, local_path, size_bytes, video_id, datetime.now()))
+        row = conn.execute("SELECT canonical_path FROM content_hashes WHERE content_hash = ?", (content_hash,)).fetchone()
+    return row['canonical_path']
+
+def update_content_path(content_hash, local_path):
+    """標準檔案已不存在 (例如上傳後被清理) 時，改以新下載的檔案作為該內容的標準路徑。"""
+    with transaction() as conn:
+        conn.execute("UPDATE content_hashes SET canonical_path = ? WHERE content_hash = ?", (local_path, content_hash))
+
+def get_video(video_id):
+    """返回指定影片的紀錄；不存在時返回 None。"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_cached_metadata(cache_key):
+    """返回快取的上傳元數據 (dict)；沒有時返回 None。"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT metadata FROM metadata_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+    return json.loads(row['metadata']) if row else None
+
+def put_cached_metadata(cache_key, prompt_version, metadata):
+    """寫入 (或覆寫) 一份上傳元數據快取。"""
+    with transaction() as conn:
+        conn.execute('''
+        INSERT OR REPLACE INTO metadata_cache (cache_key, prompt_version, metadata, created_at)
+        VALUES (?, ?, ?, ?)
+        ''', (cache_key, prompt_version, json.dumps(metadata, ensure_ascii=False), datetime.now()))
+
+def invalidate_metadata_cache(cache_keys=None):
+    """刪除指定的元數據快取；cache_keys 為 None 時清空整個快取。返回刪除的筆數。"""
+    with transaction() as conn:
+        if cache_keys is None:
+            return conn.execute("DELETE FROM metadata_cache").rowcount
+        return sum(conn.execute("DELETE FROM metadata_cache WHERE cache_key = ?", (cache_key,)).rowcount for cache_key in cache_keys)
+
+def get_uploaded_duplicate(content_hash):
+    """返回內容相同且已上傳到 YouTube 的影片紀錄；沒有時返回 None。"""
+    if not content_hash:
+        return None
+    conn = get_db_connection()
+    row = conn.execute('''
+    SELECT video_id, youtube_title FROM videos
+    WHERE content_hash = ? AND uploaded_to_youtube = 1
+    LIMIT 1
+    ''', (content_hash,)).fetchone()
+    return dict(row) if row else None
+
+def get_dedup_stats(conn=None):
+    """
+    統計重複內容：返回 {'duplicates': 重複的影片數, 'bytes_saved': 因去重而未重複保存的位元組數}。
+    conn 為呼叫端自己開啟的連接 (例如 view_db)；未提供時使用本執行緒的連接。
+    """
+    conn = conn or get_db_connection()
+    row = conn.execute('''
+    SELECT COALESCE(SUM(copies - 1), 0) AS duplicates, COALESCE(SUM((copies - 1) * size_bytes), 0) AS bytes_saved
+    FROM (
+        SELECT c.size_bytes, COUNT(v.video_id) AS copies
+        FROM content_hashes c JOIN videos v ON v.content_hash = c.content_hash
+        GROUP BY c.content_hash
+    )
+    ''').fetchone()
+    return {'duplicates': row['duplicates'], 'bytes_saved': row['bytes_saved']}
+
+def defer_downloads(entries):
+    """
+    在單一交易中將未下載的影片寫入 download_backlog。
+    entries 為 (video_data, total_in_post, score, reason) 的序列；同一影片再次延後時覆寫舊紀錄。
+    """
+    now = datetime.now()
+    rows = [
+        (f"{video['post_id']}-{video.get('video_index', 1)}", video['post_id'], score, total_in_post,
+         json.dumps(video, ensure_ascii=False), reason, now)
+        for video, total_in_post, score, reason in entries
+    ]
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT OR REPLACE INTO download_backlog (video_id, post_id, score, total_in_post, video_data, reason, deferred_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+def get_download_backlog(max_age_hours=48):
+    """
+    返回待接續下載的影片 [(video_data, total_in_post), ...]，依延後時的優先度由高到低排列。
+    已存在於 videos 或超過 max_age_hours (CDN 連結多半已過期) 的項目會先被清除。
+    """
+    with transaction() as conn:
+        conn.execute("DELETE FROM download_backlog WHERE video_id IN (SELECT video_id FROM videos)")
+        conn.execute("DELETE FROM download_backlog WHERE deferred_at < ?", (datetime.now() - timedelta(hours=max_age_hours),))
+    rows = conn.execute("SELECT video_data, total_in_post FROM download_backlog ORDER BY score DESC").fetchall()
+    return [(json.loads(row['video_data']), row['total_in_post'] or 1) for row in rows]
+
+def clear_download_backlog(video_ids):
+    """在單一交易中移除已處理完畢的 backlog 項目。"""
+    with transaction() as conn:
+        conn.executemany("DELETE FROM download_backlog WHERE video_id = ?", [(video_id,) for video_id in video_ids])
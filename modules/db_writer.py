@@ -0,0 +1,179 @@
+# modules/db_writer.py
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from typing import Callable, NamedTuple
+
+from modules import database
+
+DEFAULT_BATCH_ROWS = 256
+DEFAULT_MAX_LATENCY = 0.2
+DEFAULT_QUEUE_SIZE = 1000
+
+# 寫入指令的種類 → 執行它的批次 API (在寫入執行緒的交易中呼叫，巢狀的 transaction() 會併入同一個交易)
+OPERATIONS = {
+    'add_video_entries': database.add_video_entries,
+    'add_liked_posts': database.add_liked_posts,
+}
+
+class WriteCommand(NamedTuple):
+    op: str
+    rows: list
+    on_success: Callable[[], None] | None = None
+    on_error: Callable[[Exception], None] | None = None
+
+class _Barrier(NamedTuple):
+    done: threading.Event
+
+class DBWriter:
+    """
+    寫回 (write-behind) 的資料庫寫入器。
+    爬蟲與下載執行緒只把寫入指令放進有界佇列就繼續工作，由單一背景執行緒持有寫入連接，
+    把累積到 batch_rows 列或等待超過 max_latency 秒的指令合併成一個交易提交；
+    datasette 或上傳器造成的鎖競爭只會讓這個執行緒等待，不會卡住熱路徑。
+    指令提交後呼叫 on_success，失敗時呼叫 on_error(例外) (例如刪除已下載的檔案)。
+    需要確定資料已寫入才能繼續的呼叫端使用 flush() 作為屏障。
+    """
+
+    def __init__(self, batch_rows: int = DEFAULT_BATCH_ROWS, max_latency: float = DEFAULT_MAX_LATENCY,
+                 maxsize: int = DEFAULT_QUEUE_SIZE):
+        self.batch_rows = max(1, batch_rows)
+        self.max_latency = max_latency
+        # 佇列滿時 submit 會阻塞 (資料庫寫入不能像稽核事件一樣捨棄)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.pid = os.getpid()
+        self.committed = 0
+        self.failed = 0
+        self.transactions = 0
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, op: str, rows: list, on_success=None, on_error=None):
+        """排入一個寫入指令；op 必須是 OPERATIONS 中的種類。"""
+        if op not in OPERATIONS:
+            raise ValueError(f"未知的寫入指令: {op}")
+        if not rows:
+            return
+        if self._closed:
+            # 關閉後才提交的寫入直接在呼叫端執行，不會遺失
+            self._execute([WriteCommand(op, list(rows), on_success, on_error)])
+            return
+        self.queue.put(WriteCommand(op, list(rows), on_success, on_error))
+
+    def add_video_entries(self, videos: list[dict], on_success=None, on_error=None):
+        self.submit('add_video_entries', videos, on_success, on_error)
+
+    def add_liked_posts(self, post_ids: list, on_success=None, on_error=None):
+        self.submit('add_liked_posts', post_ids, on_success, on_error)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """屏障：阻塞直到呼叫前排入的所有指令都已提交 (或已回報失敗)；逾時返回 False。"""
+        if not self._thread.is_alive():
+            return True
+        barrier = _Barrier(threading.Event())
+        self.queue.put(barrier)
+        return barrier.done.wait(timeout)
+
+    def close(self):
+        """提交佇列中剩餘的指令並停止寫入執行緒，可重複呼叫。"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.pid != os.getpid():
+            return
+        self.queue.put(None)
+        self._thread.join()
+        if self.failed:
+            logging.warning(f"[DB] 寫回佇列共有 {self.failed} 個寫入指令失敗。")
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self.queue.get()
+            group, barriers, rows = [], [], 0
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, _Barrier):
+                    barriers.append(item.done)
+                    break
+                group.append(item)
+                rows += len(item.rows)
+                if rows >= self.batch_rows:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            self._execute(group)
+            for done in barriers:
+                done.set()
+        database.close_db_connection()
+
+    def _execute(self, group: list[WriteCommand]):
+        if not group:
+            return
+        try:
+            with database.transaction():
+                for command in group:
+                    OPERATIONS[command.op](command.rows)
+            self.transactions += 1
+            results = [(command, None) for command in group]
+        except Exception as e:
+            if len(group) == 1:
+                results = [(group[0], e)]
+            else:
+                # 整組回滾後逐一重試，只有真正失敗的指令會回報錯誤
+                logging.warning(f"[DB] 合併寫入 {len(group)} 個指令失敗 ({e})，改為逐一寫入...")
+                results = []
+                for command in group:
+                    try:
+                        with database.transaction():
+                            OPERATIONS[command.op](command.rows)
+                        self.transactions += 1
+                        results.append((command, None))
+                    except Exception as command_error:
+                        results.append((command, command_error))
+
+        for command, error in results:
+            if error is None:
+                self.committed += 1
+                callback, args = command.on_success, ()
+            else:
+                self.failed += 1
+                callback, args = command.on_error, (error,)
+                if callback is None:
+                    logging.error(f"[DB] 寫入指令 {command.op} ({len(command.rows)} 列) 失敗: {error}")
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as callback_error:
+                logging.error(f"[DB] 寫入指令 {command.op} 的回呼發生錯誤: {callback_error}")
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_db_writer() -> DBWriter:
+    """
+    返回全域共用的寫回寫入器，首次呼叫時建立；fork 出的子進程會建立自己的寫入器。
+    環境變數 DB_WRITE_BATCH_ROWS、DB_WRITE_MAX_LATENCY_MS 可調整合併交易的大小與延遲。
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = DBWriter(
+                batch_rows=int(os.getenv("DB_WRITE_BATCH_ROWS", DEFAULT_BATCH_ROWS)),
+                max_latency=float(os.getenv("DB_WRITE_MAX_LATENCY_MS", DEFAULT_MAX_LATENCY * 1000)) / 1000,
+            )
+        return _writer
@@ -0,0 +1,324 @@
+# modules/download_pipeline.py
+
+import os
+import math
+import sqlite3
+import time
+import queue
+import logging
+import itertools
+import threading
+from urllib.parse import urlparse
+
+from modules.audit import audit_event
+from modules.downloader import download_video, DownloadDeadlineExceeded
+from modules.database import defer_downloads, clear_download_backlog, get_video
+from modules.db_writer import get_db_writer
+from modules.content_store import store_file
+
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_PER_HOST_LIMIT = 2
+DEFAULT_QUEUE_SIZE = 32
+# 尚無已完成的影片可計算平均大小時，位元組預算為每部影片預留的大小
+DEFAULT_VIDEO_SIZE_ESTIMATE = 8 * 1024**2
+
+# 優先度 = (log(讚數) + 留言權重 × log(留言數)) × 0.5^(貼文時數 / 半衰期)
+COMMENT_WEIGHT = 2.0
+RECENCY_HALF_LIFE_HOURS = 48.0
+
+def score_video(video_data: dict, now: float | None = None) -> float:
+    """影片的下載優先度：互動越多、貼文越新，分數越高。"""
+    now = now or time.time()
+    engagement = math.log1p(max(0, video_data.get('like_count') or 0)) + COMMENT_WEIGHT * math.log1p(max(0, video_data.get('comment_count') or 0))
+    age_hours = max(0.0, (now - (video_data.get('timestamp') or now)) / 3600)
+    return engagement * 0.5 ** (age_hours / RECENCY_HALF_LIFE_HOURS)
+
+class DownloadPipeline:
+    """
+    爬取與下載的生產者/消費者管線。
+    爬蟲每接受一則貼文的影片就呼叫 submit 放入有界的優先佇列 (佇列滿時阻塞爬蟲，形成背壓)，
+    workers 個下載執行緒依 score_video 由高到低消化佇列，對同一主機最多 per_host 個並行下載；
+    每部完成的影片各自交給寫回寫入器 (modules.db_writer) 在背景寫入資料庫 (寫入器會把多個指令合併成一個交易)，
+    下載執行緒不等待提交；關閉管線時等待全部提交。
+    max_bytes / max_seconds 為本次運行的下載預算：用盡後尚未開始的影片寫入 download_backlog，由下次運行接續。
+    每部影片開始下載前先預留預期的大小 (已完成影片的平均大小)，並行的下載不會一起超出位元組預算；
+    時間預算以截止點傳給 download(url, path, deadline=...)，進行中的下載到期時停止並保留 .part，影片同樣延後到下次運行。
+    path_for(video_data, total_in_post) 返回影片的完整儲存路徑；本次運行中已被另一部影片使用的路徑視為衝突，該部影片記為失敗。
+    下載完成的檔案會依內容雜湊登記到內容定址索引，重複的內容以硬連結或引用取代，不會再保存一份。
+    某部影片的紀錄違反約束 (例如已由同時執行的另一個運行寫入) 時只略過該部影片；
+    其他資料庫寫入失敗時刪除該影片的檔案並中止管線：之後提交與尚未開始的影片都會被略過。
+    """
+
+    def __init__(self, path_for, existing_video_ids: set | None = None, workers: int = DEFAULT_DOWNLOAD_WORKERS,
+                 per_host: int = DEFAULT_PER_HOST_LIMIT, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 lang_strings: dict | None = None, download=download_video,
+                 max_bytes: int | None = None, max_seconds: float | None = None, score=score_video, writer=None):
+        self.path_for = path_for
+        self.existing_video_ids = existing_video_ids if existing_video_ids is not None else set()
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.lang_strings = lang_strings or {}
+        self.download = download
+        self.score = score
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.writer = writer or get_db_writer()
+
+        self.queue = queue.PriorityQueue(maxsize=max(1, queue_size))
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._claimed_paths = set()
+        self._queued = set()
+        self._backlog_ids = set()
+        self._resolved_backlog = []
+        self._deferred = []
+
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + max_seconds if max_seconds is not None else None
+        self.bytes_downloaded = 0
+        self.bytes_reserved = 0
+        self._sized = 0
+        self.submitted = 0
+        self.downloaded = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+        self.aborted = None
+        self.drain_seconds = 0.0
+        self._closed = False
+
+        self._threads = [threading.Thread(target=self._worker, name=f"download-{i}", daemon=True) for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, videos: list[dict]):
+        """
+        提交同一則貼文中新接受的影片 (PostFilter 的 on_videos 回呼)。
+        已存在於資料庫或本次已排入佇列的影片會被略過；同一貼文的新影片數量會傳給 path_for 以決定是否加上 -partN。
+        """
+        if self.aborted is not None:
+            return
+        fresh = []
+        for video in videos:
+            video_id = f"{video.get('post_id')}-{video.get('video_index', 1)}"
+            if video_id in self.existing_video_ids or video_id in self._queued:
+                continue
+            self._queued.add(video_id)
+            fresh.append(video)
+        for video in fresh:
+            self._put(video, len(fresh))
+        self.submitted += len(fresh)
+
+    def submit_backlog(self, entries: list[tuple[dict, int]]):
+        """提交上次運行因預算不足而延後的影片 (get_download_backlog 的結果)，與新影片一起依優先度排序。"""
+        for video, total_in_post in entries:
+            video_id = f"{video.get('post_id')}-{video.get('video_index', 1)}"
+            if video_id in self._queued:
+                continue
+            self._queued.add(video_id)
+            self._backlog_ids.add(video_id)
+            if video_id in self.existing_video_ids:
+                self._resolved_backlog.append(video_id)
+                continue
+            self._put(video, total_in_post)
+            self.submitted += 1
+
+    def _put(self, video: dict, total_in_post: int):
+        # PriorityQueue 取最小值，因此以負分排序；序號保證同分時先到先下載
+        self.queue.put((-self.score(video), next(self._sequence), (video, total_in_post)))
+
+    def _reserve(self) -> tuple[str | None, int]:
+        """開始下載前檢查預算並預留這部影片預期的大小；返回 (延後原因, 預留的位元組數)，可以下載時原因為 None。"""
+        with self._lock:
+            if self.aborted is not None:
+                return 'aborted', 0
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                return 'budget_time', 0
+            if self.max_bytes is None:
+                return None, 0
+            expected = self.bytes_downloaded // self._sized if self._sized else DEFAULT_VIDEO_SIZE_ESTIMATE
+            committed = self.bytes_downloaded + self.bytes_reserved
+            # 尚未下載或預留任何位元組時至少放行一部，預估值大於整個預算也不會一部都不下載
+            if committed >= self.max_bytes or (committed and committed + expected > self.max_bytes):
+                return 'budget_bytes', 0
+            self.bytes_reserved += expected
+            return None, expected
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _worker(self):
+        while True:
+            priority, _, item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                reason, reserved = self._reserve()
+                if reason:
+                    with self._lock:
+                        self._deferred.append((item[0], item[1], -priority, reason))
+                    continue
+                try:
+                    self._process(*item)
+                except DownloadDeadlineExceeded:
+                    # 已下載的部分保留在 .part，下次運行從中斷處續傳
+                    with self._lock:
+                        self._deferred.append((item[0], item[1], -priority, 'budget_time'))
+                finally:
+                    with self._lock:
+                        self.bytes_reserved -= reserved
+            except Exception as e:
+                logging.error(f"[Download] 下載執行緒發生未預期的錯誤: {e}")
+                with self._lock:
+                    self.failed += 1
+            finally:
+                self.queue.task_done()
+
+    def _process(self, video_data: dict, total_in_post: int):
+        video_id = f"{video_data['post_id']}-{video_data.get('video_index', 1)}"
+        safe_caption = str(video_data['caption']).encode('utf-8', 'ignore').decode('utf-8')
+        logging.info(self.lang_strings.get('processing_video', "正在處理影片 ID: {video_id}, 作者: {author}, 內容: {caption}...").format(video_id=video_id, author=video_data['author'], caption=safe_caption[:50]))
+
+        full_path = self.path_for(video_data, total_in_post)
+        with self._lock:
+            # 路徑在整個運行中只屬於第一部使用它的影片 (下載失敗留下的 .part 也不能讓別的影片續傳)
+            conflict = full_path in self._claimed_paths
+            if conflict:
+                self.failed += 1
+            else:
+                self._claimed_paths.add(full_path)
+        if conflict:
+            # 續傳另一部影片的 .part 或沿用它的檔案，都會把別人的內容記成這部影片
+            logging.error(self.lang_strings.get('download_path_conflict', "影片 {video_id} 的儲存路徑 {path} 已被另一部影片使用，跳過此影片。").format(video_id=video_id, path=full_path))
+            return
+        with self._host_slot(video_data['video_url']):
+            content_hash = self.download(video_data['video_url'], full_path, deadline=self.deadline)
+
+        if not content_hash:
+            logging.error(self.lang_strings.get('download_failed', "影片 {video_id} 下載失敗，跳過紀錄。").format(video_id=video_id))
+            with self._lock:
+                self.failed += 1
+                # 延後的 CDN 連結可能已過期，失敗後不再保留在 backlog 中
+                if video_id in self._backlog_ids:
+                    self._resolved_backlog.append(video_id)
+            return
+
+        with self._lock:
+            self.bytes_downloaded += os.path.getsize(full_path) if os.path.exists(full_path) else 0
+            self._sized += 1
+
+        local_path, saved = full_path, 0
+        try:
+            local_path, saved = store_file(full_path, content_hash, video_id)
+        except Exception as e:
+            logging.error(f"[Store] 登記影片 {video_id} 的內容雜湊失敗: {e}")
+
+        video_data['local_path'] = local_path
+        video_data['content_hash'] = content_hash
+        self._register((video_data, full_path, saved))
+
+    def _discard(self, entry: tuple):
+        """事務性操作：資料庫寫入失敗時刪除已下載的檔案 (改為引用既有檔案時新檔已被刪除)。"""
+        video_data, full_path, _ = entry
+        if video_data['local_path'] != full_path:
+            return
+        logging.warning(f"由於資料庫寫入失敗，正在刪除已下載的檔案: {full_path}")
+        try:
+            os.remove(full_path)
+        except OSError as remove_error:
+            logging.error(f"刪除檔案 {full_path} 失敗: {remove_error}")
+
+    def _register(self, entry: tuple):
+        """把一部已完成的影片 (video_data, full_path, saved) 交給寫入器；結果由 _registered / _register_failed 回呼處理。"""
+        if self.aborted is not None:
+            self._discard(entry)
+            return
+        self.writer.add_video_entries([entry[0]],
+                                      on_success=lambda: self._registered(entry),
+                                      on_error=lambda e: self._register_failed(entry, e))
+
+    def _register_failed(self, entry: tuple, error: Exception):
+        """寫入失敗時的處理 (在寫入執行緒上執行)。"""
+        video_data, full_path, _ = entry
+        video_id = f"{video_data['post_id']}-{video_data.get('video_index', 1)}"
+        if isinstance(error, sqlite3.IntegrityError):
+            # 只影響這一部影片：另一個運行已寫入同一部影片時，它的紀錄可能正指向同一個檔案，不能刪除
+            logging.error(self.lang_strings.get('db_write_rejected', "影片 {video_id} 的紀錄無法寫入資料庫 ({error})，略過此影片。").format(video_id=video_id, error=error))
+            with self._lock:
+                self.failed += 1
+            existing = get_video(video_id)
+            if not existing or existing['local_path'] != full_path:
+                self._discard(entry)
+            return
+        if self.aborted is None:
+            logging.critical(self.lang_strings.get('db_write_failed', "寫入資料庫失敗: {error}，中止執行。").format(error=error))
+            self.aborted = error
+        self._discard(entry)
+
+    def _registered(self, entry: tuple):
+        video_data, _, saved = entry
+        video_id = f"{video_data['post_id']}-{video_data.get('video_index', 1)}"
+        with self._lock:
+            self.downloaded += 1
+            if video_id in self._backlog_ids:
+                self._resolved_backlog.append(video_id)
+            if saved:
+                self.deduplicated += 1
+                self.bytes_saved += saved
+
+    def close(self) -> dict:
+        """
+        等待佇列中剩餘的影片下載完畢並結束所有執行緒，返回統計資料。
+        因預算用盡或中止而未下載的影片寫入 download_backlog，已完成的 backlog 項目則被移除。
+        """
+        if not self._closed:
+            self._closed = True
+            started = time.perf_counter()
+            for _ in self._threads:
+                # 結束訊號的優先度最低，排在所有影片之後
+                self.queue.put((math.inf, next(self._sequence), None))
+            for thread in self._threads:
+                thread.join()
+            # 屏障：統計與 backlog 清理需要所有影片都已寫入資料庫
+            self.writer.flush()
+            self.drain_seconds = time.perf_counter() - started
+            self._record_backlog()
+        return self.stats()
+
+    def _record_backlog(self):
+        try:
+            if self._deferred:
+                defer_downloads(self._deferred)
+            if self._resolved_backlog:
+                clear_download_backlog(self._resolved_backlog)
+        except Exception as e:
+            logging.error(f"[Budget] 更新下載待辦清單失敗: {e}")
+        if self.max_bytes is not None or self.max_seconds is not None or self._deferred:
+            audit_event('download_budget', bytes=self.bytes_downloaded, max_bytes=self.max_bytes,
+                        seconds=round(time.monotonic() - self.started_at, 1), max_seconds=self.max_seconds,
+                        downloaded=self.downloaded, deferred=len(self._deferred))
+
+    def stats(self) -> dict:
+        return {
+            'submitted': self.submitted,
+            'downloaded': self.downloaded,
+            'failed': self.failed,
+            'deduplicated': self.deduplicated,
+            'bytes_saved': self.bytes_saved,
+            'bytes_downloaded': self.bytes_downloaded,
+            'deferred': len(self._deferred),
+            'workers': self.workers,
+            'drain': self.drain_seconds,
+            'aborted': self.aborted,
+        }
@@ -3,38 +3,203 @@
 import subprocess
 import os
 import time
+import hashlib
+import threading
+from urllib.parse import urlparse
 
-def download_video(video_url: str, full_path: str) -> bool:
-    """接收一個指定的 URL 和完整的儲存路徑，使用 yt-dlp 進行下載。"""
-    
-    # 從完整路徑中獲取目錄，並確保它存在
-    output_dir = os.path.dirname(full_path)
-    os.makedirs(output_dir, exist_ok=True)
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules.audit import audit_event
+
+# 備援：需要解析頁面的 URL 仍交給 yt-dlp
+YTDLP_COMMAND = ["uv", "run", "yt-dlp"]
+
+DOWNLOAD_ENGINES = ('auto', 'native', 'ytdlp')
+CHUNK_SIZE = 1024 * 1024
+# (連線逾時, 兩次讀取之間的逾時)
+REQUEST_TIMEOUT = (10, 60)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# video_versions 中的 URL 都是可直接下載的 CDN 連結
+DIRECT_MEDIA_HOSTS = ('cdninstagram.com', 'fbcdn.net')
+DIRECT_MEDIA_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.webm')
+
+_session = None
+_session_lock = threading.Lock()
+
+class DownloadDeadlineExceeded(Exception):
+    """下載預算的時間已用盡；native 下載會保留 .part，由下次運行續傳。"""
+    pass
+
+def get_http_session() -> requests.Session:
+    """返回進程內共用、具備 keep-alive 連線池的 requests.Session。"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update({'user-agent': USER_AGENT})
+        return _session
+
+def is_direct_media_url(video_url: str) -> bool:
+    parsed = urlparse(video_url)
+    host = (parsed.hostname or '').lower()
+    return host.endswith(DIRECT_MEDIA_HOSTS) or parsed.path.lower().endswith(DIRECT_MEDIA_EXTENSIONS)
+
+def _content_range_total(response) -> int | None:
+    """從 Content-Range: bytes a-b/total 取出檔案總大小。"""
+    content_range = response.headers.get('Content-Range', '')
+    total = content_range.rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+def _content_range_start(response) -> int | None:
+    """從 Content-Range: bytes a-b/total 取出回應內容的起點 a。"""
+    content_range = response.headers.get('Content-Range', '')
+    start = content_range.removeprefix('bytes ').partition('-')[0].strip()
+    return int(start) if start.isdigit() else None
 
-    command = [
-        "uv", "run", "yt-dlp",
+def file_sha256(path: str, chunk_size: int = CHUNK_SIZE, digest=None):
+    """分塊讀取檔案並更新 digest (預設新建 SHA-256)，返回 digest 物件。"""
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+def stream_to_file(video_url: str, full_path: str, session: requests.Session | None = None,
+                   chunk_size: int = CHUNK_SIZE, timeout=REQUEST_TIMEOUT, deadline: float | None = None) -> tuple[int, str]:
+    """
+    以串流方式將 video_url 分塊寫入 full_path + '.part'，完成後以 os.replace 原子地移到 full_path。
+    若 .part 已存在 (上次傳輸中斷)，以 HTTP Range 從中斷處續傳；伺服器不支援 Range 時從頭下載，
+    回傳的範圍不是從 .part 的結尾開始時捨棄 .part 重新下載。
+    寫入的同時計算內容的 SHA-256 (續傳時只需重讀已存在的 .part)，不需要下載後再讀一次檔案。
+    deadline (time.monotonic() 的時間點) 到達時停止寫入並拋出 DownloadDeadlineExceeded。
+    返回 (檔案大小, SHA-256 十六進位字串)；失敗時拋出例外並保留 .part 供下次續傳。
+    """
+    session = session or get_http_session()
+    part_path = full_path + '.part'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f"bytes={offset}-"} if offset else {}
+
+    with session.get(video_url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416 and offset:
+            # 請求的起點已超過檔案結尾：.part 若已完整就直接收尾，否則捨棄重來
+            total = _content_range_total(response)
+            if total is not None and total == offset:
+                digest = file_sha256(part_path, chunk_size)
+                os.replace(part_path, full_path)
+                return offset, digest.hexdigest()
+            os.remove(part_path)
+            return stream_to_file(video_url, full_path, session, chunk_size, timeout, deadline)
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            start = _content_range_start(response)
+            if start != offset:
+                # 伺服器給的不是請求的範圍，附加到 .part 會損毀檔案
+                if not offset:
+                    raise IOError(f"伺服器回傳了未請求的範圍: {response.headers.get('Content-Range')}")
+                os.remove(part_path)
+                return stream_to_file(video_url, full_path, session, chunk_size, timeout, deadline)
+            mode = 'ab'
+            expected = _content_range_total(response)
+            digest = file_sha256(part_path, chunk_size) if offset else hashlib.sha256()
+        else:
+            mode = 'wb'
+            offset = 0
+            content_length = response.headers.get('Content-Length')
+            expected = int(content_length) if content_length and content_length.isdigit() and 'Content-Encoding' not in response.headers else None
+            digest = hashlib.sha256()
+
+        written = offset
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DownloadDeadlineExceeded(f"下載時間預算已用盡: 已接收 {written} bytes，保留 .part 供續傳")
+
+    if expected is not None and written != expected:
+        raise IOError(f"檔案不完整: 已接收 {written} / {expected} bytes")
+    os.replace(part_path, full_path)
+    return written, digest.hexdigest()
+
+def _download_with_ytdlp(video_url: str, full_path: str, command: list[str] | None = None, timeout: float = 300):
+    command = (command or YTDLP_COMMAND) + [
         "--output", full_path, # 直接使用傳入的完整路徑
         "--no-overwrites", # 如果檔案已存在，則不覆蓋
         video_url
     ]
+    # 增加 timeout，防止卡住
+    subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=timeout)
+
+def download_video(video_url: str, full_path: str, engine: str | None = None, deadline: float | None = None) -> str | None:
+    """
+    接收一個指定的 URL 和完整的儲存路徑並下載影片。
+    成功時返回檔案內容的 SHA-256 十六進位字串 (供內容定址去重使用)，失敗時返回 None。
+    engine:
+      - 'native'：在進程內以共用的 HTTP 連線池串流下載，支援中斷續傳。
+      - 'ytdlp'：啟動 yt-dlp 子進程。
+      - 'auto' (預設，可由 THREADS_DOWNLOAD_ENGINE 覆寫)：CDN 直連的影片走 native，其餘需要解析的 URL 交給 yt-dlp。
+    deadline 為下載時間預算的截止點 (time.monotonic())：到達時不再重試，拋出 DownloadDeadlineExceeded。
+    """
+    engine = engine or os.getenv("THREADS_DOWNLOAD_ENGINE", "auto")
+    if engine == 'auto':
+        engine = 'native' if is_direct_media_url(video_url) else 'ytdlp'
+
+    # 從完整路徑中獲取目錄，並確保它存在
+    output_dir = os.path.dirname(full_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if os.path.exists(full_path):
+        # 與 yt-dlp 的 --no-overwrites 行為一致
+        print(f"檔案已存在，跳過下載: {full_path}")
+        audit_event('download', url=video_url, path=full_path, success=True, attempts=0, engine=engine)
+        return file_sha256(full_path).hexdigest()
 
     max_retries = 3
     for attempt in range(max_retries):
         try:
+            timeout = 300
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    raise DownloadDeadlineExceeded("下載時間預算已用盡")
             print(f"開始下載 (第 {attempt + 1}/{max_retries} 次嘗試): {video_url}")
-            # 增加 timeout，防止卡住
-            subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=300)
+            if engine == 'native':
+                _, content_hash = stream_to_file(video_url, full_path, deadline=deadline)
+            else:
+                try:
+                    _download_with_ytdlp(video_url, full_path, timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise DownloadDeadlineExceeded("下載時間預算已用盡")
+                    raise
+                # 子進程自行寫檔，只能在完成後讀一次檔案計算雜湊
+                content_hash = file_sha256(full_path).hexdigest()
             print(f"下載成功！影片儲存於: {full_path}")
-            return True
+            audit_event('download', url=video_url, path=full_path, success=True, attempts=attempt + 1, engine=engine)
+            return content_hash
+        except DownloadDeadlineExceeded as e:
+            print(f"[下載警告] {e}: {video_url}")
+            audit_event('download', url=video_url, path=full_path, success=False, attempts=attempt + 1, engine=engine, deadline=True)
+            raise
         except subprocess.TimeoutExpired:
-            print(f"[下載警告] 第 {attempt + 1} 次嘗試超時 (300秒)。")
+            print(f"[下載警告] 第 {attempt + 1} 次嘗試超時 ({timeout:.0f}秒)。")
         except Exception as e:
-            # 捕獲所有其他可能的錯誤，例如 CalledProcessError
+            # 捕獲所有其他可能的錯誤，例如 CalledProcessError 或連線中斷 (native 會保留 .part 以便續傳)
             print(f"[下載警告] 第 {attempt + 1} 次嘗試失敗。 {getattr(e, 'stderr', e)}")
-        
+
         if attempt < max_retries - 1:
             print("將在 5 秒後重試...")
-            time.sleep(5)
+            # 時間預算在等待期間用盡時，下一次嘗試會直接拋出 DownloadDeadlineExceeded
+            time.sleep(5 if deadline is None else max(0, min(5, deadline - time.monotonic())))
 
     print(f"[下載錯誤] 所有 {max_retries} 次嘗試均失敗，放棄下載: {video_url}")
-    return False
\ No newline at end of file
+    audit_event('download', url=video_url, path=full_path, success=False, attempts=max_retries, engine=engine)
+    return None
@@ -0,0 +1,139 @@
+# modules/extractor.py
+
+import io
+import json
+import zstandard
+
+from modules.graphql import ZSTD_MAGIC, EDGE_ROOTS, extract_edges, compact_post, iter_post_records
+
+try:
+    import ijson
+except ImportError:
+    # 未安裝 ijson 時一律走完整解析路徑，輸出的精簡紀錄格式相同
+    ijson = None
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# 解壓後超過此大小的回應改用串流解析；一般的分頁回應用 C 實作的 JSON 解析器整包解析反而更快
+STREAMING_THRESHOLD_BYTES = 8 * 1024 * 1024
+# zstd 幀未記錄內容大小時 (瀏覽器串流壓縮的回應常見)，以壓縮後大小乘上此倍率估算
+ESTIMATED_ZSTD_RATIO = 8
+
+# 串流解析時只會為這些位置的 post 物件建構 Python 物件
+POST_PREFIXES = frozenset(
+    f"data.{root}.edges.item.node.text_post_app_thread.thread_items.item.post"
+    for root in EDGE_ROOTS
+)
+
+# post 物件內 compact_post 實際讀取的欄位；其餘子樹 (圖片版本、使用者資訊等) 在解析時直接略過
+KEPT_FIELDS = (
+    'pk',
+    'code',
+    'user.username',
+    'caption.text',
+    'like_count',
+    'taken_at',
+    'text_post_app_info.direct_reply_count',
+    'video_versions.item.url',
+    'carousel_media.item.video_versions.item.url',
+)
+
+def _path_prefixes(paths) -> frozenset:
+    prefixes = {''}
+    for path in paths:
+        parts = path.split('.')
+        for i in range(1, len(parts) + 1):
+            prefixes.add('.'.join(parts[:i]))
+    return frozenset(prefixes)
+
+KEPT_PATHS = _path_prefixes(KEPT_FIELDS)
+
+def _is_zstd(body: bytes, content_encoding: str) -> bool:
+    return 'zstd' in (content_encoding or '') or body[:4] == ZSTD_MAGIC
+
+def decoded_size(body: bytes, content_encoding: str = '') -> int:
+    """估計解壓後的大小；zstd 幀標頭未記錄內容大小時以 ESTIMATED_ZSTD_RATIO 推估。"""
+    if not _is_zstd(body, content_encoding):
+        return len(body)
+    try:
+        size = zstandard.frame_content_size(body)
+    except zstandard.ZstdError:
+        size = -1
+    return size if size >= 0 else len(body) * ESTIMATED_ZSTD_RATIO
+
+def open_body_stream(body: bytes, content_encoding: str = ''):
+    """返回一個可串流讀取的檔案物件；zstd body 會邊讀邊解壓，不會先產生完整的解壓緩衝區。"""
+    raw = io.BytesIO(body)
+    if _is_zstd(body, content_encoding):
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    return raw
+
+def _iter_posts_streaming(stream):
+    """以 ijson 事件流逐則建構 post 物件，只保留 KEPT_FIELDS 所涵蓋的欄位。"""
+    builder = None
+    base = None
+    base_len = 0
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is None:
+            if event == 'start_map' and prefix in POST_PREFIXES:
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                base = prefix
+                base_len = len(prefix) + 1
+            continue
+
+        if prefix == base:
+            if event == 'end_map':
+                builder.event(event, value)
+                yield builder.value
+                builder = None
+                continue
+            relative = ''
+        else:
+            relative = prefix[base_len:]
+
+        if event == 'map_key':
+            path = f"{relative}.{value}" if relative else value
+        else:
+            path = relative
+        if path in KEPT_PATHS:
+            builder.event(event, value)
+
+def load_body(body: bytes, content_encoding: str = ''):
+    """完整解壓後以最快的可用 JSON 解析器 (orjson 或標準庫) 解析整個回應。"""
+    if _is_zstd(body, content_encoding):
+        with open_body_stream(body, content_encoding) as stream:
+            body = stream.read()
+    return _json_loads(body)
+
+def _iter_records_buffered(body: bytes, content_encoding: str):
+    yield from iter_post_records(extract_edges(load_body(body, content_encoding)))
+
+def _iter_records_streaming(body: bytes, content_encoding: str):
+    with open_body_stream(body, content_encoding) as stream:
+        for post in _iter_posts_streaming(stream):
+            yield compact_post(post)
+
+def iter_records_from_body(body: bytes, content_encoding: str = '', mode: str = 'auto'):
+    """
+    從單一 GraphQL 回應 body 中逐一產出 compact_post 精簡紀錄。
+
+    mode:
+      - 'stream'：串流解壓 + ijson 增量解析，峰值記憶體只與單則貼文的大小相關。
+      - 'buffered'：整包解壓後用 orjson (若已安裝) 解析，吞吐量最高。
+      - 'auto'：(估計的) 解壓後大小超過 STREAMING_THRESHOLD_BYTES 時串流，否則整包解析。
+    未安裝 ijson 時一律使用 'buffered'。
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if mode == 'auto':
+        size = decoded_size(body, content_encoding)
+        mode = 'stream' if size >= STREAMING_THRESHOLD_BYTES else 'buffered'
+    if mode == 'stream' and ijson is not None:
+        yield from _iter_records_streaming(body, content_encoding)
+    else:
+        yield from _iter_records_buffered(body, content_encoding)
@@ -0,0 +1,267 @@
+# modules/feed_client.py
+
+import os
+import re
+import time
+import logging
+
+import requests
+import zstandard
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from modules.graphql import PostFilter, extract_edges, extract_page_info, iter_post_records
+from modules.extractor import load_body
+from modules.replay import append_capture
+from modules.threads_client import get_like_tokens, build_graphql_form, build_graphql_headers, like_post_http
+from modules.db_writer import get_db_writer
+from modules.audit import get_audit_sink
+from modules.scraper import load_language_strings
+
+THREADS_BASE_URL = "https://www.threads.net"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# main.py --engine 可選的爬取引擎
+ENGINES = ('browser', 'http')
+FEED_KINDS = ('feed', 'profile', 'search')
+
+# 各種分頁查詢的 fb_api_req_friendly_name 與 __crn 路由 (與瀏覽器送出的請求一致)
+FEED_QUERIES = {
+    'feed': ("BarcelonaFeedPaginationQuery", "comet.threads.BarcelonaHomeRoute"),
+    'profile': ("BarcelonaProfileThreadsTabRefetchableQuery", "comet.threads.BarcelonaProfileRoute"),
+    'search': ("BarcelonaSearchResultsRefetchableQuery", "comet.threads.BarcelonaSearchResultsRoute"),
+}
+
+# persisted query 的 doc_id 會隨 Threads 前端版本更新，因此不寫死，改由設定檔或環境變數提供
+DOC_ID_ENV_VARS = {
+    'feed': "THREADS_DOC_ID_FEED",
+    'profile': "THREADS_DOC_ID_PROFILE",
+    'search': "THREADS_DOC_ID_SEARCH",
+}
+
+# 持續模式下的分頁上限，對應瀏覽器引擎的 MAX_TOTAL_SCROLLS
+MAX_TOTAL_PAGES = 100
+
+# 單頁失敗時的例外：連線錯誤，或回應不是 GraphQL JSON (登入頁的 HTML、被截斷的 zstd 等)；
+# 沒有這一頁的 cursor 就無法繼續翻頁，因此停止並保留已蒐集的影片
+PAGE_ERRORS = (requests.RequestException, ValueError, zstandard.ZstdError)
+
+def resolve_doc_ids(overrides: dict | None = None) -> dict:
+    """合併 config.json 的 doc_ids 與環境變數 (環境變數優先)。"""
+    doc_ids = {kind: doc_id for kind, doc_id in (overrides or {}).items() if doc_id}
+    for kind, env_var in DOC_ID_ENV_VARS.items():
+        if os.getenv(env_var):
+            doc_ids[kind] = os.getenv(env_var)
+    return doc_ids
+
+class ThreadsFeedClient:
+    """
+    不啟動瀏覽器的 GraphQL 分頁客戶端。
+    以單一 keep-alive 連線池的 requests.Session 直接重送首頁動態、使用者個人頁與搜尋結果的分頁查詢，
+    依 page_info 的 cursor 翻頁，回應與瀏覽器引擎一樣交給 modules.extractor 解析。
+    """
+
+    def __init__(self, session_cookie: str, doc_ids: dict | None = None, base_url: str = THREADS_BASE_URL,
+                 timeout: float = 15, pool_size: int = 4, page_size: int = 10, capture_path: str | None = None):
+        self.base_url = base_url.rstrip('/')
+        self.doc_ids = doc_ids or {}
+        self.timeout = timeout
+        self.page_size = page_size
+        self.capture_path = capture_path
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'user-agent': USER_AGENT,
+            # zstd 回應保持壓縮狀態交給 extractor 串流解壓，其餘編碼由 urllib3 處理
+            'accept-encoding': 'zstd, gzip, deflate',
+        })
+        self.session.cookies.set('sessionid', session_cookie)
+
+        self.csrf_token = None
+        self.lsd_token = None
+        self.requests = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    @property
+    def tokens(self) -> tuple[str | None, str | None]:
+        return self.csrf_token, self.lsd_token
+
+    def bootstrap(self):
+        """載入首頁以驗證 Cookie 並取得 CSRF/LSD 權杖；Cookie 無效時拋出 ValueError。"""
+        response = self.session.get(f"{self.base_url}/", timeout=self.timeout)
+        response.raise_for_status()
+        title_match = re.search(r'<title[^>]*>(.*?)</title>', response.text, re.S | re.I)
+        page_title = title_match.group(1).lower() if title_match else ''
+        if 'log in' in page_title or '登入' in page_title:
+            raise ValueError("Cookie 已失效或無效，請更新您的 .env 檔案中的 THREADS_SESSION_COOKIE。")
+
+        csrf_token, lsd_token = get_like_tokens(response.text)
+        self.csrf_token = csrf_token or self.session.cookies.get('csrftoken')
+        self.lsd_token = lsd_token
+        if not self.lsd_token:
+            raise ValueError("無法從首頁取得 LSD 權杖，HTTP 引擎無法送出 GraphQL 查詢。")
+
+    def resolve_user_id(self, username: str) -> str:
+        """從使用者個人頁的原始碼中取出數字 user_id。"""
+        response = self.session.get(f"{self.base_url}/@{username}", timeout=self.timeout)
+        response.raise_for_status()
+        match = re.search(r'"user_id":"(\d+)"', response.text)
+        if not match:
+            raise ValueError(f"無法取得 @{username} 的 user_id。")
+        return match.group(1)
+
+    def _post_query(self, kind: str, variables: dict) -> tuple[bytes, str]:
+        """送出一次 GraphQL 分頁查詢，返回 (原始 body, content_encoding)。"""
+        doc_id = self.doc_ids.get(kind)
+        if not doc_id:
+            raise ValueError(f"未設定 {kind} 查詢的 doc_id，請在 config.json 的 doc_ids 或環境變數 {DOC_ID_ENV_VARS[kind]} 中設定。")
+        friendly_name, route = FEED_QUERIES[kind]
+        form = build_graphql_form(doc_id, friendly_name, variables, self.lsd_token, route=route)
+        headers = build_graphql_headers(friendly_name, self.csrf_token, self.lsd_token)
+
+        url = f"{self.base_url}/graphql/query"
+        with self.session.post(url, data=form, headers=headers, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            content_encoding = response.headers.get('Content-Encoding', '')
+            if 'zstd' in content_encoding:
+                body = response.raw.read(decode_content=False)
+            else:
+                body = response.content
+                content_encoding = ''
+
+        self.requests += 1
+        self.bytes += len(body)
+        if self.capture_path:
+            append_capture(self.capture_path, url, content_encoding, body)
+        return body, content_encoding
+
+    def iter_pages(self, kind: str, variables: dict | None = None, max_pages: int | None = None):
+        """依 cursor 逐頁產出該頁的精簡貼文紀錄清單，直到沒有下一頁或達到 max_pages。"""
+        if kind not in FEED_KINDS:
+            raise ValueError(f"未知的查詢類型: {kind}")
+        if not self.lsd_token:
+            self.bootstrap()
+
+        cursor = None
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            page_variables = dict(variables or {})
+            page_variables['first'] = self.page_size
+            if cursor:
+                page_variables['after'] = cursor
+
+            body, content_encoding = self._post_query(kind, page_variables)
+            data = load_body(body, content_encoding)
+            if not isinstance(data, dict):
+                raise ValueError(f"GraphQL 回應不是 JSON 物件: {type(data).__name__}")
+            if data.get('errors'):
+                logging.warning(f"[HTTP] GraphQL 回應包含錯誤: {str(data['errors'])[:200]}")
+            pages += 1
+            yield list(iter_post_records(extract_edges(data)))
+
+            cursor, has_next_page = extract_page_info(data)
+            if not has_next_page or not cursor:
+                return
+
+    def iter_target_pages(self, target_username: str | None = None, search_query: str | None = None,
+                          max_pages: int | None = None):
+        """依目標 (使用者、搜尋關鍵字或首頁) 選擇查詢類型並逐頁產出紀錄。"""
+        if search_query:
+            return self.iter_pages('search', {'query': search_query, 'search_surface': 'default'}, max_pages)
+        if target_username:
+            if not self.lsd_token:
+                self.bootstrap()
+            return self.iter_pages('profile', {'userID': self.resolve_user_id(target_username)}, max_pages)
+        return self.iter_pages('feed', {}, max_pages)
+
+def fetch_videos(target_username: str | None, search_query: str | None, page_count: int, like_threshold: int,
+                 download_threshold: int, liked_post_ids: set, continuous: bool = False, language: str = 'zh-TW',
+                 capture_path: str | None = None, doc_ids: dict | None = None,
+                 base_url: str = THREADS_BASE_URL, on_videos=None) -> list[dict]:
+    """
+    scrape_videos 的 HTTP 引擎版本：不啟動瀏覽器，直接以 cursor 分頁取得貼文並套用相同的篩選管線。
+    page_count 對應瀏覽器引擎的滾動次數 (一次滾動約載入一頁)；持續模式下翻頁直到蒐集到 5 個影片。
+    on_videos 與 scrape_videos 相同，會在影片被接受時立即收到該批影片。
+    """
+    lang_strings = load_language_strings(language)
+
+    load_dotenv()
+    session_cookie = os.getenv("THREADS_SESSION_COOKIE")
+    if not session_cookie:
+        logging.error(lang_strings.get('no_cookie', "錯誤：請在 .env 檔案中設定 THREADS_SESSION_COOKIE。"))
+        return []
+
+    logging.info(lang_strings.get('http_engine_start', "正在啟動 HTTP 分頁引擎 (不使用瀏覽器)..."))
+    audit_sink = get_audit_sink()
+    max_pages = MAX_TOTAL_PAGES if continuous else page_count
+
+    with ThreadsFeedClient(session_cookie, doc_ids=resolve_doc_ids(doc_ids), base_url=base_url, capture_path=capture_path) as client:
+        try:
+            client.bootstrap()
+        except PAGE_ERRORS as e:
+            logging.error(lang_strings.get('scraping_error', "爬取過程中發生錯誤: {error}").format(error=e))
+            return []
+        csrf_token, lsd_token = client.tokens
+        can_like_posts = bool(csrf_token and lsd_token)
+        if not can_like_posts:
+            logging.warning(lang_strings.get('like_token_failed', "無法獲取按讚權杖，按讚功能將被停用。"))
+
+        # 成功的按讚每頁交給寫回寫入器一次，結束時等待寫入完成
+        liked = []
+        writer = get_db_writer()
+
+        def like_handler(record: dict) -> bool:
+            if like_post_http(client.session, record['pk'], csrf_token, lsd_token, base_url=client.base_url):
+                liked.append(record['pk'])
+                return True
+            return False
+
+        def flush_likes():
+            if liked:
+                writer.add_liked_posts(liked, on_error=lambda e: logging.error(f"[DB] 寫入按讚紀錄失敗: {e}"))
+                liked.clear()
+
+        post_filter = PostFilter(
+            like_threshold=like_threshold,
+            download_threshold=download_threshold,
+            liked_post_ids=liked_post_ids,
+            like_handler=like_handler if can_like_posts else None,
+            audit_sink=audit_sink,
+            lang_strings=lang_strings,
+            on_videos=on_videos
+        )
+
+        started = time.perf_counter()
+        pages = 0
+        try:
+            for records in client.iter_target_pages(target_username, search_query, max_pages):
+                pages += 1
+                post_filter.process_records(records)
+                flush_likes()
+                logging.info(lang_strings.get('http_page_progress', "  第 {page} 頁：{count} 則貼文").format(page=pages, count=len(records)))
+                if continuous and len(post_filter.scraped_videos) >= 5:
+                    break
+        except PAGE_ERRORS as e:
+            logging.error(lang_strings.get('scraping_error', "爬取過程中發生錯誤: {error}").format(error=e))
+        finally:
+            flush_likes()
+            writer.flush()
+            audit_sink.flush(timeout=5)
+
+        logging.info(lang_strings.get('http_engine_summary', "[HTTP] 共 {pages} 頁、{posts} 則貼文、{mb:.2f} MB，耗時 {elapsed:.1f} 秒。").format(
+            pages=pages, posts=post_filter.posts_seen, mb=client.bytes / 1024**2, elapsed=time.perf_counter() - started))
+
+    logging.info(lang_strings.get('total_videos_scraped', "\n本次運行共篩選出 {count} 個符合條件的影片。").format(count=len(post_filter.scraped_videos)))
+    return post_filter.scraped_videos
@@ -0,0 +1,207 @@
+# modules/graphql.py
+
+import json
+import logging
+import zstandard
+
+# zstd 幀的魔術數字，用於在缺少 Content-Encoding 標頭時 (例如 HAR 或目錄中的原始檔案) 判斷壓縮格式
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def safe_get(data, keys, default=None):
+    """安全地從巢狀字典中獲取值。"""
+    for key in keys:
+        if not isinstance(data, dict):
+            return default
+        data = data.get(key)
+    return data if data is not None else default
+
+def decode_body(body: bytes, content_encoding: str = '', dctx=None) -> dict:
+    """
+    將 GraphQL 回應的原始 body 解碼為 JSON 物件。
+    只要標頭標示為 zstd 或 body 以 zstd 魔術數字開頭，便先解壓縮。
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if 'zstd' in (content_encoding or '') or body[:4] == ZSTD_MAGIC:
+        dctx = dctx or zstandard.ZstdDecompressor()
+        body = dctx.decompress(body)
+    return json.loads(body.decode('utf-8'))
+
+# 首頁動態、使用者個人頁與搜尋結果的回應中，貼文 edges 所在的根欄位
+EDGE_ROOTS = ('feedData', 'mediaData', 'search_results')
+
+def extract_edges(data: dict) -> list:
+    """從首頁動態、使用者個人頁或搜尋結果的回應中取出貼文 edges。"""
+    for root in EDGE_ROOTS:
+        edges = safe_get(data, ('data', root, 'edges'))
+        if edges:
+            return edges
+    return []
+
+def extract_page_info(data: dict) -> tuple[str | None, bool]:
+    """取出分頁資訊，返回 (end_cursor, has_next_page)。"""
+    for root in EDGE_ROOTS:
+        page_info = safe_get(data, ('data', root, 'page_info'))
+        if page_info:
+            return page_info.get('end_cursor'), bool(page_info.get('has_next_page'))
+    return None, False
+
+def iter_posts(edges):
+    """遍歷 edges 中每一個 thread item 的 post 物件。"""
+    for edge in edges:
+        thread_items = safe_get(edge, ('node', 'text_post_app_thread', 'thread_items'), [])
+        for item in thread_items:
+            post = item.get('post')
+            if post:
+                yield post
+
+def compact_post(post: dict) -> dict:
+    """
+    將完整的 post 物件縮減為篩選與 add_video_entry 所需的精簡紀錄。
+    videos 為 (video_index, video_url) 清單，索引沿用貼文本身 + 輪播媒體的順序。
+    """
+    all_media = [post] + (post.get('carousel_media') or [])
+    videos = [
+        (video_index, media['video_versions'][0]['url'])
+        for video_index, media in enumerate(all_media, 1)
+        if media.get('video_versions')
+    ]
+    return {
+        'pk': post.get('pk'),
+        'code': post.get('code'),
+        'author': safe_get(post, ('user', 'username')),
+        'caption': safe_get(post, ('caption', 'text'), ""),
+        'like_count': post.get('like_count', 0),
+        'comment_count': safe_get(post, ('text_post_app_info', 'direct_reply_count'), 0),
+        'taken_at': post.get('taken_at', 0),
+        'videos': videos,
+    }
+
+def iter_post_records(edges):
+    """將 edges 轉為精簡貼文紀錄。"""
+    for post in iter_posts(edges):
+        yield compact_post(post)
+
+class PostFilter:
+    """
+    貼文的互動與下載篩選管線。
+    持有單次運行的狀態 (已處理的貼文、已蒐集的影片)，不依賴任何瀏覽器會話，
+    因此可同時被即時爬蟲與離線重播 (replay) 共用。輸入為 compact_post 產生的精簡紀錄。
+    """
+
+    def __init__(self, like_threshold: int, download_threshold: int, liked_post_ids: set,
+                 like_handler=None, audit_sink=None, lang_strings: dict | None = None, on_videos=None):
+        self.like_threshold = like_threshold
+        self.download_threshold = download_threshold
+        self.liked_post_ids = liked_post_ids
+        # like_handler(record) -> bool | None；返回 None 代表已交給非同步執行器排隊 (例如 LikeExecutor)，
+        # 為 None 時只統計達標貼文而不實際按讚
+        self.like_handler = like_handler
+        # audit_sink 為 modules.audit.AuditSink (或相容物件)，為 None 時不記錄決策事件
+        self.audit_sink = audit_sink
+        self.lang_strings = lang_strings or {}
+        # on_videos(videos) 在每則貼文有新影片被接受時立即呼叫 (例如交給 DownloadPipeline 開始下載)
+        self.on_videos = on_videos
+
+        self.scraped_videos = []
+        self.processed_post_ids = set() # 用於在單次運行中避免重複解析同一個 post
+        self._video_keys = set()
+        self.posts_seen = 0
+        self.like_candidates = 0
+
+    def process_edges(self, edges) -> list[dict]:
+        """處理一批原始 edges，返回本批新加入待下載清單的影片。"""
+        return self.process_records(iter_post_records(edges))
+
+    def process_records(self, records) -> list[dict]:
+        """處理一批精簡貼文紀錄，返回本批新加入待下載清單的影片。"""
+        if self.like_threshold != -1 and hasattr(self.liked_post_ids, 'prefetch'):
+            # 以資料庫為後端的按讚紀錄 (modules.membership) 先一次查詢整批，避免逐則貼文查詢
+            records = list(records)
+            self.liked_post_ids.prefetch(record['pk'] for record in records if record['pk'])
+        new_videos = []
+        for record in records:
+            self.posts_seen += 1
+            new_videos.extend(self.process_record(record))
+        return new_videos
+
+    def process_record(self, record: dict) -> list[dict]:
+        """對單一貼文執行按讚決策與下載篩選。"""
+        main_post_id = record['pk']
+        if not main_post_id or main_post_id in self.processed_post_ids:
+            self._audit(record, 'duplicate' if main_post_id else 'invalid')
+            return []
+
+        like_count = record['like_count']
+        like_decision = None
+
+        # --- V5 按讚決策邏輯 ---
+        if self.like_threshold != -1 and like_count >= self.like_threshold:
+            if main_post_id not in self.liked_post_ids:
+                self.like_candidates += 1
+                like_decision = 'like_candidate'
+                if self.like_handler:
+                    logging.info(self.lang_strings.get('liking_post', "[互動] 貼文 {post_id} 讚數 ({like_count}) 已達門檻 ({threshold})，準備呼叫 API 按讚...").format(post_id=main_post_id, like_count=like_count, threshold=self.like_threshold))
+                    outcome = self.like_handler(record)
+                    if outcome is None:
+                        # 已排入佇列，同一次運行中不再重複提交
+                        self.liked_post_ids.add(main_post_id)
+                        like_decision = 'like_queued'
+                    elif outcome:
+                        self.liked_post_ids.add(main_post_id)
+                        like_decision = 'liked'
+                    else:
+                        like_decision = 'like_failed'
+            else:
+                like_decision = 'already_liked'
+                logging.debug(self.lang_strings.get('post_already_liked', "[互動] 貼文 {post_id} 已存在於按讚紀錄中，跳過。").format(post_id=main_post_id))
+
+        # --- 下載篩選邏輯 (V4.1 - 修正版) ---
+        # 精簡紀錄的 videos 已涵蓋貼文本身與輪播中的所有影片
+        new_videos = []
+        if like_count >= self.download_threshold and record['videos']:
+            logging.info(self.lang_strings.get('collecting_videos', "[篩選] Post ID: {post_id} 讚數 ({like_count}) 已達下載門檻 ({threshold})，蒐集影片中...").format(post_id=main_post_id, like_count=like_count, threshold=self.download_threshold))
+            for video_index, video_url in record['videos']:
+                video_key = (main_post_id, video_index)
+                if video_key in self._video_keys: continue
+                video_data = {
+                    'post_id': main_post_id,
+                    'video_index': video_index,
+                    'post_url': f"https://www.threads.net/t/{record['code']}",
+                    'video_url': video_url,
+                    'author': record['author'],
+                    'caption': record['caption'],
+                    'like_count': like_count,
+                    'comment_count': record['comment_count'],
+                    'timestamp': record['taken_at']
+                }
+                self._video_keys.add(video_key)
+                self.scraped_videos.append(video_data)
+                new_videos.append(video_data)
+                logging.info(self.lang_strings.get('video_added_to_list', "  [+] 已將影片加入待下載清單: {video_id}").format(video_id=f"{main_post_id}-{video_index}"))
+
+        self.processed_post_ids.add(main_post_id)
+        if not record['videos']:
+            decision = 'no_video'
+        elif like_count < self.download_threshold:
+            decision = 'below_threshold'
+        else:
+            decision = 'download' if new_videos else 'already_queued'
+        self._audit(record, decision, like_decision)
+        if new_videos and self.on_videos:
+            self.on_videos(new_videos)
+        return new_videos
+
+    def _audit(self, record: dict, decision: str, like_decision: str | None = None):
+        """黑盒子紀錄器 V2：每則貼文一筆結構化的決策事件。"""
+        if self.audit_sink is None:
+            return
+        self.audit_sink.emit(
+            'post',
+            author=record['author'],
+            pk=record['pk'],
+            like_count=record['like_count'],
+            has_video=bool(record['videos']),
+            decision=decision,
+            like=like_decision,
+        )
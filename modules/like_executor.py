@@ -0,0 +1,131 @@
+# modules/like_executor.py
+
+import math
+import logging
+
+from modules.audit import audit_event
+from modules.db_writer import get_db_writer
+from modules.threads_client import build_graphql_form, build_graphql_headers, LIKE_MUTATION_DOC_ID, LIKE_MUTATION_NAME
+
+LIKE_ENDPOINT = "https://www.threads.net/api/graphql"
+
+# 在瀏覽器中以 concurrency 個 worker 平行送出一批按讚請求。
+# 令牌桶狀態掛在 window 上，因此速率限制會跨批次延續 (同一頁面內)。
+_BATCH_LIKE_JS = """
+const [postIds, form, headers, endpoint, concurrency, rate, burst] = arguments;
+const done = arguments[arguments.length - 1];
+
+const bucket = window.__threadsDlpLikeBucket || (window.__threadsDlpLikeBucket = {tokens: burst, last: performance.now()});
+async function takeToken() {
+    while (true) {
+        const now = performance.now();
+        bucket.tokens = Math.min(burst, bucket.tokens + (now - bucket.last) / 1000 * rate);
+        bucket.last = now;
+        if (bucket.tokens >= 1) {
+            bucket.tokens -= 1;
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, (1 - bucket.tokens) / rate * 1000));
+    }
+}
+
+const results = {};
+let next = 0;
+async function worker() {
+    while (next < postIds.length) {
+        const postId = postIds[next++];
+        await takeToken();
+        try {
+            const body = new URLSearchParams(form);
+            body.set("variables", JSON.stringify({mediaID: postId}));
+            const response = await fetch(endpoint, {headers: headers, body: body, method: "POST"});
+            const error = response.ok ? null : (await response.text()).slice(0, 200);
+            results[postId] = {success: response.ok, status: response.status, error: error};
+        } catch (e) {
+            results[postId] = {success: false, status: null, error: e.toString()};
+        }
+    }
+}
+
+Promise.all(Array.from({length: Math.max(1, Math.min(concurrency, postIds.length))}, worker))
+    .then(() => done(results))
+    .catch(e => done({__error: e.toString()}));
+"""
+
+class LikeExecutor:
+    """
+    批次、限速的按讚執行器。
+    篩選管線只把按讚決策放進佇列 (submit)，在每次滾動的邊界 (flush) 才以單一 execute_async_script
+    在瀏覽器中平行送出整批請求 (受 concurrency 與令牌桶速率限制)，成功的按讚交給寫回寫入器在背景寫入 liked_posts，
+    close 時等待寫入完成。
+    selenium 的 driver 不是執行緒安全的，因此 flush 必須由持有 driver 的執行緒呼叫。
+    """
+
+    def __init__(self, driver, csrf_token: str, lsd_token: str, batch_size: int = 10, concurrency: int = 3,
+                 rate_per_sec: float = 0.5, burst: int = 3, endpoint: str = LIKE_ENDPOINT):
+        self.driver = driver
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.endpoint = endpoint
+
+        # 表單與標頭每批只序列化一次，variables 由 JS 依貼文逐一替換
+        self.form = build_graphql_form(LIKE_MUTATION_DOC_ID, LIKE_MUTATION_NAME, {}, lsd_token)
+        self.headers = build_graphql_headers(LIKE_MUTATION_NAME, csrf_token, lsd_token)
+
+        self.pending = []
+        self._queued = set()
+        self.succeeded = 0
+        self.failed = 0
+
+    def submit(self, record: dict) -> None:
+        """PostFilter 的 like_handler：只記錄按讚決策，返回 None 代表已排入佇列。"""
+        post_id = record['pk']
+        if post_id not in self._queued:
+            self._queued.add(post_id)
+            self.pending.append(post_id)
+
+    def _script_timeout(self, count: int) -> float:
+        # 令牌桶最壞情況下需要 (count - burst) / rate 秒，再加上請求本身的時間
+        return max(30.0, math.ceil(max(0, count - self.burst) / self.rate_per_sec) + 30.0)
+
+    def _run_batch(self, post_ids: list[str]) -> dict:
+        self.driver.set_script_timeout(self._script_timeout(len(post_ids)))
+        return self.driver.execute_async_script(
+            _BATCH_LIKE_JS, post_ids, self.form, self.headers, self.endpoint,
+            self.concurrency, self.rate_per_sec, self.burst
+        ) or {}
+
+    def flush(self) -> int:
+        """送出所有待處理的按讚，返回本次成功的數量。"""
+        succeeded = []
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            logging.info(f"[API] 正在批次送出 {len(batch)} 個按讚請求...")
+            try:
+                results = self._run_batch(batch)
+            except Exception as e:
+                logging.error(f"[API] 執行批次按讚的 JavaScript 時發生嚴重錯誤: {e}")
+                results = {'__error': str(e)}
+
+            batch_error = results.get('__error')
+            for post_id in batch:
+                result = results.get(post_id) or {'success': False, 'status': None, 'error': batch_error or '未知錯誤'}
+                if result.get('success'):
+                    succeeded.append(post_id)
+                    audit_event('like', pk=post_id, success=True, status=result.get('status'))
+                else:
+                    self.failed += 1
+                    logging.error(f"[API] Post ID: {post_id} 按讚失敗。伺服器回應: {result.get('error')}")
+                    audit_event('like', pk=post_id, success=False, status=result.get('status'), error=str(result.get('error'))[:200])
+
+        if succeeded:
+            get_db_writer().add_liked_posts(succeeded, on_error=lambda e: logging.error(f"[DB] 寫入按讚紀錄失敗: {e}"))
+            logging.info(f"[API] 批次按讚完成，成功 {len(succeeded)} 個。")
+        self.succeeded += len(succeeded)
+        return len(succeeded)
+
+    def close(self):
+        self.flush()
+        get_db_writer().flush()
@@ -0,0 +1,112 @@
+# modules/membership.py
+
+import threading
+from collections import OrderedDict
+
+from modules.database import get_db_connection
+
+# 單一 IN 查詢的參數上限 (低於 SQLite 預設的 SQLITE_MAX_VARIABLE_NUMBER)；更大的批次改用暫存表 JOIN
+IN_CHUNK_SIZE = 500
+DEFAULT_CACHE_SIZE = 65536
+
+class DBMembership:
+    """
+    以資料表主鍵查詢實作的集合，取代啟動時把整張表載入 Python set 的做法。
+    `key in membership` 先查有界的 LRU 快取，未命中時以主鍵查詢 SQLite；
+    prefetch / filter_existing 以 IN 或暫存表 JOIN 一次檢查整批候選。
+    add 只記錄在本次運行中 (例如已排入佇列的按讚)，不會寫入資料庫。
+    記憶體用量只與快取大小與本次新增的數量有關，不隨歷史資料成長。
+    可被 pickle 傳給工作進程 (只傳遞資料表設定與本次新增的鍵，各進程使用自己的連接)。
+    """
+
+    def __init__(self, table: str, column: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.table = table
+        self.column = column
+        self.cache_size = cache_size
+        self._added = set()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'table': self.table, 'column': self.column, 'cache_size': self.cache_size, 'added': set(self._added)}
+
+    def __setstate__(self, state):
+        self.__init__(state['table'], state['column'], state['cache_size'])
+        self._added = state['added']
+
+    def copy(self) -> 'DBMembership':
+        clone = DBMembership(self.table, self.column, self.cache_size)
+        clone._added = set(self._added)
+        return clone
+
+    def _remember(self, key, present: bool):
+        # 呼叫端必須持有 self._lock
+        self._cache[key] = present
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            if key in self._added:
+                return True
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        row = get_db_connection().execute(f"SELECT 1 FROM {self.table} WHERE {self.column} = ?", (key,)).fetchone()
+        with self._lock:
+            self._remember(key, row is not None)
+        return row is not None
+
+    def add(self, key):
+        with self._lock:
+            self._added.add(key)
+
+    def __len__(self) -> int:
+        """資料表中的列數加上本次新增的鍵數 (僅供記錄；新增的鍵若已存在於資料庫會重複計算)。"""
+        count = get_db_connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return count + len(self._added)
+
+    def filter_existing(self, keys) -> set:
+        """返回 keys 中已存在 (資料庫或本次新增) 的鍵；結果同時寫入快取。"""
+        keys = set(keys)
+        with self._lock:
+            found = keys & self._added
+        pending = list(keys - found)
+        if not pending:
+            return found
+
+        conn = get_db_connection()
+        existing = set()
+        if len(pending) <= IN_CHUNK_SIZE * 4:
+            for i in range(0, len(pending), IN_CHUNK_SIZE):
+                chunk = pending[i:i + IN_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                existing.update(row[0] for row in conn.execute(f"SELECT {self.column} FROM {self.table} WHERE {self.column} IN ({placeholders})", chunk))
+        else:
+            # 暫存表只存在於這個連接，JOIN 時走兩邊的主鍵索引
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS membership_probe (key TEXT PRIMARY KEY)")
+            in_transaction = conn.in_transaction
+            try:
+                conn.executemany("INSERT OR IGNORE INTO temp.membership_probe (key) VALUES (?)", [(key,) for key in pending])
+                existing.update(row[0] for row in conn.execute(f"SELECT p.key FROM temp.membership_probe p JOIN {self.table} t ON t.{self.column} = p.key"))
+            finally:
+                conn.execute("DELETE FROM temp.membership_probe")
+                # 不要提交呼叫端 (transaction()) 尚未完成的交易
+                if not in_transaction:
+                    conn.commit()
+
+        with self._lock:
+            for key in pending:
+                self._remember(key, key in existing)
+        return found | existing
+
+    def prefetch(self, keys):
+        """預先以一次批次查詢載入 keys 的結果，讓之後逐一的 `in` 檢查直接命中快取。"""
+        self.filter_existing(keys)
+
+def existing_video_ids() -> DBMembership:
+    return DBMembership('videos', 'video_id')
+
+def liked_post_ids() -> DBMembership:
+    return DBMembership('liked_posts', 'post_id')
@@ -0,0 +1,148 @@
+# modules/multi_target.py
+
+import os
+import time
+import logging
+import multiprocessing
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.scraper import scrape_videos
+from modules.feed_client import fetch_videos
+
+SEARCH_PREFIXES = ('search:', 'q:')
+
+def parse_target(spec) -> dict | None:
+    """
+    將單一目標設定轉為 {'username', 'search', 'label'}。
+    接受字串 ("nasa"、"@nasa"、"search:cute cats"、"q:cute cats") 或 config.json 中的
+    {"user": "nasa"} / {"search": "cute cats"} 物件；空值返回 None。
+    """
+    if isinstance(spec, dict):
+        username = (spec.get('user') or spec.get('username') or '').strip().lstrip('@') or None
+        search = (spec.get('search') or '').strip() or None
+    else:
+        spec = str(spec).strip()
+        username, search = None, None
+        for prefix in SEARCH_PREFIXES:
+            if spec.lower().startswith(prefix):
+                search = spec[len(prefix):].strip() or None
+                break
+        else:
+            username = spec.lstrip('@') or None
+    if search:
+        return {'username': None, 'search': search, 'label': f"search:{search}"}
+    if username:
+        return {'username': username, 'search': None, 'label': f"@{username}"}
+    return None
+
+def parse_targets(specs) -> list[dict]:
+    """解析目標清單 (可為逗號分隔字串或清單)，並依 label 去除重複的目標。"""
+    if not specs:
+        return []
+    if isinstance(specs, str):
+        specs = specs.split(',')
+    targets = []
+    labels = set()
+    for spec in specs:
+        target = parse_target(spec)
+        if target and target['label'] not in labels:
+            labels.add(target['label'])
+            targets.append(target)
+    return targets
+
+def target_url(target: dict) -> str:
+    if target['search']:
+        return f"https://www.threads.net/search?q={quote(target['search'])}"
+    if target['username']:
+        return f"https://www.threads.net/@{target['username']}"
+    return "https://www.threads.net/"
+
+def _target_capture_path(capture_path: str | None, index: int) -> str | None:
+    """每個工作進程寫入自己的封存檔，避免多個進程同時附加同一個 JSONL 檔。"""
+    if not capture_path:
+        return None
+    root, ext = os.path.splitext(capture_path)
+    return f"{root}.{index}{ext or '.jsonl'}"
+
+def _scrape_target(index: int, target: dict, options: dict) -> dict:
+    """在工作進程中執行單一目標的爬取 (各自啟動並關閉自己的瀏覽器)。"""
+    logging.basicConfig(level=options['log_level'], format=f"%(asctime)s - %(levelname)s - [{target['label']}] %(message)s", datefmt='%Y-%m-%d %H:%M:%S')
+    if options['log_level'] != logging.DEBUG:
+        logging.getLogger('seleniumwire').setLevel(logging.WARNING)
+        logging.getLogger('webdriver_manager').setLevel(logging.WARNING)
+
+    result = {'label': target['label'], 'videos': [], 'elapsed': 0.0, 'error': None}
+    started = time.perf_counter()
+    try:
+        common = dict(
+            like_threshold=options['like_threshold'],
+            download_threshold=options['download_threshold'],
+            liked_post_ids=options['liked_post_ids'].copy(),
+            continuous=options['continuous'],
+            language=options['language'],
+            capture_path=_target_capture_path(options['capture_path'], index),
+        )
+        if options['engine'] == 'http':
+            result['videos'] = fetch_videos(
+                target_username=target['username'],
+                search_query=target['search'],
+                page_count=options['scroll_count'],
+                doc_ids=options['doc_ids'],
+                **common
+            )
+        else:
+            result['videos'] = scrape_videos(
+                url=target_url(target),
+                scroll_count=options['scroll_count'],
+                pacing=options['pacing'],
+                lean=options.get('lean', False),
+                session_slot=f"worker-{index}",
+                **common
+            )
+    except Exception as e:
+        result['error'] = str(e)
+        logging.error(f"[Multi] {target['label']} 執行失敗: {e}")
+    result['elapsed'] = time.perf_counter() - started
+    return result
+
+def run_targets(targets: list[dict], max_workers: int, options: dict) -> list[dict]:
+    """
+    以有界的進程池平行爬取多個目標，返回與 targets 同順序的結果清單。
+    options 為所有目標共用的爬取參數 (門檻、引擎、滾動次數等)，必須可被 pickle。
+    工作進程以 spawn 啟動：父進程已有下載、寫回與稽核的背景執行緒，fork 會繼承它們持有的鎖卻沒有執行緒本身。
+    """
+    max_workers = max(1, min(max_workers, len(targets)))
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(_scrape_target, index, target, options) for index, target in enumerate(targets)]
+        results = []
+        for target, future in zip(targets, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # 工作進程異常終止 (例如瀏覽器耗盡記憶體) 時，只影響該目標
+                logging.error(f"[Multi] {target['label']} 的工作進程異常終止: {e}")
+                results.append({'label': target['label'], 'videos': [], 'elapsed': 0.0, 'error': str(e)})
+    return results
+
+def merge_candidates(results: list[dict], existing_video_ids: set) -> list[dict]:
+    """
+    依目標順序合併各進程的候選影片，並對資料庫與其他目標去除重複。
+    每個結果會補上 candidates、new 與 duplicates 統計供最後報告使用。
+    """
+    merged = []
+    seen = set()
+    if hasattr(existing_video_ids, 'prefetch'):
+        existing_video_ids.prefetch(f"{video.get('post_id')}-{video.get('video_index', 1)}" for result in results for video in result['videos'])
+    for result in results:
+        result['candidates'] = len(result['videos'])
+        result['new'] = 0
+        for video in result['videos']:
+            video_id = f"{video.get('post_id')}-{video.get('video_index', 1)}"
+            if video_id in existing_video_ids or video_id in seen:
+                continue
+            seen.add(video_id)
+            merged.append(video)
+            result['new'] += 1
+        result['duplicates'] = result['candidates'] - result['new']
+    return merged
@@ -0,0 +1,112 @@
+# modules/pacing.py
+
+import time
+
+PACING_MODES = ('fixed', 'adaptive')
+
+# 瀏覽器預設只保留 250 筆 resource timing，滾動幾次就會塞滿，導致無法再觀察到新的網路活動
+_RESOURCE_COUNT_JS = """
+if (!window.__threadsDlpTimingBuffer) {
+    performance.setResourceTimingBufferSize(100000);
+    window.__threadsDlpTimingBuffer = true;
+}
+return performance.getEntriesByType('resource').length;
+"""
+
+class ScrollPacer:
+    """
+    滾動節奏控制器。
+    'fixed' 模式維持原本每次滾動後固定等待的行為；
+    'adaptive' 模式在 [min_wait, max_wait] 之間等待 (max_wait 預設等於該次的固定等待秒數)，直到有新的 GraphQL 回應抵達並穩定下來，
+    或瀏覽器的網路活動完全靜止為止；連續 stall_limit 次滾動都沒有帶來新貼文時建議提前結束。
+    """
+
+    def __init__(self, mode: str = 'fixed', fixed_delay: float = 4.0, min_wait: float = 0.5,
+                 max_wait: float | None = None, idle_window: float = 0.75, stall_limit: int = 3,
+                 poll_interval: float = 0.1):
+        if mode not in PACING_MODES:
+            raise ValueError(f"未知的滾動節奏模式: {mode}")
+        self.mode = mode
+        self.fixed_delay = fixed_delay
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.idle_window = idle_window
+        self.stall_limit = stall_limit
+        self.poll_interval = poll_interval
+
+        self.waits = 0
+        self.time_waited = 0.0
+        self.baseline = 0.0
+        self.stalled_scrolls = 0
+
+    @property
+    def time_saved(self) -> float:
+        """相較於固定等待所節省的秒數。"""
+        return self.baseline - self.time_waited
+
+    def _resource_count(self, driver) -> int:
+        try:
+            return driver.execute_script(_RESOURCE_COUNT_JS) or 0
+        except Exception:
+            return 0
+
+    def wait(self, driver, stream, fixed_delay: float | None = None) -> float:
+        """
+        在一次滾動或頁面導航後等待，返回實際等待的秒數。
+        stream 為 modules.capture.GraphQLResponseStream，用來判斷是否有新的 GraphQL 回應。
+        """
+        fixed_delay = self.fixed_delay if fixed_delay is None else fixed_delay
+        started = time.monotonic()
+        if self.mode == 'fixed':
+            time.sleep(fixed_delay)
+        else:
+            responses_before = stream.responses
+            resources = self._resource_count(driver)
+            last_activity = started
+            max_wait = fixed_delay if self.max_wait is None else min(self.max_wait, fixed_delay)
+            max_wait = max(self.min_wait, max_wait)
+            while True:
+                now = time.monotonic()
+                elapsed = now - started
+                if elapsed >= max_wait:
+                    break
+
+                current = self._resource_count(driver)
+                if current != resources:
+                    resources = current
+                    last_activity = now
+                if stream.last_response_at and stream.last_response_at > last_activity:
+                    last_activity = stream.last_response_at
+
+                if elapsed >= self.min_wait:
+                    quiet = now - last_activity
+                    # 新的 GraphQL 回應已抵達並穩定下來
+                    if stream.responses > responses_before and quiet >= self.idle_window:
+                        break
+                    # 尚無新回應，但網路已完全靜止 (進行中的請求不會出現在 resource timing，因此要求更長的靜止時間)
+                    if quiet >= self.idle_window * 2:
+                        break
+                time.sleep(self.poll_interval)
+
+        waited = time.monotonic() - started
+        self.waits += 1
+        self.time_waited += waited
+        self.baseline += fixed_delay
+        return waited
+
+    def record_scroll(self, new_posts: int) -> bool:
+        """記錄一次滾動帶來的新貼文數；adaptive 模式下連續無新貼文達上限時返回 True。"""
+        if new_posts > 0:
+            self.stalled_scrolls = 0
+            return False
+        self.stalled_scrolls += 1
+        return self.mode == 'adaptive' and self.stall_limit > 0 and self.stalled_scrolls >= self.stall_limit
+
+    def summary(self) -> dict:
+        return {
+            'mode': self.mode,
+            'waits': self.waits,
+            'waited': self.time_waited,
+            'baseline': self.baseline,
+            'saved': self.time_saved,
+        }
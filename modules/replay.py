@@ -0,0 +1,111 @@
+# modules/replay.py
+
+import os
+import json
+import time
+import base64
+import logging
+
+from modules.graphql import PostFilter
+from modules.extractor import iter_records_from_body
+
+GRAPHQL_URL_MARKER = 'graphql/query'
+
+def append_capture(archive_path: str, url: str, content_encoding: str, body: bytes):
+    """將一筆 GraphQL 原始回應附加到 JSONL 封存檔，供日後離線重播。"""
+    record = {
+        'url': url,
+        'encoding': content_encoding or '',
+        'captured_at': time.time(),
+        'body': base64.b64encode(body).decode('ascii'),
+    }
+    with open(archive_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+
+def _iter_jsonl(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                yield record.get('url', ''), record.get('encoding', ''), base64.b64decode(record['body'])
+            except (json.JSONDecodeError, KeyError, ValueError) as e:
+                logging.warning(f"[Replay] 略過 {path} 第 {line_no} 行: {e}")
+
+def _iter_har(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        har = json.load(f)
+    for entry in har.get('log', {}).get('entries', []):
+        url = entry.get('request', {}).get('url', '')
+        if GRAPHQL_URL_MARKER not in url:
+            continue
+        content = entry.get('response', {}).get('content', {})
+        text = content.get('text')
+        if not text:
+            continue
+        if content.get('encoding') == 'base64':
+            body = base64.b64decode(text)
+        else:
+            body = text.encode('utf-8')
+        # 瀏覽器匯出的 HAR 通常已解壓縮，真正的格式由 decode_body 依魔術數字判斷
+        yield url, '', body
+
+def _iter_directory(path: str):
+    for name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, name)
+        if os.path.isdir(file_path):
+            continue
+        if name.endswith(('.jsonl', '.har')):
+            yield from iter_captured_responses(file_path)
+        elif name.endswith(('.zst', '.json', '.bin')):
+            with open(file_path, 'rb') as f:
+                yield file_path, '', f.read()
+
+def iter_captured_responses(path: str):
+    """
+    從目錄、HAR 檔或 JSONL 封存檔中逐一產出 (url, content_encoding, body)。
+    目錄中的 .zst/.json/.bin 檔案被視為單一回應的原始 body。
+    """
+    if os.path.isdir(path):
+        yield from _iter_directory(path)
+    elif path.endswith('.har'):
+        yield from _iter_har(path)
+    elif path.endswith('.jsonl'):
+        yield from _iter_jsonl(path)
+    else:
+        with open(path, 'rb') as f:
+            yield path, '', f.read()
+
+def replay_videos(path: str, like_threshold: int, download_threshold: int, liked_post_ids: set | None = None, lang_strings: dict | None = None) -> tuple[list[dict], dict]:
+    """
+    對已捕獲的 GraphQL 回應離線重跑篩選管線，不啟動瀏覽器也不存取網路。
+    返回 (video_data 清單, 統計資訊)。
+    """
+    post_filter = PostFilter(
+        like_threshold=like_threshold,
+        download_threshold=download_threshold,
+        liked_post_ids=liked_post_ids.copy() if liked_post_ids is not None else set(),
+        lang_strings=lang_strings
+    )
+    stats = {'responses': 0, 'errors': 0, 'bytes': 0}
+
+    started = time.perf_counter()
+    for url, content_encoding, body in iter_captured_responses(path):
+        stats['responses'] += 1
+        stats['bytes'] += len(body)
+        try:
+            records = list(iter_records_from_body(body, content_encoding))
+        except Exception as e:
+            stats['errors'] += 1
+            logging.error(f"[Replay] 解析 {url} 時發生錯誤: {e}")
+            continue
+        post_filter.process_records(records)
+    stats['elapsed'] = time.perf_counter() - started
+
+    stats['posts'] = post_filter.posts_seen
+    stats['unique_posts'] = len(post_filter.processed_post_ids)
+    stats['like_candidates'] = post_filter.like_candidates
+    stats['videos'] = len(post_filter.scraped_videos)
+    return post_filter.scraped_videos, stats
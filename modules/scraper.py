@@ -1,18 +1,19 @@
 import os
-import time
 import json
-import zstandard
 import logging
+from contextlib import nullcontext, ExitStack
 from datetime import datetime
 from dotenv import load_dotenv
-from seleniumwire import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
 
 # 匯入新功能所需的模組
-from modules.threads_client import like_post, get_like_tokens
-from modules.database import add_liked_post
+from modules.threads_client import get_like_tokens
+from modules.like_executor import LikeExecutor
+from modules.graphql import PostFilter
+from modules.capture import GraphQLResponseStream
+from modules.browser import create_driver, bootstrap_session, apply_lean_mode, TrafficMeter
+from modules.session_cache import get_session_cache
+from modules.audit import get_audit_sink
+from modules.pacing import ScrollPacer
 
 def load_language_strings(language='zh-TW') -> dict:
     """從 languages.json 載入指定語言的字串。"""
@@ -28,18 +29,18 @@ def load_language_strings(language='zh-TW') -> dict:
         logging.error("語言檔案 languages.json 遺失或格式錯誤。")
         return {}
 
-def safe_get(data, keys, default=None):
-    """安全地從巢狀字典中獲取值。"""
-    for key in keys:
-        if not isinstance(data, dict):
-            return default
-        data = data.get(key)
-    return data if data is not None else default
-
-def scrape_videos(url: str, scroll_count: int, like_threshold: int, download_threshold: int, liked_post_ids: set, continuous: bool = False, language: str = 'zh-TW') -> list[dict]:
+def scrape_videos(url: str, scroll_count: int, like_threshold: int, download_threshold: int, liked_post_ids: set, continuous: bool = False, language: str = 'zh-TW', capture_path: str | None = None, pacing: str = 'fixed', driver=None, like_tokens: tuple | None = None, lean: bool = False, session_slot: str = 'default', on_videos=None) -> list[dict]:
     """
     [生產模式 V5 - API 模擬版]
-    遍歷 GraphQL API 數據，當讚數達標時，呼叫 like_post 函式模擬按讚請求。
+    遍歷 GraphQL API 數據，當讚數達標時，將按讚決策交給 LikeExecutor，於每次滾動後批次送出。
+    若指定 capture_path，所有 GraphQL 原始回應會另存為 JSONL 封存檔，供 `main.py --replay` 離線重播。
+    pacing 為 'fixed' (固定等待) 或 'adaptive' (依網路活動等待，並在連續滾動無新貼文時提前結束)。
+    若注入 driver (例如來自 BrowserPool)，則視為已登入並跳過啟動與 Cookie 驗證，結束時也不會關閉它；
+    like_tokens 為該 driver 對應的 (csrf_token, lsd_token)。
+    lean 為 True 時啟用精簡瀏覽模式：瀏覽器內直接中止圖片、影片片段、字型與分析請求。
+    自行啟動瀏覽器時使用 session_slot 對應的持久化設定檔與權杖快取 (平行執行的爬蟲必須使用不同的 slot)；
+    該設定檔正被另一個進程使用時改用暫存設定檔並完整登入。
+    on_videos 會在每則貼文的影片被接受時立即收到該批影片，讓下載與滾動同時進行。
     """
     lang_strings = load_language_strings(language)
     
@@ -50,66 +51,97 @@ def scrape_videos(url: str, scroll_count: int, like_threshold: int, download_thr
         except OSError as e:
             logging.warning(lang_strings.get('cleanup_failed', "[Scraper] 刪除舊的暫存檔失敗: {error}").format(error=e))
 
-    load_dotenv()
-    session_cookie = os.getenv("THREADS_SESSION_COOKIE")
-    if not session_cookie:
-        logging.error(lang_strings.get('no_cookie', "錯誤：請在 .env 檔案中設定 THREADS_SESSION_COOKIE。"))
-        return []
+    owns_driver = driver is None
+    if owns_driver:
+        load_dotenv()
+        session_cookie = os.getenv("THREADS_SESSION_COOKIE")
+        if not session_cookie:
+            logging.error(lang_strings.get('no_cookie', "錯誤：請在 .env 檔案中設定 THREADS_SESSION_COOKIE。"))
+            return []
 
     logging.info(lang_strings.get('scraper_start', "正在啟動爬蟲 (V5 API 模擬引擎)..."))
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-
-    service = ChromeService(ChromeDriverManager().install())
     
-    with webdriver.Chrome(service=service, options=chrome_options) as driver:
+    audit_sink = get_audit_sink()
+    pacer = ScrollPacer(mode=pacing)
+
+    # 串流捕獲：GraphQL 回應一抵達就解析，其餘流量不再進入 selenium-wire 的儲存區
+    stream = GraphQLResponseStream(capture_path=capture_path)
+
+    traffic = TrafficMeter()
+
+    session_cache = get_session_cache(slot=session_slot) if owns_driver else None
+
+    with ExitStack() as stack:
+        # 設定檔在瀏覽器關閉後才釋放 (ExitStack 以相反順序退出)
+        profile_dir = stack.enter_context(session_cache.profile()) if session_cache else None
+        if profile_dir is None:
+            session_cache = None
+        driver = stack.enter_context(create_driver(lean=lean, profile_dir=profile_dir) if owns_driver else nullcontext(driver))
+        stream.attach(driver)
+        if lean and not owns_driver:
+            apply_lean_mode(driver)
         scraped_videos = []
-        processed_post_ids = set() # 用於在單次運行中避免重複解析同一個 post
         
         # --- V5 新增：權杖儲存 ---
         csrf_token = None
         lsd_token = None
         can_like_posts = False
+        like_executor = None
 
         try:
-            logging.info(lang_strings.get('injecting_cookie', "正在注入 Cookie..."))
-            driver.get("https://www.threads.net/")
-            driver.add_cookie({'name': 'sessionid', 'value': session_cookie})
-            driver.refresh()
-            time.sleep(5)
-
-            # --- V5 新增：Cookie 有效性驗證 ---
-            logging.info(lang_strings.get('validating_cookie', "正在驗證 Cookie 有效性..."))
-            page_title = driver.title.lower()
-            if 'log in' in page_title or '登入' in page_title:
-                error_message = lang_strings.get('cookie_invalid', "Cookie 已失效或無效，請更新您的 .env 檔案中的 THREADS_SESSION_COOKIE。")
-                logging.critical(error_message)
-                raise ValueError(error_message)
-            logging.info(lang_strings.get('cookie_valid', "Cookie 驗證成功，帳號已登入。"))
-            # --- 驗證結束 ---
-
-            # --- V5 新增：獲取按讚權杖 ---
-            csrf_token, lsd_token = get_like_tokens(driver)
+            # --- V5 新增：Cookie 注入與有效性驗證、獲取按讚權杖 (優先沿用快取的登入狀態) ---
+            if owns_driver:
+                csrf_token, lsd_token = bootstrap_session(driver, session_cookie, session_cache, lang_strings)
+            elif like_tokens:
+                csrf_token, lsd_token = like_tokens
+            else:
+                csrf_token, lsd_token = get_like_tokens(driver.page_source)
             if csrf_token and lsd_token:
                 can_like_posts = True
             else:
                 logging.warning(lang_strings.get('like_token_failed', "無法獲取按讚權杖，按讚功能將被停用。"))
             # --- 權杖獲取結束 ---
 
+            like_executor = LikeExecutor(driver, csrf_token, lsd_token) if can_like_posts else None
+
+            post_filter = PostFilter(
+                like_threshold=like_threshold,
+                download_threshold=download_threshold,
+                liked_post_ids=liked_post_ids,
+                like_handler=like_executor.submit if like_executor else None,
+                audit_sink=audit_sink,
+                lang_strings=lang_strings,
+                on_videos=on_videos
+            )
+            scraped_videos = post_filter.scraped_videos
+
             logging.info(lang_strings.get('navigating_to_url', "\n正在導航至目標頁面: {url}").format(url=url))
             driver.get(url)
             logging.info(lang_strings.get('waiting_page_load', "等待頁面載入..."))
-            time.sleep(5)
+            pacer.wait(driver, stream, fixed_delay=5)
 
             total_scrolls = 0
             MAX_TOTAL_SCROLLS = 100
 
+            def consume_stream() -> int:
+                """取出串流佇列中已解析的貼文紀錄並立即交給篩選管線。"""
+                post_count = 0
+                for records in stream.drain():
+                    post_count += len(records)
+                    post_filter.process_records(records)
+                # 解析完成後才送出本輪累積的按讚，避免單一緩慢的請求阻塞解析
+                if like_executor:
+                    like_executor.flush()
+                # 回應已由攔截器處理完畢，釋放 selenium-wire 的儲存空間
+                del driver.requests
+                traffic.collect(driver)
+                return post_count
+
+            stalled = False
             while True:
                 current_scroll_target = scroll_count if not continuous else 3
+                responses_before = stream.responses
+                batch_posts = consume_stream()
                 logging.info(lang_strings.get('scrolling_page', "開始滾動頁面 ({count} 次)...").format(count=current_scroll_target))
                 for i in range(current_scroll_target):
                     if total_scrolls >= MAX_TOTAL_SCROLLS:
@@ -118,120 +150,33 @@ def scrape_videos(url: str, scroll_count: int, like_threshold: int, download_thr
                     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
                     total_scrolls += 1
                     logging.info(lang_strings.get('scroll_progress', "  滾動 {current}/{total}...").format(current=total_scrolls, total=MAX_TOTAL_SCROLLS if continuous else scroll_count))
-                    time.sleep(4)
-                
-                if total_scrolls >= MAX_TOTAL_SCROLLS:
-                    break
+                    pacer.wait(driver, stream)
+                    known_posts = len(post_filter.processed_post_ids)
+                    batch_posts += consume_stream()
+                    if pacer.record_scroll(len(post_filter.processed_post_ids) - known_posts):
+                        logging.info(lang_strings.get('pacing_stalled', "連續 {count} 次滾動都沒有新的貼文，提前結束滾動。").format(count=pacer.stalled_scrolls))
+                        stalled = True
+                        break
 
                 logging.info(lang_strings.get('analysis_start', "\n--- 分析開始：解析所有捕獲的 GraphQL 數據包 ---"))
-                target_requests = [r for r in driver.requests if 'graphql/query' in r.url and r.response and 'zstd' in r.response.headers.get('Content-Encoding', '')]
+                batch_posts += consume_stream()
 
-                if not target_requests:
+                if stream.responses == responses_before and batch_posts == 0:
                     logging.warning(lang_strings.get('no_graphql_requests', "未能捕獲到任何包含貼文數據的 GraphQL API 請求。"))
-                    if continuous and len(scraped_videos) < 5:
+                    if continuous and len(scraped_videos) < 5 and total_scrolls < MAX_TOTAL_SCROLLS and not stalled:
                         continue
                     else:
                         break
 
-                all_posts = []
-                dctx = zstandard.ZstdDecompressor()
-                for request in target_requests:
-                    try:
-                        data = json.loads(dctx.decompress(request.response.body).decode('utf-8'))
-                        edges = safe_get(data, ('data', 'feedData', 'edges')) or safe_get(data, ('data', 'search_results', 'edges'))
-                        if edges: all_posts.extend(edges)
-                    except Exception as e:
-                        logging.error(lang_strings.get('packet_error', "處理數據包時發生錯誤: {error}").format(error=e))
-                del driver.requests[:]
-
                 # --- V5 新增：空數據檢查 ---
-                if not all_posts:
+                if not batch_posts:
                     logging.warning(lang_strings.get('no_posts_parsed', "警告：未能從 API 回應中解析出任何貼文。目標頁面可能沒有內容，或 API 結構已變更。"))
                 # --- 檢查結束 ---
 
-                logging.info(lang_strings.get('parsing_posts', "解析到 {count} 個總貼文項目。開始根據門檻進行互動與篩選...").format(count=len(all_posts)))
-                for edge in all_posts:
-                    thread_items = safe_get(edge, ('node', 'text_post_app_thread', 'thread_items'), [])
-                    for item in thread_items:
-                        post = item.get('post')
-                        if not post: continue
-
-                        # --- 黑盒子紀錄器 V1 ---
-                        try:
-                            log_message = "\n--- 發現貼文 ---\n"
-                            author = safe_get(post, ('user', 'username'), '未知作者')
-                            post_id = post.get('pk', '未知ID')
-                            like_count = post.get('like_count', 0)
-                            caption = safe_get(post, ('caption', 'text'), "").replace('\n', ' ')
-                            
-                            log_message += f"  作者: {author}\n"
-                            log_message += f"  ID: {post_id}\n"
-                            log_message += f"  讚數: {like_count}\n"
-                            log_message += f"  內文: {caption[:80]}...\n"
-
-                            # 檢查影片
-                            video_url = "無"
-                            if post.get('video_versions'):
-                                video_url = post['video_versions'][0]['url']
-                            elif post.get('carousel_media'):
-                                for media in post.get('carousel_media', []):
-                                    if media.get('video_versions'):
-                                        video_url = media['video_versions'][0]['url']
-                                        break # 只記錄第一個找到的影片
-                            
-                            log_message += f"  影片: {'是' if video_url != '無' else '否'}\n"
-                            log_message += "-----------------\n"
-
-                            with open("scraped_posts_audit.log", "a", encoding="utf-8") as f:
-                                f.write(log_message)
-                        except Exception as e:
-                            with open("scraped_posts_audit.log", "a", encoding="utf-8") as f:
-                                f.write(f"--- 紀錄貼文時發生錯誤: {e} ---\n")
-                        # --- 黑盒子紀錄器結束 ---
-
-                        main_post_id = post.get('pk')
-                        if not main_post_id or main_post_id in processed_post_ids: continue
-
-                        like_count = post.get('like_count', 0)
-
-                        # --- V5 按讚決策邏輯 ---
-                        if can_like_posts and like_threshold != -1 and like_count >= like_threshold:
-                            if main_post_id not in liked_post_ids:
-                                logging.info(lang_strings.get('liking_post', "[互動] 貼文 {post_id} 讚數 ({like_count}) 已達門檻 ({threshold})，準備呼叫 API 按讚...").format(post_id=main_post_id, like_count=like_count, threshold=like_threshold))
-                                if like_post(driver, main_post_id, csrf_token, lsd_token):
-                                    post_url = f"https://www.threads.net/t/{post.get('code')}"
-                                    add_liked_post(main_post_id, post_url)
-                                    liked_post_ids.add(main_post_id)
-                            else:
-                                logging.debug(lang_strings.get('post_already_liked', "[互動] 貼文 {post_id} 已存在於按讚紀錄中，跳過。").format(post_id=main_post_id))
-
-                        # --- 下載篩選邏輯 (V4.1 - 修正版) ---
-                        # 檢查貼文本身或輪播中是否包含任何影片
-                        has_video_in_post = post.get('video_versions') or any(media.get('video_versions') for media in post.get('carousel_media', []) or [])
-
-
-                        if like_count >= download_threshold and has_video_in_post:
-                            logging.info(lang_strings.get('collecting_videos', "[篩選] Post ID: {post_id} 讚數 ({like_count}) 已達下載門檻 ({threshold})，蒐集影片中...").format(post_id=main_post_id, like_count=like_count, threshold=download_threshold))
-                            all_media = [post] + (post.get('carousel_media') or [])
-                            for video_index, media in enumerate(all_media, 1):
-                                if not media.get('video_versions'): continue
-                                video_data = {
-                                    'post_id': main_post_id,
-                                    'video_index': video_index,
-                                    'post_url': f"https://www.threads.net/t/{post.get('code')}",
-                                    'video_url': media['video_versions'][0]['url'],
-                                    'author': post.get('user', {}).get('username'),
-                                    'caption': safe_get(post, ('caption', 'text'), ""),
-                                    'like_count': like_count,
-                                    'comment_count': safe_get(post, ('text_post_app_info', 'direct_reply_count'), 0),
-                                    'timestamp': post.get('taken_at', 0)
-                                }
-                                video_unique_id = f"{main_post_id}-{video_index}"
-                                if not any(v['post_id'] == main_post_id and v['video_index'] == video_index for v in scraped_videos):
-                                    scraped_videos.append(video_data)
-                                    logging.info(lang_strings.get('video_added_to_list', "  [+] 已將影片加入待下載清單: {video_id}").format(video_id=video_unique_id))
-                        
-                        processed_post_ids.add(main_post_id)
+                logging.info(lang_strings.get('parsing_posts', "解析到 {count} 個總貼文項目。開始根據門檻進行互動與篩選...").format(count=batch_posts))
+
+                if total_scrolls >= MAX_TOTAL_SCROLLS or stalled:
+                    break
 
                 # --- 檢查是否結束持續模式 ---
                 if continuous and len(scraped_videos) < 5:
@@ -242,7 +187,15 @@ def scrape_videos(url: str, scroll_count: int, like_threshold: int, download_thr
         except Exception as e:
             logging.error(lang_strings.get('scraping_error', "爬取過程中發生錯誤: {error}").format(error=e))
         finally:
-            logging.info(lang_strings.get('session_end', "爬取會話結束，瀏覽器將由上下文管理器自動關閉。"))
-
+            if like_executor:
+                like_executor.close()
+            audit_sink.flush(timeout=5)
+            traffic.collect(driver)
+            if owns_driver:
+                logging.info(lang_strings.get('session_end', "爬取會話結束，瀏覽器將由上下文管理器自動關閉。"))
+
+    logging.info(lang_strings.get('traffic_summary', "[Traffic] 瀏覽器共傳輸 {mb:.2f} MB ({requests} 個請求，封鎖 {blocked} 個)；依類型: {breakdown}").format(**traffic.summary()))
+    pacing_summary = pacer.summary()
+    logging.info(lang_strings.get('pacing_summary', "[Pacing] 模式: {mode}，共等待 {waited:.1f} 秒 ({waits} 次)，相較固定等待節省 {saved:.1f} 秒。").format(**pacing_summary))
     logging.info(lang_strings.get('total_videos_scraped', "\n本次運行共篩選出 {count} 個符合條件的影片。").format(count=len(scraped_videos)))
     return scraped_videos
\ No newline at end of file
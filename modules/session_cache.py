@@ -0,0 +1,139 @@
+# modules/session_cache.py
+
+import os
+import json
+import time
+import hashlib
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_CACHE_DIR = ".session_cache"
+DEFAULT_TOKEN_TTL_HOURS = 12
+
+def _cookie_fingerprint(session_cookie: str) -> str:
+    """只保存 Cookie 的雜湊，用來偵測 .env 中的 Cookie 是否已更換，不把 Cookie 本身寫到磁碟。"""
+    return hashlib.sha256(session_cookie.encode('utf-8')).hexdigest()
+
+class SessionCache:
+    """
+    登入啟動流程的持久化快取。
+    每個 slot 擁有一個 Chrome user-data 目錄 (保存 Cookie 與瀏覽器快取) 與一份權杖檔 (CSRF/LSD 與儲存時間)。
+    同一個 user-data 目錄同時只能被一個 Chrome 使用，因此平行的瀏覽器必須使用不同的 slot；
+    不同進程 (例如同時執行的 CLI 與排程器) 以 claim_profile 的檔案鎖避免開啟同一個設定檔。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, slot: str = 'default', ttl_seconds: float = DEFAULT_TOKEN_TTL_HOURS * 3600):
+        self.cache_dir = cache_dir
+        self.slot = str(slot)
+        self.ttl_seconds = ttl_seconds
+        self._lock_file = None
+
+    @property
+    def profile_dir(self) -> str:
+        path = os.path.abspath(os.path.join(self.cache_dir, f"chrome-profile-{self.slot}"))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def claim_profile(self) -> str | None:
+        """
+        以檔案鎖取得此 slot 的設定檔並返回其路徑，直到 release_profile 為止。
+        設定檔正被另一個進程使用時返回 None：呼叫端改用 chromedriver 自動建立的暫存設定檔並完整登入。
+        """
+        if self._lock_file is not None:
+            return self.profile_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.cache_dir, f"chrome-profile-{self.slot}.lock"), 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            logging.warning(f"[Session] 設定檔 chrome-profile-{self.slot} 正被另一個進程使用，本次改用暫存設定檔並完整登入。")
+            return None
+        self._lock_file = lock_file
+        return self.profile_dir
+
+    def release_profile(self):
+        """釋放 claim_profile 取得的設定檔 (瀏覽器關閉後呼叫)，未持有時不做任何事。"""
+        lock_file, self._lock_file = self._lock_file, None
+        if lock_file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError as e:
+            logging.warning(f"[Session] 釋放設定檔鎖失敗: {e}")
+        finally:
+            lock_file.close()
+
+    @contextmanager
+    def profile(self):
+        """claim_profile / release_profile 的 context manager 形式。"""
+        try:
+            yield self.claim_profile()
+        finally:
+            self.release_profile()
+
+    @property
+    def tokens_path(self) -> str:
+        return os.path.join(self.cache_dir, f"tokens-{self.slot}.json")
+
+    def load_tokens(self, session_cookie: str) -> tuple[str, str] | None:
+        """返回仍在有效期內且屬於目前 Cookie 的 (csrf_token, lsd_token)；否則返回 None。"""
+        try:
+            with open(self.tokens_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if cached.get('cookie') != _cookie_fingerprint(session_cookie):
+            return None
+        if time.time() - cached.get('saved_at', 0) > self.ttl_seconds:
+            return None
+        if not (cached.get('csrf_token') and cached.get('lsd_token')):
+            return None
+        return cached['csrf_token'], cached['lsd_token']
+
+    def save_tokens(self, session_cookie: str, csrf_token: str, lsd_token: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.tokens_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'cookie': _cookie_fingerprint(session_cookie),
+                'csrf_token': csrf_token,
+                'lsd_token': lsd_token,
+                'saved_at': time.time(),
+            }, f)
+        os.replace(tmp_path, self.tokens_path)
+
+    def invalidate(self):
+        try:
+            os.remove(self.tokens_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"[Session] 刪除權杖快取失敗: {e}")
+
+def get_session_cache(slot: str = 'default') -> SessionCache | None:
+    """
+    依環境變數建立快取：THREADS_SESSION_CACHE (預設啟用)、THREADS_SESSION_CACHE_DIR、THREADS_TOKEN_TTL_HOURS。
+    停用時返回 None。
+    """
+    if os.getenv("THREADS_SESSION_CACHE", "true").lower() not in ['true', '1', 't']:
+        return None
+    return SessionCache(
+        cache_dir=os.getenv("THREADS_SESSION_CACHE_DIR", DEFAULT_CACHE_DIR),
+        slot=slot,
+        ttl_seconds=float(os.getenv("THREADS_TOKEN_TTL_HOURS", DEFAULT_TOKEN_TTL_HOURS)) * 3600,
+    )
@@ -0,0 +1,99 @@
+# modules/upload_pipeline.py
+
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_METADATA_WORKERS = 3
+
+class MetadataPrefetcher:
+    """
+    在上傳之前預先生成影片元數據的管線。
+    generate(job) 在有界的執行緒池中執行 (例如呼叫 Gemini)，最多同時領先上傳 lookahead 部影片；
+    iter_results 依提交的順序返回 (job, metadata)，上傳由呼叫端的執行緒 (上傳通道) 逐一進行，
+    因此上傳一部影片的同時，後面幾部的元數據已在生成中。
+    lookahead 為 0 時不預先生成，等同舊版的依序處理。generate 拋出例外時該部影片的元數據為 None。
+    """
+
+    def __init__(self, generate, workers: int = DEFAULT_METADATA_WORKERS, lookahead: int | None = None):
+        self.generate = generate
+        self.workers = max(1, workers)
+        self.lookahead = self.workers * 2 if lookahead is None else max(0, lookahead)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="metadata") if self.lookahead else None
+        self._lock = threading.Lock()
+
+        self.generated = 0
+        self.failed = 0
+        self.generate_seconds = 0.0
+        # 上傳通道等待元數據的時間；越接近 0 表示生成完全被上傳時間遮蓋
+        self.wait_seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _generate(self, job):
+        started = time.perf_counter()
+        try:
+            metadata = self.generate(job)
+        except Exception as e:
+            logging.error(f"[Metadata] 生成元數據時發生未預期的錯誤: {e}")
+            metadata = None
+        with self._lock:
+            self.generate_seconds += time.perf_counter() - started
+            if metadata:
+                self.generated += 1
+            else:
+                self.failed += 1
+        return metadata
+
+    def iter_results(self, jobs):
+        """依順序產生 (job, metadata)；呼叫端中途停止迭代 (例如配額用盡) 時，尚未開始的生成會被取消。"""
+        jobs = iter(jobs)
+        if self._executor is None:
+            for job in jobs:
+                started = time.perf_counter()
+                metadata = self._generate(job)
+                self.wait_seconds += time.perf_counter() - started
+                yield job, metadata
+            return
+
+        in_flight = deque()
+
+        def fill():
+            while len(in_flight) < self.lookahead:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                in_flight.append((job, self._executor.submit(self._generate, job)))
+
+        try:
+            fill()
+            while in_flight:
+                job, future = in_flight.popleft()
+                started = time.perf_counter()
+                metadata = future.result()
+                self.wait_seconds += time.perf_counter() - started
+                # 先補滿預先生成的佇列再交出結果，上傳期間池中一直有工作
+                fill()
+                yield job, metadata
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            'generated': self.generated,
+            'failed': self.failed,
+            'workers': self.workers if self._executor else 0,
+            'generate_seconds': self.generate_seconds,
+            'wait_seconds': self.wait_seconds,
+        }
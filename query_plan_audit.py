@@ -0,0 +1,126 @@
+# query_plan_audit.py
+"""
+對 modules/database.py 與 view_db.py 中的每一條 SQL 查詢執行 EXPLAIN QUERY PLAN，
+只要有任何一條退回全表掃描就以非零狀態結束。全表掃描包括不經索引的 `SCAN <table>`，
+以及走完整個索引的 `SCAN <table> USING [COVERING] INDEX <index>`；
+後者在查詢有 LIMIT (讀到足夠的列就停止) 或索引是部分索引時不算。
+刻意讀取整張表的查詢 (例如完整匯出) 列在 WHOLE_TABLE_QUERIES 中並註明原因。
+查詢由原始碼的 execute / executemany 呼叫中擷取 (只處理字串常數)，
+view_db 依篩選條件動態組出的查詢則由 view_db.query_variants() 提供；
+init_db 與 MIGRATIONS 中的建立結構與遷移語句不屬於存取路徑，不列入檢查。
+
+用法 (於專案根目錄執行):
+    python query_plan_audit.py              # 以 init_db 建立暫存的新資料庫來檢查
+    python query_plan_audit.py --db db/threads_dlp.db
+"""
+
+import os
+import re
+import ast
+import sys
+import argparse
+import tempfile
+
+from tabulate import tabulate
+
+import view_db
+import modules.database as database
+
+AUDITED_FILES = ["modules/database.py", "view_db.py"]
+SKIPPED_FUNCTIONS = {"init_db", "_apply_migrations", "get_schema_version", "_open_connection",
+                     "_caption_search_exists", "_trigram_supported", "_ensure_caption_search"} | {migrate.__name__ for _, _, migrate in database.MIGRATIONS}
+DML_PREFIXES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+# 表掃描或完整的索引掃描；`SCAN (subquery-1)`、`SCAN CONSTANT ROW`、虛擬表 (FTS) 與結構目錄 sqlite_master 不算
+FULL_SCAN = re.compile(r"^SCAN (?!\(|sqlite_master\b|sqlite_schema\b)(\S+)(?: USING (?:COVERING )?INDEX (\S+))?$")
+LIMITED = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+# 結果本來就是整張表的查詢 (函式名稱或 view_db.query_variants() 的名稱) → 原因；
+# 有篩選條件的查詢即使結果很多也不能列在這裡，應改善索引或查詢
+WHOLE_TABLE_QUERIES = {
+    "get_all_existing_video_ids": "舊版的整表載入，只供 benchmarks/bench_membership.py 比較",
+    "get_all_liked_post_ids": "舊版的整表載入，只供 benchmarks/bench_membership.py 比較",
+    "get_dedup_stats": "統計所有內容雜湊",
+    "get_download_backlog": "清除過期項目後載入整個待辦清單",
+    "summary all": "未篩選時的總數",
+    "export all": "未篩選的完整匯出",
+}
+
+def extract_queries(path: str) -> list:
+    """返回檔案中 (函式名稱, 行號, SQL) 的列表。"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    queries = []
+    for func in ast.walk(tree):
+        if not isinstance(func, ast.FunctionDef) or func.name in SKIPPED_FUNCTIONS:
+            continue
+        for node in ast.walk(func):
+            if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in ("execute", "executemany") and node.args):
+                continue
+            sql = node.args[0]
+            if isinstance(sql, ast.Constant) and isinstance(sql.value, str):
+                statement = " ".join(sql.value.split())
+                if statement.upper().startswith(DML_PREFIXES):
+                    queries.append((func.name, node.lineno, statement))
+    return queries
+
+def partial_indexes(conn) -> set:
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return {row[1] for table in tables for row in conn.execute(f"PRAGMA index_list('{table}')") if row[4]}
+
+def full_scans(plan: list, sql: str, partial: set) -> list:
+    scans = []
+    for detail in plan:
+        match = FULL_SCAN.match(detail)
+        if not match:
+            continue
+        index = match.group(2)
+        if index and (index in partial or LIMITED.search(sql)):
+            continue
+        scans.append(detail)
+    return scans
+
+def explain(conn, sql: str) -> list:
+    # 參數一律綁定 NULL；查詢計畫只取決於語句本身與索引
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count("?"))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if any query in database.py or view_db.py falls back to a full table scan.")
+    parser.add_argument("--db", type=str, help="Audit an existing database instead of a fresh one (init_db is run on it first to create missing indexes).")
+    args = parser.parse_args()
+
+    database.DB_FILE = args.db or os.path.join(tempfile.mkdtemp(prefix="query_plan_audit_"), "threads_dlp.db")
+    database.init_db()
+    conn = database.get_db_connection()
+    partial = partial_indexes(conn)
+
+    queries = [(f"{path}:{lineno}", func_name, sql) for path in AUDITED_FILES for func_name, lineno, sql in extract_queries(path)]
+    queries += [("view_db.py", name, " ".join(sql.split())) for name, sql in view_db.query_variants()]
+
+    rows, failures = [], 0
+    for location, func_name, sql in queries:
+        try:
+            plan = explain(conn, sql)
+        except Exception as e:
+            rows.append([location, func_name, "ERROR", str(e)])
+            failures += 1
+            continue
+        scans = full_scans(plan, sql, partial)
+        if scans and func_name in WHOLE_TABLE_QUERIES:
+            status = f"whole table: {WHOLE_TABLE_QUERIES[func_name]}"
+        elif scans:
+            status = "FULL SCAN"
+            failures += 1
+        else:
+            status = "ok"
+        rows.append([location, func_name, status, "\n".join(plan)])
+
+    database.close_db_connection()
+    print(tabulate(rows, headers=["location", "function", "status", "query plan"], tablefmt="psql"))
+    if failures:
+        print(f"\n{failures} 條查詢會退回全表掃描或無法分析，請補上索引或改寫查詢。")
+        sys.exit(1)
+    print(f"\n全部 {len(rows)} 條查詢都有使用索引 (或列在 WHOLE_TABLE_QUERIES 中)。")
+
+if __name__ == "__main__":
+    main()
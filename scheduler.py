@@ -8,6 +8,10 @@ import os
 from main import run_download_task
 from uploader import run_upload_task
 from modules.database import get_all_videos_to_upload, init_db
+from modules.browser import BrowserPool
+
+# 跨排程任務共用的已登入瀏覽器池，於 main() 中建立
+browser_pool = None
 
 def setup_logging():
     """設定一個冪等的日誌記錄器，避免在匯入時重複設定。"""
@@ -30,15 +34,30 @@ def download_job():
     logging.info("=== 開始排程下載任務 ===")
     
     # 從環境變數讀取參數，如果未設定則使用預設值
-    target_user = os.getenv("THREADS_TARGET_USER", "nasa") # 範例: nasa useless
+    # 未設定時爬取首頁推薦 (範例: nasa)
+    target_user = os.getenv("THREADS_TARGET_USER") or None
     scrolls = int(os.getenv("THREADS_SCROLL_COUNT", 5))
+    pacing = os.getenv("THREADS_PACING", "fixed")
+    engine = os.getenv("THREADS_ENGINE", "browser")
+    lean = os.getenv("THREADS_LEAN", "false").lower() in ['true', '1', 't']
+    # THREADS_TARGETS (逗號分隔，例如 "nasa,zuck,search:cute cats") 啟用多目標平行爬取，優先於 THREADS_TARGET_USER
+    targets = os.getenv("THREADS_TARGETS")
     
-    logging.info(f"目標使用者: @{target_user}，滾動次數: {scrolls}。")
+    if targets:
+        logging.info(f"多目標: {targets}，滾動次數: {scrolls}，滾動節奏: {pacing}，引擎: {engine}。")
+    else:
+        logging.info(f"目標: {'@' + target_user if target_user else '首頁推薦'}，滾動次數: {scrolls}，滾動節奏: {pacing}，引擎: {engine}。")
     
     try:
         run_download_task(
+            target_username=None if targets else target_user,
+            targets=targets,
             download_threshold_override=3000,
-            scroll_count=scrolls
+            scroll_count=scrolls,
+            pacing=pacing,
+            browser_pool=browser_pool,
+            engine=engine,
+            lean=lean
         )
     except Exception as e:
         logging.error(f"下載任務執行期間發生錯誤: {e}", exc_info=True)
@@ -72,10 +91,23 @@ def main():
     """
     排程器主函式。
     """
+    global browser_pool
     setup_logging()
     logging.info("排程器已啟動，正在初始化資料庫...")
     init_db()
 
+    # --- 溫熱的瀏覽器池：避免每次下載任務都重新啟動 Chrome 並登入 ---
+    # HTTP 引擎不需要瀏覽器，因此只在瀏覽器引擎下建立
+    pool_enabled = os.getenv("BROWSER_POOL_ENABLED", "true").lower() in ['true', '1', 't']
+    if pool_enabled and os.getenv("THREADS_ENGINE", "browser") == "browser":
+        browser_pool = BrowserPool(
+            size=int(os.getenv("BROWSER_POOL_SIZE", 1)),
+            max_jobs=int(os.getenv("BROWSER_POOL_MAX_JOBS", 20)),
+            max_rss_mb=float(os.getenv("BROWSER_POOL_MAX_RSS_MB", 1500)),
+            lean=os.getenv("THREADS_LEAN", "false").lower() in ['true', '1', 't'],
+        )
+        logging.info(f"瀏覽器池已啟用 (大小: {browser_pool.size}，每個瀏覽器最多 {browser_pool.max_jobs} 個任務後回收)。")
+
     # --- 設定排程任務 ---
     # 每 6 小時執行一次下載任務
     schedule.every(20).hours.do(download_job)
@@ -1,15 +1,30 @@
 import os
 import json
+import hashlib
 import subprocess
 import time
 from datetime import datetime, timedelta, timezone
-import google.generativeai as genai
 import logging
 import sys
 import argparse
 from dotenv import load_dotenv
 
-from modules.database import init_db, get_all_videos_to_upload, update_upload_status, get_all_uploaded_videos, delete_video_record
+from modules.database import (
+    init_db, get_all_videos_to_upload, update_upload_statuses, get_all_uploaded_videos, delete_video_record, get_uploaded_duplicate,
+    get_video, get_cached_metadata, put_cached_metadata, invalidate_metadata_cache,
+)
+from modules.upload_pipeline import MetadataPrefetcher, DEFAULT_METADATA_WORKERS
+
+GEMINI_MODEL_NAME = 'gemini-flash-lite-latest'
+# 元數據快取的版本；修改 generate_metadata 的 prompt、模型或安全設定時遞增，舊的快取便不再命中
+METADATA_PROMPT_VERSION = 1
+# 設定安全設定，以避免因內容審查而被 API 阻擋
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
 
 class YouTubeQuotaExceededError(Exception):
     """自訂異常，用於表示 YouTube API 上傳配額已用盡。"""
@@ -51,12 +66,18 @@ def setup_logging():
 def get_folder_size(path='.'):
     """計算指定路徑下所有檔案的大小，並返回 GB 為單位的值。"""
     total_size = 0
+    seen_inodes = set()
     for dirpath, dirnames, filenames in os.walk(path):
         for f in filenames:
             fp = os.path.join(dirpath, f)
             # 確保不是符號連結，以避免重複計算
             if not os.path.islink(fp):
-                total_size += os.path.getsize(fp)
+                stat = os.stat(fp)
+                # 去重產生的硬連結共用同一份資料，只計算一次
+                if (stat.st_dev, stat.st_ino) in seen_inodes:
+                    continue
+                seen_inodes.add((stat.st_dev, stat.st_ino))
+                total_size += stat.st_size
     return total_size / (1024**3) # 從 Bytes 轉換為 Gigabytes
 
 def cleanup_uploaded_files(downloads_path="downloads", language='zh-TW'):
@@ -113,14 +134,33 @@ def load_config() -> dict:
     config['publish_start_from'] = int(os.getenv('PUBLISH_START_FROM_HOURS', config.get('publish_start_from', 0)))
     config['time_increment_hours'] = int(os.getenv('PUBLISH_INTERVAL_HOURS', config.get('time_increment_hours', 2)))
 
+    # 上傳管線：同時生成元數據的執行緒數、最多領先上傳幾部影片 (0 表示依序處理)、兩次上傳之間的間隔
+    config['metadata_workers'] = int(os.getenv('GEMINI_METADATA_WORKERS') or config.get('metadata_workers', DEFAULT_METADATA_WORKERS))
+    lookahead = os.getenv('GEMINI_METADATA_LOOKAHEAD') or config.get('metadata_lookahead')
+    config['metadata_lookahead'] = int(lookahead) if lookahead not in (None, '') else None
+    config['upload_interval_seconds'] = float(os.getenv('UPLOAD_INTERVAL_SECONDS') or config.get('upload_interval_seconds', 5))
+
     # 檢查關鍵設定是否存在
     if not config.get('api_key') or "GEMINI API" in config.get('api_key', ''):
         logging.warning("警告: Gemini API 金鑰未設定。請設定 GEMINI_API_KEY 環境變數或在 config.json 中填寫。")
 
     return config
 
-def generate_metadata(full_caption: str, video_filename: str, publish_time_iso: str, config: dict):
-    """使用 Gemini API 為影片生成標題、描述和標籤。"""
+def create_metadata_model(config: dict):
+    """建立 Gemini 模型 client；整次上傳任務共用同一個，不必每部影片都重新 configure。"""
+    api_key = config.get("api_key")
+    if not api_key:
+        raise ValueError("Gemini API 金鑰未設定。")
+    # 只有實際呼叫 Gemini 時才需要 SDK，離線的基準測試可以用假的 client 取代
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+def generate_metadata(full_caption: str, video_filename: str, publish_time_iso: str, config: dict, model=None):
+    """
+    使用 Gemini API 為影片生成標題、描述和標籤。
+    model 為 create_metadata_model 建立的共用 client (需具備 generate_content)；未提供時臨時建立一個。
+    """
     # 如果影片本身沒有任何文字描述，則嘗試使用影片檔名作為備用描述
     if not full_caption or not full_caption.strip():
         full_caption = os.path.splitext(video_filename)[0].replace('_', ' ').replace('-', ' ').strip()
@@ -130,22 +170,9 @@ def generate_metadata(full_caption: str, video_filename: str, publish_time_iso:
     if not full_caption or not full_caption.strip():
         full_caption = "一部有趣的影片"  # 最終的硬編碼備用方案
         logging.warning(f"生成內容的基礎描述依然為空，強制使用通用描述: '{full_caption}'")
-         
-    api_key = config.get("api_key")
-    if not api_key:
-        raise ValueError("Gemini API 金鑰未設定。")
-    genai.configure(api_key=api_key)
-    
-    # 使用較新的模型名稱
-    model = genai.GenerativeModel('gemini-flash-lite-latest')
-    
-    # 設定安全設定，以避免因內容審查而被 API 阻擋
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-    ]
+
+    if model is None:
+        model = create_metadata_model(config)
 
     prompt = f"""
     你是一位專業的 YouTube 內容策略師。
@@ -189,7 +216,7 @@ def generate_metadata(full_caption: str, video_filename: str, publish_time_iso:
 
     try:
         logging.info("正在請求 Gemini API 生成影片元數據...")
-        response = model.generate_content(prompt, safety_settings=safety_settings)
+        response = model.generate_content(prompt, safety_settings=SAFETY_SETTINGS)
         
         # 移除潛在的 Markdown 格式
         cleaned_text = response.text.strip().replace('```json', '').replace('```', '').strip()
@@ -206,6 +233,14 @@ def generate_metadata(full_caption: str, video_filename: str, publish_time_iso:
         logging.error(f"生成元數據時發生未預期的錯誤: {e}")
         return None
 
+def metadata_cache_key(full_caption: str, video_filename: str) -> str:
+    """元數據快取的鍵：prompt 版本、caption 與檔名的 SHA-256 (publishAt 每次上傳都不同，不列入)。"""
+    digest = hashlib.sha256()
+    for part in (str(METADATA_PROMPT_VERSION), full_caption or '', video_filename):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
 def upload_video(video_path: str, meta_path: str, config: dict):
     """呼叫外部的 youtubeuploader 執行檔來上傳影片。"""
     uploader_path = config.get("youtube_uploader_path")
@@ -302,53 +337,153 @@ def run_upload_task(cleanup_threshold_gb=0.8, num_videos=None, language='zh-TW')
 
     first_publish_time = datetime.now(timezone.utc) + (timedelta(minutes=5) if is_publish_now else timedelta(hours=publish_start_from))
 
-    for i, video_data in enumerate(videos_to_upload):
-        video_id = video_data['video_id']
-        video_path = video_data['local_path']
-        
-        # 檢查檔案是否存在，如果不存在則刪除紀錄並跳過
-        if not os.path.exists(video_path):
-            logging.warning(lang_strings.get('video_file_not_found_delete', "影片檔案不存在於: {path}。將從資料庫中刪除此紀錄。").format(path=video_path))
-            delete_video_record(video_id)
-            continue
-        
-        logging.info(lang_strings.get('processing_video', "--- 正在處理第 {current}/{total} 部影片: {filename} ---").format(current=i+1, total=len(videos_to_upload), filename=os.path.basename(video_path)))
-        
-        publish_time = first_publish_time + timedelta(hours=i * time_increment_hours)
-        publish_time_iso = publish_time.isoformat()
-        
-        video_filename = os.path.basename(video_path)
-        meta_filename = f"{os.path.splitext(video_filename)[0]}.json"
-        meta_path = os.path.join(os.path.dirname(video_path), meta_filename)
-        
-        metadata = generate_metadata(video_data['caption'], video_filename, publish_time_iso, config)
-        if not metadata:
-            logging.warning(lang_strings.get('metadata_gen_failed', "因元數據生成失敗，跳過影片 '{video_id}'。").format(video_id=video_id))
-            continue
-        
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=4)
-        
+    # 內容重複而跳過的影片累積後在單一交易中寫入；上傳成功的影片不能重複上傳，每部上傳後立即寫入 (連同累積的部分)。
+    # 離開迴圈 (包含中止) 時一定會寫入剩餘的部分
+    pending_statuses = []
+    uploaded_in_run = {}
+
+    def flush_statuses() -> bool:
+        if not pending_statuses:
+            return True
         try:
-            if upload_video(video_path, meta_path, config):
-                try:
-                    # 從元數據中獲取標題以存入資料庫
-                    youtube_title = metadata.get('title', '')
-                    update_upload_status(video_id, status=True, title=youtube_title)
-                except Exception as e:
-                    logging.critical(lang_strings.get('db_update_failed', "致命錯誤: 更新影片 {video_id} 的資料庫狀態失敗: {error}").format(video_id=video_id, error=e))
-                    break # 資料庫更新失敗是嚴重問題，應中止
-            else:
-                # 上傳失敗，記錄錯誤並繼續處理下一部影片
-                logging.error(lang_strings.get('upload_failed_continue', "影片 '{video_id}' 上傳失敗。將繼續處理下一部影片。").format(video_id=video_id))
+            update_upload_statuses(pending_statuses)
+        except Exception as e:
+            video_ids = ', '.join(video_id for video_id, _, _ in pending_statuses)
+            logging.critical(lang_strings.get('db_update_failed', "致命錯誤: 更新影片 {video_id} 的資料庫狀態失敗: {error}").format(video_id=video_ids, error=e))
+            return False
+        finally:
+            pending_statuses.clear()
+        return True
+
+    try:
+        # 先做不需要 Gemini 的檢查，只為真正要上傳的影片生成元數據
+        jobs = []
+        for i, video_data in enumerate(videos_to_upload):
+            video_id = video_data['video_id']
+            video_path = video_data['local_path']
+
+            # 內容相同的影片 (例如被其他帳號轉貼) 已上傳過時，不再重複上傳
+            duplicate = get_uploaded_duplicate(video_data.get('content_hash'))
+            if duplicate:
+                logging.info(lang_strings.get('upload_duplicate_skipped', "影片 '{video_id}' 與已上傳的 '{original}' 內容相同，跳過上傳。").format(video_id=video_id, original=duplicate['video_id']))
+                pending_statuses.append((video_id, True, duplicate['youtube_title'] or ''))
+                continue
+
+            # 檢查檔案是否存在，如果不存在則刪除紀錄並跳過
+            if not os.path.exists(video_path):
+                logging.warning(lang_strings.get('video_file_not_found_delete', "影片檔案不存在於: {path}。將從資料庫中刪除此紀錄。").format(path=video_path))
+                delete_video_record(video_id)
                 continue
-        except YouTubeQuotaExceededError:
-            # 捕捉到配額超限錯誤，中止整個上傳任務
-            logging.critical(lang_strings.get('youtube_quota_exceeded', "YouTube API 上傳配額已用盡。中止本次所有上傳任務。"))
-            break
-        time.sleep(5)
+
+            publish_time = first_publish_time + timedelta(hours=i * time_increment_hours)
+            video_filename = os.path.basename(video_path)
+            cache_key = metadata_cache_key(video_data['caption'], video_filename)
+            jobs.append({
+                'index': i,
+                'video_data': video_data,
+                'video_path': video_path,
+                'video_filename': video_filename,
+                'publish_time_iso': publish_time.isoformat(),
+                'cache_key': cache_key,
+                # 先前的運行已生成過 (例如上傳失敗或配額用盡) 時直接沿用，不再呼叫 Gemini
+                'cached_metadata': get_cached_metadata(cache_key),
+            })
+
+        cache_hits = sum(1 for job in jobs if job['cached_metadata'] is not None)
+        if cache_hits:
+            logging.info(lang_strings.get('metadata_cache_hits', "[Metadata] {hits}/{total} 部影片使用快取的元數據，不需呼叫 Gemini。").format(hits=cache_hits, total=len(jobs)))
+
+        # 實際交給上傳通道的快取元數據 (通道提前中止時少於 cache_hits)；list.append 在執行緒間是安全的
+        served_from_cache = []
+
+        def metadata_for(job):
+            metadata = job['cached_metadata']
+            if metadata is not None:
+                served_from_cache.append(job['index'])
+            else:
+                metadata = generate_metadata(job['video_data']['caption'], job['video_filename'], job['publish_time_iso'], config, model=model)
+                if not metadata:
+                    return None
+                put_cached_metadata(job['cache_key'], METADATA_PROMPT_VERSION, metadata)
+            # 快取的內容與發布時間無關，每次上傳都改用本次排定的時間
+            return {**metadata, 'publishAt': job['publish_time_iso']}
+
+        # 整次任務共用一個模型 client；元數據由執行緒池領先上傳通道幾部影片生成
+        model = create_metadata_model(config) if cache_hits < len(jobs) else None
+        prefetcher = MetadataPrefetcher(
+            metadata_for,
+            workers=config.get('metadata_workers', DEFAULT_METADATA_WORKERS),
+            lookahead=config.get('metadata_lookahead'),
+        )
+        with prefetcher:
+            for job, metadata in prefetcher.iter_results(jobs):
+                video_data = job['video_data']
+                video_id = video_data['video_id']
+                video_path = job['video_path']
+                video_filename = job['video_filename']
+                logging.info(lang_strings.get('processing_video', "--- 正在處理第 {current}/{total} 部影片: {filename} ---").format(current=job['index']+1, total=len(videos_to_upload), filename=video_filename))
+
+                # 本次已上傳但尚未寫入資料庫的相同內容
+                content_hash = video_data.get('content_hash')
+                duplicate = uploaded_in_run.get(content_hash)
+                if duplicate:
+                    logging.info(lang_strings.get('upload_duplicate_skipped', "影片 '{video_id}' 與已上傳的 '{original}' 內容相同，跳過上傳。").format(video_id=video_id, original=duplicate['video_id']))
+                    pending_statuses.append((video_id, True, duplicate['youtube_title'] or ''))
+                    continue
+
+                if not metadata:
+                    logging.warning(lang_strings.get('metadata_gen_failed', "因元數據生成失敗，跳過影片 '{video_id}'。").format(video_id=video_id))
+                    continue
+
+                meta_filename = f"{os.path.splitext(video_filename)[0]}.json"
+                meta_path = os.path.join(os.path.dirname(video_path), meta_filename)
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump(metadata, f, ensure_ascii=False, indent=4)
+
+                try:
+                    if upload_video(video_path, meta_path, config):
+                        # 從元數據中獲取標題以存入資料庫
+                        youtube_title = metadata.get('title', '')
+                        pending_statuses.append((video_id, True, youtube_title))
+                        if content_hash:
+                            uploaded_in_run[content_hash] = {'video_id': video_id, 'youtube_title': youtube_title}
+                        if not flush_statuses():
+                            break # 資料庫更新失敗是嚴重問題，應中止
+                    else:
+                        # 上傳失敗，記錄錯誤並繼續處理下一部影片
+                        logging.error(lang_strings.get('upload_failed_continue', "影片 '{video_id}' 上傳失敗。將繼續處理下一部影片。").format(video_id=video_id))
+                        continue
+                except YouTubeQuotaExceededError:
+                    # 捕捉到配額超限錯誤，中止整個上傳任務 (尚未開始的元數據生成會被取消)
+                    logging.critical(lang_strings.get('youtube_quota_exceeded', "YouTube API 上傳配額已用盡。中止本次所有上傳任務。"))
+                    break
+                time.sleep(config.get('upload_interval_seconds', 5))
+
+        stats = prefetcher.stats()
+        if cache_hits < len(jobs):
+            logging.info(lang_strings.get('metadata_pipeline_summary', "[Metadata] 生成 {generated} 份元數據 (失敗 {failed})，{workers} 個執行緒共耗時 {generate:.1f} 秒，上傳通道等待 {wait:.1f} 秒。").format(
+                generated=stats['generated'] - len(served_from_cache), failed=stats['failed'], workers=stats['workers'], generate=stats['generate_seconds'], wait=stats['wait_seconds']))
+    finally:
+        flush_statuses()
     logging.info(lang_strings.get('upload_task_complete', "所有上傳任務已完成。"))
 
+def invalidate_cached_metadata(video_ids: list, language='zh-TW') -> int:
+    """刪除指定影片 (未指定時為全部) 的元數據快取，返回刪除的筆數。"""
+    lang_strings = load_language_strings(language)
+    if not video_ids:
+        cache_keys = None
+    else:
+        cache_keys = []
+        for video_id in video_ids:
+            video_data = get_video(video_id)
+            if not video_data or not video_data.get('local_path'):
+                logging.warning(lang_strings.get('metadata_cache_video_not_found', "資料庫中找不到影片 '{video_id}' (或沒有本地路徑)，無法刪除它的元數據快取。").format(video_id=video_id))
+                continue
+            cache_keys.append(metadata_cache_key(video_data['caption'], os.path.basename(video_data['local_path'])))
+    deleted = invalidate_metadata_cache(cache_keys)
+    logging.info(lang_strings.get('metadata_cache_invalidated', "[Metadata] 已刪除 {count} 筆元數據快取。").format(count=deleted))
+    return deleted
+
 def main():
     """CLI 進入點，解析參數並執行上傳任務。"""
     setup_logging()
@@ -366,6 +501,13 @@ def main():
         default=None,
         help='指定本次上傳影片的數量上限。預設為無限制。'
     )
+    parser.add_argument(
+        '--invalidate-metadata-cache',
+        nargs='*',
+        metavar='VIDEO_ID',
+        default=None,
+        help='刪除快取的元數據後結束，下次上傳時重新呼叫 Gemini 生成。指定 VIDEO_ID 時只刪除這些影片的快取，未指定時清空全部。'
+    )
     parser.add_argument(
         '-l', '--language',
         type=str,
@@ -376,6 +518,9 @@ def main():
     args = parser.parse_args()
 
     init_db()
+    if args.invalidate_metadata_cache is not None:
+        invalidate_cached_metadata(args.invalidate_metadata_cache, language=args.language)
+        return
     run_upload_task(
         cleanup_threshold_gb=args.deleteupload, 
         num_videos=args.num_videos,
@@ -2,90 +2,320 @@
 
 import sqlite3
 import os
+import sys
+import csv
+import json
+import argparse
+from datetime import datetime
 from tabulate import tabulate
 
+from modules.database import get_dedup_stats
+
 DB_FILE = "db/threads_dlp.db"
+# trigram 分詞器無法為少於三個字元的詞建立索引
+MIN_INDEXED_TERM_LENGTH = 3
+# 表格模式每頁的預設筆數；匯出模式預設輸出全部
+DEFAULT_PAGE_SIZE = 50
+# 串流時每次從游標取出的列數，記憶體用量只與這個數字有關
+FETCH_SIZE = 500
+# --min-likes 的條件 (build_listing_query 依此決定排序方式)
+MIN_LIKES_CONDITION = "videos.like_count >= ?"
+
+# 表格模式的欄位：截斷 caption、格式化布林值與時間戳都在 SQL 中完成
+TABLE_COLUMNS = """
+    videos.post_id,
+    videos.author,
+    CASE WHEN length(videos.caption) > 30 THEN substr(videos.caption, 1, 27) || '...' ELSE videos.caption END AS caption,
+    videos.like_count,
+    substr(videos.timestamp, 1, 19) AS timestamp,
+    CASE WHEN videos.uploaded_to_youtube THEN '是' ELSE '否' END AS uploaded_to_youtube,
+    substr(videos.upload_timestamp, 1, 19) AS upload_timestamp,
+    videos.local_path
+"""
+EXPORT_COLUMNS = """
+    videos.video_id, videos.post_id, videos.post_url, videos.author, videos.caption, videos.like_count,
+    videos.comment_count, videos.timestamp, videos.uploaded_to_youtube, videos.upload_timestamp,
+    videos.youtube_title, videos.local_path, videos.content_hash
+"""
+
+def build_filters(author: str | None = None, since: str | None = None, uploaded: bool | None = None,
+                  min_likes: int | None = None) -> tuple[list[str], list]:
+    """把命令列的篩選條件轉成 SQL 條件與參數；每個條件都能使用 init_db 建立的索引。"""
+    conditions, params = [], []
+    if author:
+        conditions.append("videos.author = ?")
+        params.append(author)
+    if since:
+        conditions.append("videos.timestamp >= ?")
+        params.append(since)
+    if uploaded is not None:
+        # 與索引 idx_videos_upload_state 的運算式相同，才能以等值條件搜尋 (尚未上傳包含 NULL)
+        conditions.append("COALESCE(videos.uploaded_to_youtube, 0) = ?")
+        params.append(1 if uploaded else 0)
+    if min_likes is not None:
+        conditions.append(MIN_LIKES_CONDITION)
+        params.append(min_likes)
+    return conditions, params
+
+def _where(conditions: list[str]) -> str:
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+def build_listing_query(columns: str, filters: tuple[list[str], list], after: tuple[str, int] | None = None,
+                        limit: int | None = None) -> tuple[str, list]:
+    """
+    依時間由新到舊列出影片的查詢，以 (timestamp, rowid) 作為鍵集分頁 (keyset pagination) 的游標：
+    --after 從上一頁最後一列之後繼續，不論翻到第幾頁都只走索引的一段範圍，不需要 OFFSET。
+    前兩個欄位 _cursor_ts / _cursor_rowid 供產生下一頁的游標，輸出時會移除。
+    沒有 LIMIT 的 --min-likes 匯出改以 idx_videos_like_count 搜尋符合的列再排序：沿時間索引逐列過濾會走完整個索引；
+    有 LIMIT 時沿時間索引找到足夠的列就會停止，維持原本的順序。
+    """
+    conditions, params = list(filters[0]), list(filters[1])
+    # 一元 + 讓 ORDER BY 無法使用 idx_videos_timestamp，規劃器改用讚數索引的範圍搜尋
+    order_column = "+videos.timestamp" if not limit and MIN_LIKES_CONDITION in conditions else "videos.timestamp"
+    if after:
+        conditions.append("(videos.timestamp, videos.rowid) < (?, ?)")
+        params.extend(after)
+    sql = f"""
+    SELECT videos.timestamp AS _cursor_ts, videos.rowid AS _cursor_rowid, {columns}
+    FROM videos
+    {_where(conditions)}
+    ORDER BY {order_column} DESC, videos.rowid DESC
+    """
+    if limit:
+        sql += "LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def build_summary_query(filters: tuple[list[str], list]) -> tuple[str, list]:
+    """符合篩選條件的彙總資訊，完全在 SQL 中計算。"""
+    conditions, params = filters
+    sql = f"""
+    SELECT
+        COUNT(*) AS total_videos,
+        COUNT(CASE WHEN uploaded_to_youtube = 1 THEN 1 END) AS uploaded_count,
+        MAX(upload_timestamp) AS last_upload_timestamp
+    FROM videos
+    {_where(conditions)}
+    """
+    return sql, list(params)
+
+def query_variants() -> list[tuple[str, str]]:
+    """各種篩選組合產生的查詢，供 query_plan_audit.py 檢查查詢計畫 (動態組出的 SQL 無法從原始碼擷取)。"""
+    variants = {
+        'all': build_filters(),
+        'author': build_filters(author='x'),
+        'since': build_filters(since='x'),
+        'uploaded': build_filters(uploaded=True),
+        'pending': build_filters(uploaded=False),
+        'min_likes': build_filters(min_likes=0),
+        'author+since+pending': build_filters(author='x', since='x', uploaded=False),
+    }
+    queries = []
+    for name, filters in variants.items():
+        queries.append((f"list {name}", build_listing_query(TABLE_COLUMNS, filters, limit=1)[0]))
+        queries.append((f"list {name} --after", build_listing_query(EXPORT_COLUMNS, filters, after=('x', 0), limit=1)[0]))
+        queries.append((f"export {name}", build_listing_query(EXPORT_COLUMNS, filters)[0]))
+        queries.append((f"summary {name}", build_summary_query(filters)[0]))
+    return queries
+
+def parse_cursor(value: str) -> tuple[str, int]:
+    """解析 --after 的游標 ("<timestamp>|<rowid>"，由上一頁的輸出提供)。"""
+    timestamp, _, rowid = value.rpartition('|')
+    if not timestamp or not rowid.isdigit():
+        raise argparse.ArgumentTypeError(f"無效的游標: {value} (格式為 \"<timestamp>|<rowid>\")")
+    return timestamp, int(rowid)
+
+def parse_since(value: str) -> str:
+    """把 --since 的日期 (YYYY-MM-DD 或 ISO 格式) 轉成資料庫中時間戳的字串格式，以便直接比較。"""
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的日期: {value} (例如 2024-01-31 或 2024-01-31T08:00)")
+
+def _stream(cursor, sql: str, params: list):
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
 
-def view_database():
-    """連接到 SQLite 資料庫，顯示摘要資訊，並以表格形式印出 `videos` 表的內容。"""
+def _strip_cursor(row: sqlite3.Row) -> dict:
+    data = dict(row)
+    del data['_cursor_ts'], data['_cursor_rowid']
+    return data
+
+def export_rows(cursor, filters, fmt: str, after=None, limit=None, out=sys.stdout) -> int:
+    """以 CSV 或 JSONL 串流輸出符合條件的影片 (完整欄位，不截斷)，返回輸出的筆數。"""
+    sql, params = build_listing_query(EXPORT_COLUMNS, filters, after, limit)
+    writer = None
+    count = 0
+    for row in _stream(cursor, sql, params):
+        data = _strip_cursor(row)
+        if fmt == 'csv':
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(data))
+                writer.writeheader()
+            writer.writerow(data)
+        else:
+            out.write(json.dumps(data, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+def view_database(filters=None, after=None, limit: int | None = None, fmt: str = 'table'):
+    """
+    連接到 SQLite 資料庫，依篩選條件以表格逐頁印出 `videos` 表的內容與摘要資訊，
+    或以 CSV / JSONL 串流匯出 (此時提示訊息寫到 stderr，stdout 只有資料)。
+    """
+    out = sys.stdout if fmt == 'table' else sys.stderr
     if not os.path.exists(DB_FILE):
-        print(f"錯誤：資料庫檔案 '{DB_FILE}' 不存在。請先至少成功運行一次主程式。")
+        print(f"錯誤：資料庫檔案 '{DB_FILE}' 不存在。請先至少成功運行一次主程式。", file=out)
         return
 
-    print(f"正在讀取資料庫: {DB_FILE}")
+    filters = filters or build_filters()
+    print(f"正在讀取資料庫: {DB_FILE}", file=out)
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
     try:
-        # 1. 執行彙總查詢
-        cursor.execute("""
-        SELECT 
-            COUNT(*) as total_videos,
-            COUNT(CASE WHEN uploaded_to_youtube = 1 THEN 1 END) as uploaded_count,
-            MAX(upload_timestamp) as last_upload_timestamp
-        FROM videos
-        """)
+        if fmt != 'table':
+            count = export_rows(cursor, filters, fmt, after, limit)
+            print(f"已匯出 {count} 筆紀錄。", file=out)
+            return
+
+        # 1. 只取出一頁 (最多 page_size 列)
+        page_size = limit or DEFAULT_PAGE_SIZE
+        sql, params = build_listing_query(TABLE_COLUMNS, filters, after, page_size)
+        rows = list(_stream(cursor, sql, params))
+
+        if not rows:
+            print("資料庫中目前沒有任何符合條件的紀錄。")
+        else:
+            print("\n--- Threads 影片下載紀錄 ---")
+            print(tabulate([_strip_cursor(row) for row in rows], headers="keys", tablefmt="psql"))
+            if len(rows) == page_size:
+                last = rows[-1]
+                print(f"下一頁: --after \"{last['_cursor_ts']}|{last['_cursor_rowid']}\"")
+
+        # 2. 印出摘要資訊 (與列表使用相同的篩選條件)
+        sql, params = build_summary_query(filters)
+        cursor.execute(sql, params)
         summary = cursor.fetchone()
+        print("\n--- 摘要資訊 ---")
+        if summary:
+            last_upload = summary['last_upload_timestamp']
+            print(f"總影片數: {summary['total_videos']}")
+            print(f"已上傳至 YouTube: {summary['uploaded_count']}")
+            print(f"最後上傳日期: {last_upload[:19] if last_upload else 'N/A'}")
+
+        # 3. 內容去重統計 (同一內容的其他影片以硬連結或引用保存)
+        dedup = get_dedup_stats(conn)
+        print(f"重複內容: {dedup['duplicates']} 個影片，節省 {dedup['bytes_saved'] / 1024**2:.1f} MB")
 
-        # 2. 執行詳細資料查詢
-        cursor.execute("""
-        SELECT 
-            post_id, 
-            author, 
-            caption, 
-            like_count, 
-            timestamp, 
-            uploaded_to_youtube,
-            upload_timestamp,
-            local_path
-        FROM videos 
-        ORDER BY timestamp DESC
-        """)
-        rows = cursor.fetchall()
+    except BrokenPipeError:
+        # 匯出時下游 (例如 head) 提早結束；把 stdout 導向 devnull，避免結束時再次寫入失敗
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    except sqlite3.OperationalError as e:
+        print(f"查詢資料庫時發生錯誤: {e}", file=out)
+        print("提示：這可能是因為資料庫結構已更新。請嘗試重新運行主程式以自動更新資料庫結構。", file=out)
+    except Exception as e:
+        print(f"處理資料庫時發生未預期的錯誤: {e}", file=out)
+    finally:
+        conn.close()
+
+def _fts_query(terms: list[str]) -> str:
+    """每個詞以雙引號包住當作字面字串 (避免 FTS5 語法字元)，多個詞之間為 AND。"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def _search_fts(cursor, terms: list[str], limit: int) -> list:
+    cursor.execute("""
+    SELECT
+        v.post_id,
+        v.author,
+        snippet(videos_fts, -1, '[', ']', '…', 12) AS snippet,
+        v.like_count,
+        v.timestamp,
+        round(bm25(videos_fts), 2) AS score
+    FROM videos_fts
+    JOIN videos v ON v.id = videos_fts.rowid
+    WHERE videos_fts MATCH ?
+    ORDER BY rank
+    LIMIT ?
+    """, (_fts_query(terms), limit))
+    return cursor.fetchall()
+
+def _search_like(cursor, terms: list[str], limit: int) -> list:
+    # 沒有全文索引或搜尋詞太短時的退路：逐列比對，依時間排序
+    conditions = ' AND '.join(["(caption LIKE '%' || ? || '%' OR author LIKE '%' || ? || '%')"] * len(terms))
+    params = [term for term in terms for _ in range(2)]
+    cursor.execute(f"""
+    SELECT post_id, author, caption AS snippet, like_count, timestamp, NULL AS score
+    FROM videos
+    WHERE {conditions}
+    ORDER BY timestamp DESC
+    LIMIT ?
+    """, (*params, limit))
+    return cursor.fetchall()
+
+def search_database(query: str, limit: int = 20):
+    """以 `videos_fts` 全文索引搜尋 caption 與作者，依相關度 (bm25) 印出命中的影片與摘要片段。"""
+    if not os.path.exists(DB_FILE):
+        print(f"錯誤：資料庫檔案 '{DB_FILE}' 不存在。請先至少成功運行一次主程式。")
+        return
+
+    terms = query.split()
+    if not terms:
+        print("錯誤：搜尋字串不可為空白。")
+        return
+
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'videos_fts'")
+        has_fts = cursor.fetchone() is not None
+        if has_fts and all(len(term) >= MIN_INDEXED_TERM_LENGTH for term in terms):
+            rows = _search_fts(cursor, terms, limit)
+        else:
+            if has_fts:
+                print(f"提示：少於 {MIN_INDEXED_TERM_LENGTH} 個字元的搜尋詞無法使用全文索引，改用逐列比對。")
+            rows = _search_like(cursor, terms, limit)
 
         if not rows:
-            print("資料庫中目前沒有任何紀錄。")
+            print(f"找不到符合「{query}」的影片。")
             return
 
-        # 將 sqlite3.Row 物件轉換為字典列表，以便 tabulate 處理
         data_to_tabulate = [dict(row) for row in rows]
-        
-        # 為了更好的顯示效果，對欄位進行格式化
         for row in data_to_tabulate:
-            # 截斷 caption
-            if row.get('caption') and len(row['caption']) > 30:
-                row['caption'] = row['caption'][:27] + "..."
-            # 格式化布林值
-            row['uploaded_to_youtube'] = '是' if row['uploaded_to_youtube'] else '否'
-            # 格式化時間戳
+            row['snippet'] = ' '.join(str(row['snippet'] or '').split())[:80]
             if row['timestamp']:
-                row['timestamp'] = row['timestamp'][:19] # YYYY-MM-DD HH:MM:SS
-            if row['upload_timestamp']:
-                row['upload_timestamp'] = row['upload_timestamp'][:19]
-
+                row['timestamp'] = row['timestamp'][:19]
 
-        print("\n--- Threads 影片下載紀錄 ---")
+        print(f"\n--- 搜尋「{query}」的結果 (前 {limit} 筆) ---")
         print(tabulate(data_to_tabulate, headers="keys", tablefmt="psql"))
-        
-        # 3. 印出摘要資訊
-        print("\n--- 摘要資訊 ---")
-        if summary:
-            total_videos = summary['total_videos']
-            uploaded_count = summary['uploaded_count']
-            last_upload = summary['last_upload_timestamp']
-            
-            print(f"總影片數: {total_videos}")
-            print(f"已上傳至 YouTube: {uploaded_count}")
-            print(f"最後上傳日期: {last_upload[:19] if last_upload else 'N/A'}")
-
     except sqlite3.OperationalError as e:
         print(f"查詢資料庫時發生錯誤: {e}")
         print("提示：這可能是因為資料庫結構已更新。請嘗試重新運行主程式以自動更新資料庫結構。")
-    except Exception as e:
-        print(f"處理資料庫時發生未預期的錯誤: {e}")
     finally:
         conn.close()
 
 if __name__ == "__main__":
-    view_database()
+    parser = argparse.ArgumentParser(description="檢視 threads-dlp 的資料庫內容。")
+    parser.add_argument("--search", type=str, help="以全文索引搜尋 caption 與作者，依相關度排序。")
+    parser.add_argument("--limit", type=int, help=f"最多顯示的筆數 (表格預設 {DEFAULT_PAGE_SIZE}、--search 預設 20、匯出預設全部)。")
+    parser.add_argument("--after", type=parse_cursor, help="從上一頁輸出的游標之後繼續 (鍵集分頁)。")
+    parser.add_argument("--author", type=str, help="只顯示此作者的影片。")
+    parser.add_argument("--since", type=parse_since, help="只顯示此時間 (含) 之後的貼文，例如 2024-01-31。")
+    upload_state = parser.add_mutually_exclusive_group()
+    upload_state.add_argument("--uploaded", dest="uploaded", action="store_true", default=None, help="只顯示已上傳的影片。")
+    upload_state.add_argument("--pending", dest="uploaded", action="store_false", help="只顯示尚未上傳的影片。")
+    parser.add_argument("--min-likes", type=int, help="只顯示讚數不少於此值的影片。")
+    parser.add_argument("--format", choices=["table", "csv", "jsonl"], default="table", help="輸出格式；csv / jsonl 會串流輸出到 stdout。")
+    args = parser.parse_args()
+
+    if args.search is not None:
+        search_database(args.search, args.limit or 20)
+    else:
+        filters = build_filters(author=args.author, since=args.since, uploaded=args.uploaded, min_likes=args.min_likes)
+        view_database(filters, after=args.after, limit=args.limit, fmt=args.format)